@@ -1,11 +1,9 @@
-import os
 import streamlit as st
-import pandas as pd
-from openai import OpenAI
-from retriever import ReviewRetriever
-from sentiment import SentimentAgent
-from summary import SummaryAgent
-from evaluation import evaluate_answer_cosine
+from openai import OpenAIError
+from eval_store import SheetSync
+from resources import get_retriever, get_sentiment_agent, get_summary_agent, get_eval_queue, get_answer_cache
+from resources import start_metrics_endpoint, invalidate_resources
+from pipeline import ReviewPipeline
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 
@@ -15,10 +13,84 @@ if not api_key:
     st.error("OpenAI API key not found in secrets.")
     st.stop()
 
-# Initialize agents
-retriever = ReviewRetriever(api_key=api_key)
-sentiment_agent = SentimentAgent(api_key=api_key)
-summary_agent = SummaryAgent(api_key=api_key)
+# Rebuild the shared agents after the data files were replaced, e.g. by embedders.py reindex
+if st.sidebar.button("Reload data", help="Reload the review index and agents for every session"):
+    invalidate_resources()
+
+# Initialize agents (built once per process and shared across reruns and sessions)
+retriever = get_retriever(api_key)
+sentiment_agent = get_sentiment_agent(api_key)
+summary_agent = get_summary_agent(api_key)
+eval_queue = get_eval_queue(api_key)
+
+answer_cache = get_answer_cache(retriever.index.d)
+start_metrics_endpoint()
+
+use_answer_cache = st.sidebar.checkbox("Reuse answers to similar questions", value=True)
+# Off: the answer streams while sentiment is labelled in parallel. On: labels first, for quality comparisons
+serial_pipeline = st.sidebar.checkbox("Label sentiment before answering (serial)", value=False)
+pipeline = ReviewPipeline(retriever, sentiment_agent, summary_agent, serial=serial_pipeline)
+queue_metrics = eval_queue.metrics()
+cache_metrics = answer_cache.stats()
+st.sidebar.caption(f"Evaluation queue: {queue_metrics['depth']} pending, lag {queue_metrics['lag_seconds']:.0f}s")
+st.sidebar.caption(f"Answer cache: {cache_metrics['entries']} answers, {cache_metrics['hit_rate']:.0%} hit rate")
+
+
+def answer_question(user_query, selected_product=None):
+    """Retrieve reviews, label sentiment and show the answer; returns (reviews with sentiment, answer).
+
+    Near-duplicate questions about the same product are answered from the semantic cache.
+    Returns an empty DataFrame and None when no reviews match.
+    """
+    try:
+        query_embedding = retriever.embed_query(user_query)
+    except OpenAIError:
+        # Embeddings unavailable: fall back to lexical (BM25) retrieval, which needs no API call
+        query_embedding = None
+        st.caption("Embedding service unavailable, using keyword search.")
+
+    # Read before retrieval, so an answer is never stored under a newer generation than its reviews
+    generation = retriever.segment_rows
+    cached = None
+    if use_answer_cache and query_embedding is not None:
+        cached = answer_cache.lookup(query_embedding, selected_product, generation=generation)
+    if cached is not None:
+        st.subheader("AI-Generated Answer")
+        st.write(cached["answer"])
+        st.caption(f"Reused the answer to a similar question (similarity {cached['similarity']:.2f})")
+        return cached["reviews"], cached["answer"]
+
+    with st.spinner("Retrieving reviews..." if not serial_pipeline else "Retrieving and analyzing reviews..."):
+        run = pipeline.start(user_query, selected_product=selected_product, query_embedding=query_embedding,
+                             mode="hybrid" if query_embedding is not None else "lexical")
+
+    if run.reviews.empty:
+        return run.reviews, None
+
+    # Stream the answer so the first tokens show up while the rest (and the sentiment labels) are generated
+    st.subheader("AI-Generated Answer")
+    generated_answer = st.write_stream(run.stream_answer())
+    with st.spinner("Labelling review sentiment..."):
+        top_reviews_with_sentiment = run.reviews_with_sentiment()
+    timings = run.finish()
+    # An empty stream, or one without usage, leaves the token timings unset
+    parts = []
+    if timings["time_to_first_token"] is not None:
+        parts.append(f"First token in {timings['time_to_first_token']:.2f}s")
+    if timings["tokens_per_second"] is not None:
+        parts.append(f"{timings['tokens_per_second']:.0f} tokens/s")
+    parts.append(f"done in {timings['total']:.2f}s ({timings['serial_estimate']:.2f}s if run serially)")
+    st.caption(", ".join(parts))
+
+    if query_embedding is not None:
+        answer_cache.store(query_embedding, selected_product, generated_answer, top_reviews_with_sentiment,
+                           generation=generation)
+
+    # Scored by the background workers so the answer is not held up by evaluation
+    eval_queue.enqueue(user_query, top_reviews_with_sentiment, generated_answer)
+
+    return top_reviews_with_sentiment, generated_answer
+
 
 st.title("Shampoo Review-Based Q&A AI 🔍")
 st.write("Ask about a specific shampoo or find the best shampoo for a concern like volume, dandruff, or dry hair.")
@@ -26,102 +98,59 @@ st.write("Ask about a specific shampoo or find the best shampoo for a concern li
 query_type = st.radio("What would you like to do?", ["Ask about a specific shampoo", "Find the best shampoo for a concern"])
 
 if query_type == "Ask about a specific shampoo":
-    shampoo_list = retriever.get_product_list()
-    selected_shampoo = st.selectbox("Select a shampoo product:", shampoo_list)
+    product_prefix = st.text_input("Filter shampoos by name (optional):")
+    shampoo_list = retriever.catalog.search(product_prefix) if product_prefix else retriever.get_product_list()
+    if not shampoo_list:
+        st.warning(f"No shampoos start with '{product_prefix}'.")
+        st.stop()
+    selected_shampoo = st.selectbox("Select a shampoo product:", shampoo_list,
+                                    format_func=lambda product: f"{product} ({retriever.catalog.count(product)} reviews)")
     user_query = st.text_input(f"Ask a question about '{selected_shampoo}':")
 
     if user_query:
-        with st.spinner("Retrieving reviews..."):
-            top_reviews = retriever.get_top_k_reviews(user_query, selected_product=selected_shampoo)
+        top_reviews_with_sentiment, generated_answer = answer_question(user_query, selected_product=selected_shampoo)
 
-        if top_reviews.empty:
+        if top_reviews_with_sentiment.empty:
             st.warning(f"No relevant reviews found for {selected_shampoo}.")
         else:
-            with st.spinner("Analyzing review sentiment..."):
-                top_reviews_with_sentiment = sentiment_agent.analyze_reviews(top_reviews)
-
-            with st.spinner("Generating AI-powered response..."):
-                generated_answer = summary_agent.generate_summary(user_query, top_reviews_with_sentiment)
-
-            st.subheader("AI-Generated Answer")
-            st.write(generated_answer)
-
             st.subheader(f"Top Relevant Reviews for {selected_shampoo} with Sentiment")
             for index, row in top_reviews_with_sentiment.iterrows():
                 with st.expander(f"Review {index + 1} - {row['product_title']} (Score: {row['similarity_score']:.2f})"):
                     st.write(f"**Sentiment:** {row['sentiment']}")
                     st.write(f"**Review:** {row['combined_context']}")
 
-            evaluate_answer_cosine(
-                api_key=api_key,
-                user_query=user_query,
-                retrieved_reviews=top_reviews_with_sentiment,
-                generated_answer=generated_answer,
-                export_csv_path="evaluation_logs.csv"
-            )
-
 else:
     user_query = st.text_input("Example: What shampoo is best for (e.g., volume, dandruff, dry hair)?")
 
     if user_query:
-        with st.spinner("Retrieving reviews..."):
-            top_reviews = retriever.get_top_k_reviews(user_query)
+        top_reviews_with_sentiment, generated_answer = answer_question(user_query)
 
-        if top_reviews.empty:
+        if top_reviews_with_sentiment.empty:
             st.warning("No relevant reviews found.")
         else:
-            with st.spinner("Analyzing review sentiment..."):
-                top_reviews_with_sentiment = sentiment_agent.analyze_reviews(top_reviews)
-
-            with st.spinner("Generating AI-powered response..."):
-                generated_answer = summary_agent.generate_summary(user_query, top_reviews_with_sentiment)
-
-            st.subheader("AI-Generated Answer")
-            st.write(generated_answer)
-
             st.subheader("Top Relevant Reviews with Sentiment")
             for index, row in top_reviews_with_sentiment.iterrows():
                 with st.expander(f"Review {index + 1} - {row['product_title']} (Score: {row['similarity_score']:.2f})"):
                     st.write(f"**Sentiment:** {row['sentiment']}")
                     st.write(f"**Review:** {row['combined_context']}")
 
-            evaluate_answer_cosine(
-                api_key=api_key,
-                user_query=user_query,
-                retrieved_reviews=top_reviews_with_sentiment,
-                generated_answer=generated_answer,
-                export_csv_path="evaluation_logs.csv"
-            )
 
-def overwrite_google_sheet(sheet_id, sheet_range, data):
-    creds = service_account.Credentials.from_service_account_info(st.secrets["google_sheets"])
-    service = build("sheets", "v4", credentials=creds)
-    sheet = service.spreadsheets()
+SHEET_ID = "1YIK6FL1mrSKwnrKK4V1SdipdBJHK-DUh_UvilK9HONo"
 
-    body = {
-        "values": data
-    }
 
-    result = sheet.values().update(
-        spreadsheetId=sheet_id,
-        range=sheet_range,
-        valueInputOption="RAW",
-        body=body
-    ).execute()
+@st.cache_resource
+def start_sheet_sync(sheet_id, credentials_info):
+    """Push new evaluation results to the Google Sheet every minute, off the request path (once per process)."""
+    def make_service():
+        creds = service_account.Credentials.from_service_account_info(credentials_info)
+        return build("sheets", "v4", credentials=creds)
 
-    return result
+    return SheetSync(make_service, sheet_id).start()
 
 
-if os.path.exists("evaluation_logs.csv"):
-    try:
-        df = pd.read_csv("evaluation_logs.csv")
-        values = [df.columns.tolist()] + df.values.tolist()
-
-        SHEET_ID = "1YIK6FL1mrSKwnrKK4V1SdipdBJHK-DUh_UvilK9HONo"
-        SHEET_RANGE = "Sheet1!A1"  # Overwrite from top
-
-        overwrite_google_sheet(SHEET_ID, SHEET_RANGE, values)
-        st.success("✅ Evaluation results uploaded to Google Sheet!")
-        st.markdown(f"[🔗 Open Sheet](https://docs.google.com/spreadsheets/d/{SHEET_ID})")
-    except Exception as e:
-        st.error(f"❌ Failed to write to Google Sheet: {e}")
+sheet_sync = start_sheet_sync(SHEET_ID, dict(st.secrets["google_sheets"]))
+if sheet_sync.last_error:
+    st.sidebar.error(f"❌ Failed to write to Google Sheet: {sheet_sync.last_error}")
+else:
+    st.sidebar.caption(f"{sheet_sync.sent} evaluation results uploaded to the "
+                       f"[Google Sheet](https://docs.google.com/spreadsheets/d/{SHEET_ID}) since startup")
@@ -0,0 +1,98 @@
+"""Semantic cache of final answers keyed on the query embedding and the product filter.
+
+Near-duplicate questions ("good shampoo for dandruff?" / "best dandruff shampoo") land close
+together in embedding space, so a small FAISS index over past queries finds a stored answer
+without re-running sentiment analysis and summary generation.
+
+Entries also record the data generation they were built from (ReviewRetriever.segment_rows,
+which grows as ingested reviews are picked up), so new reviews invalidate older answers.
+"""
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import faiss
+from tracing import span
+
+
+class SemanticAnswerCache:
+    def __init__(self, dim=1536, threshold=0.95, ttl=24 * 3600, max_entries=1000, candidates=10):
+        """threshold is the minimum cosine similarity for a hit; ttl is in seconds."""
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.candidates = candidates
+
+        self.index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+        self.entries = OrderedDict()
+        self.next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, entry_ids):
+        for entry_id in entry_ids:
+            self.entries.pop(entry_id, None)
+        if entry_ids:
+            self.index.remove_ids(np.asarray(entry_ids, dtype="int64"))
+
+    def _evict(self):
+        """Drop expired entries, then the least recently used ones beyond max_entries."""
+        now = time.time()
+        expired = [entry_id for entry_id, entry in self.entries.items() if now - entry["created_at"] > self.ttl]
+        self._remove(expired)
+
+        overflow = len(self.entries) - self.max_entries
+        if overflow > 0:
+            self._remove(list(self.entries)[:overflow])
+
+    def lookup(self, query_embedding, product=None, generation=None):
+        """Return the cached entry (answer, reviews, similarity) for a similar query on the same product, or None.
+
+        Entries stored under a different generation are dropped instead of returned.
+        """
+        query = np.asarray(query_embedding, dtype="float32").reshape(1, -1)
+        with self._lock, span("answer_cache.lookup") as lookup_span:
+            lookup_span.set("hit", False)
+            self._evict()
+            stale = [entry_id for entry_id, entry in self.entries.items() if entry["generation"] != generation]
+            self._remove(stale)
+            if self.index.ntotal:
+                scores, labels = self.index.search(query, min(self.candidates, self.index.ntotal))
+                for score, entry_id in zip(scores[0], labels[0]):
+                    if score < self.threshold:
+                        break
+                    entry = self.entries.get(int(entry_id))
+                    if entry is not None and entry["product"] == product:
+                        self.entries.move_to_end(int(entry_id))
+                        self.hits += 1
+                        lookup_span.set("hit", True)
+                        return {**entry, "similarity": float(score)}
+
+            self.misses += 1
+            return None
+
+    def store(self, query_embedding, product, answer, reviews, generation=None):
+        """Remember the answer and the reviews (and data generation) it was built from."""
+        query = np.asarray(query_embedding, dtype="float32").reshape(1, -1)
+        with self._lock:
+            entry_id = self.next_id
+            self.next_id += 1
+            self.entries[entry_id] = {"product": product, "answer": answer, "reviews": reviews,
+                                      "generation": generation, "created_at": time.time()}
+            self.index.add_with_ids(query, np.asarray([entry_id], dtype="int64"))
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._remove(list(self.entries))
+
+    def stats(self):
+        """Return hit/miss counters, hit rate and the number of stored answers."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+        }
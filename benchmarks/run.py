@@ -0,0 +1,321 @@
+"""Offline benchmark suites for the retrieval and agent paths.
+
+Every run uses a synthetic corpus (benchmarks/synthetic.py) and the local fake OpenAI server
+(fake_openai.py) with a configurable response latency, so nothing touches the network or
+Google Drive. Results are written to benchmarks/results/<commit>-<rows>.json so later commits
+can be compared against earlier ones.
+
+Usage:
+    python benchmarks/synthetic.py --rows 10000
+    python benchmarks/run.py run --rows 10000 --latency 0.05
+    python benchmarks/run.py compare                    # latest two result files per corpus size
+    python benchmarks/run.py compare old.json new.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic import CONCERNS, dataset_dir
+
+QUERIES = [
+    "best shampoo for dandruff", "does it dry out my hair", "good for fine hair volume",
+    "ketoconazole shampoo that works", "safe for color treated hair", "does it leave residue",
+    "is it worth the price", "does it lather well", "helps an itchy scalp", "sulfate-free recommendation",
+]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def measure(fn, repeat):
+    """Call fn(i) repeat times and summarize the wall times in milliseconds."""
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        times.append((time.perf_counter() - start) * 1000)
+    return {"n": repeat, "min_ms": min(times), "median_ms": float(np.median(times)),
+            "p95_ms": float(np.percentile(times, 95))}
+
+
+def embedder_suite(embedder, texts, repeat, k=5):
+    """Time an embedder and score it on the synthetic corpus.
+
+    Every synthetic review contains one of CONCERNS and the first len(CONCERNS) QUERIES ask about
+    them in order, so precision@k over the distinct review texts is a real relevance measure. With
+    the fake OpenAI server the OpenAI embedder is random, so only its latency is meaningful.
+    """
+    import faiss
+
+    distinct = list(dict.fromkeys(texts))
+    start = time.perf_counter()
+    vectors = embedder.embed(distinct, use_cache=False)
+    throughput = len(distinct) / (time.perf_counter() - start)
+
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    queries = QUERIES[:len(CONCERNS)]
+    _, found = index.search(embedder.embed(queries, use_cache=False), k)
+    precision = np.mean([
+        np.mean([concern in distinct[row] for row in rows]) for concern, rows in zip(CONCERNS, found)
+    ])
+
+    result = measure(lambda i: embedder.embed([f"{QUERIES[i % len(QUERIES)]} #{time.time_ns()}"], use_cache=False),
+                     repeat)
+    return {**result, "precision_at_k": float(precision), "texts_per_second": throughput}
+
+
+def run_suites(rows, latency, token_latency, repeat, suites, dim=1536, embedders=("openai", "local")):
+    """Run the selected suites against the corpus of the given size and return their results."""
+    import fake_openai
+
+    server = fake_openai.serve(port=0, latency=latency, token_latency=token_latency, dim=dim, background=True)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ.setdefault("TRACE_PATH", "")
+    # The fake API has no rate limits, so the client pool should not impose the real ones
+    os.environ.setdefault("OPENAI_RATE_LIMITS", json.dumps({"gpt-4o": [10 ** 6, 10 ** 9],
+                                                            "text-embedding-ada-002": [10 ** 6, 10 ** 9]}))
+
+    # Relative data paths (faiss_index.idx, embedding_cache.db, ...) resolve in the corpus dir
+    os.chdir(dataset_dir(rows))
+    for stale in glob.glob("embedding_cache.db*"):
+        os.remove(stale)
+
+    from retriever import ReviewRetriever
+    from sentiment import SentimentAgent
+    from summary import SummaryAgent
+
+    api_key = "offline-benchmark"
+    results = {}
+    retriever = ReviewRetriever(api_key=api_key)
+    products = retriever.get_product_list()
+    top_reviews = retriever.get_top_k_reviews(QUERIES[0])
+
+    def unique_query(i):
+        # Defeats the embedding cache so the fake network round trip is included
+        return f"{QUERIES[i % len(QUERIES)]} #{time.time_ns()}"
+
+    if "retriever_load" in suites:
+        results["retriever_load"] = measure(lambda i: ReviewRetriever(api_key=api_key), max(1, repeat // 10))
+
+    if "get_top_k_reviews" in suites:
+        results["get_top_k_reviews"] = measure(lambda i: retriever.get_top_k_reviews(unique_query(i)), repeat)
+        results["get_top_k_reviews_cached"] = measure(lambda i: retriever.get_top_k_reviews(QUERIES[0]), repeat)
+        results["get_top_k_reviews_product"] = measure(
+            lambda i: retriever.get_top_k_reviews(QUERIES[0], selected_product=products[i % len(products)]), repeat
+        )
+
+    if "get_top_k_reviews_batch" in suites:
+        batch_size = 50
+        loop = measure(lambda i: [retriever.get_top_k_reviews(unique_query(j)) for j in range(batch_size)], 3)
+        batched = measure(lambda i: retriever.get_top_k_reviews_batch([unique_query(j) for j in range(batch_size)]), 3)
+        results["get_top_k_reviews_batch"] = {
+            **batched,
+            "queries_per_second": batch_size / (batched["median_ms"] / 1000),
+            "loop_queries_per_second": batch_size / (loop["median_ms"] / 1000),
+        }
+
+    if "analyze_reviews" in suites:
+        agent = SentimentAgent(api_key=api_key)
+        unlabelled = top_reviews.drop(columns=["sentiment"])
+        results["analyze_reviews"] = measure(lambda i: agent.analyze_reviews(unlabelled), repeat)
+        results["analyze_reviews_precomputed"] = measure(lambda i: agent.analyze_reviews(top_reviews), repeat)
+
+    if "generate_summary" in suites:
+        summary_agent = SummaryAgent(api_key=api_key)
+        results["generate_summary"] = measure(lambda i: summary_agent.generate_summary(QUERIES[0], top_reviews), repeat)
+
+        stream_stats = {}
+
+        def stream(i):
+            for _ in summary_agent.generate_summary_stream(QUERIES[0], top_reviews, stats=stream_stats):
+                pass
+
+        results["generate_summary_stream"] = {
+            **measure(stream, repeat),
+            "time_to_first_token_ms": stream_stats["time_to_first_token"] * 1000,
+        }
+
+    if "pipeline" in suites:
+        from pipeline import ReviewPipeline
+        pipeline = ReviewPipeline(retriever, SentimentAgent(api_key=api_key), SummaryAgent(api_key=api_key))
+
+        def answer(serial):
+            # Labels are dropped so both modes pay for the sentiment call
+            run = pipeline.start(unique_query(0), serial=serial, relabel=True)
+            "".join(run.stream_answer())
+            return run.finish()
+
+        for label, serial in (("pipeline_overlapped", False), ("pipeline_serial", True)):
+            runs = []
+            results[label] = {
+                **measure(lambda i: runs.append(answer(serial)), repeat),
+                "time_to_first_token_ms": float(np.median([run["time_to_first_token"] for run in runs])) * 1000,
+            }
+
+    if "ingest" in suites:
+        import tempfile
+        from ingest import TSV_COLUMNS, ingest
+
+        # The corpus reviews re-ingested as a new TSV, into a fresh segments dir per run
+        with tempfile.TemporaryDirectory() as tmp:
+            tsv_path = os.path.join(tmp, "reviews.tsv")
+            with open(tsv_path, "w") as f:
+                f.write("\t".join(TSV_COLUMNS) + "\n")
+                for i, (title, text) in enumerate(zip(retriever.df["product_title"], retriever.df["combined_context"])):
+                    row = dict.fromkeys(TSV_COLUMNS, "")
+                    row.update(review_id=f"B{i}", product_title=str(title), review_body=" ".join(text.split()))
+                    f.write("\t".join(row[column] for column in TSV_COLUMNS) + "\n")
+
+            runs = []
+            timing = measure(lambda i: runs.append(ingest(tsv_path, retriever.embedder, retriever.base_rows,
+                                                          os.path.join(tmp, f"segments-{i}"), title_contains=""
+                                                          )), max(1, repeat // 10))
+            loaded = ReviewRetriever(api_key=api_key, segments_dir=os.path.join(tmp, "segments-0"),
+                                     refresh_interval=None)
+            results["ingest"] = {
+                **timing,
+                "rows_per_second": float(np.median([run["rows_per_second"] for run in runs])),
+                "chunks_per_second": float(np.median([run["chunks_per_second"] for run in runs])),
+            }
+            results["get_top_k_reviews_with_segments"] = measure(
+                lambda i: loaded.get_top_k_reviews(unique_query(i)), repeat
+            )
+
+    if "embedders" in suites:
+        from embedders import get_embedder
+
+        texts = retriever.df["combined_context"].tolist()
+        for kind in embedders:
+            try:
+                embedder = get_embedder(kind, api_key=api_key)
+            except ImportError as e:
+                print(f"Skipping the {kind} embedder: {e}")
+                continue
+            results[f"embed_query_{kind}"] = embedder_suite(embedder, texts, repeat)
+
+    if "evaluate_answer_cosine" in suites:
+        from evaluation import evaluate_answer_cosine
+        results["evaluate_answer_cosine"] = measure(
+            lambda i: evaluate_answer_cosine(api_key, QUERIES[0], top_reviews, f"{fake_openai.DEFAULT_ANSWER} {i}"),
+            max(1, repeat // 5)
+        )
+
+    if "text_metrics" in suites:
+        from text_metrics import compute_rouge, compute_meteor, score_batch
+        # Longer references than the synthetic reviews, closer to real retrieved context
+        reference = " ".join(top_reviews["combined_context"]) * 10
+        answers = [f"{fake_openai.DEFAULT_ANSWER} {QUERIES[i % len(QUERIES)]}" for i in range(50)]
+        pairs = measure(lambda i: [(compute_rouge(reference, answer), compute_meteor(reference, answer))
+                                   for answer in answers], 3)
+        batched = measure(lambda i: score_batch([reference] * len(answers), answers), 3)
+        results["text_metrics_batch"] = {**batched, "per_pair_loop_ms": pairs["median_ms"]}
+
+    server.shutdown()
+    return results
+
+
+def save_results(rows, latency, token_latency, results):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    commit = git_commit()
+    path = os.path.join(RESULTS_DIR, f"{commit}-{rows}.json")
+    with open(path, "w") as f:
+        json.dump({
+            "commit": commit,
+            "timestamp": time.time(),
+            "rows": rows,
+            "latency": latency,
+            "token_latency": token_latency,
+            "machine": platform.platform(),
+            "python": platform.python_version(),
+            "results": results,
+        }, f, indent=2)
+    return path
+
+
+def print_results(results):
+    print(f"{'suite':<32}{'median ms':>12}{'p95 ms':>12}{'min ms':>12}")
+    for name, result in results.items():
+        print(f"{name:<32}{result['median_ms']:>12.2f}{result['p95_ms']:>12.2f}{result['min_ms']:>12.2f}")
+        for key, value in result.items():
+            if key not in ("n", "min_ms", "median_ms", "p95_ms"):
+                print(f"  {key}: {value:.2f}")
+
+
+def compare(old_path, new_path, threshold=0.10):
+    """Print median changes between two result files and flag slowdowns above threshold."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    print(f"{old['commit']} -> {new['commit']} ({new['rows']} rows)")
+    print(f"{'suite':<32}{'old ms':>12}{'new ms':>12}{'change':>10}")
+    for name, result in new["results"].items():
+        if name not in old["results"]:
+            continue
+        before, after = old["results"][name]["median_ms"], result["median_ms"]
+        change = (after - before) / before if before else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:<32}{before:>12.2f}{after:>12.2f}{change:>+10.1%}{flag}")
+
+
+def latest_pair():
+    """Return the two most recent result files for the most recently benchmarked corpus size."""
+    paths = sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")), key=os.path.getmtime)
+    if not paths:
+        return None
+    rows = paths[-1].rsplit("-", 1)[-1]
+    same_size = [path for path in paths if path.endswith(f"-{rows}")]
+    return same_size[-2:] if len(same_size) >= 2 else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks with a fake OpenAI server.")
+    parser.add_argument("command", choices=["run", "compare"])
+    parser.add_argument("paths", nargs="*", help="Two result files for compare")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake API seconds per request")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Fake API seconds per token")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--dim", type=int, default=1536, help="Must match the corpus embedding size")
+    parser.add_argument("--embedders", nargs="+", default=["openai", "local"], help="Backends for the embedders suite")
+    parser.add_argument("--suites", nargs="+", default=[
+        "retriever_load", "get_top_k_reviews", "get_top_k_reviews_batch", "analyze_reviews", "generate_summary",
+        "pipeline", "ingest", "embedders", "evaluate_answer_cosine", "text_metrics",
+    ])
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        pair = args.paths if len(args.paths) == 2 else latest_pair()
+        if not pair:
+            print("Need two result files to compare")
+            return
+        compare(*pair)
+        return
+
+    results = run_suites(args.rows, args.latency, args.token_latency, args.repeat, set(args.suites), args.dim,
+                          args.embedders)
+    print_results(results)
+    print(f"Saved {save_results(args.rows, args.latency, args.token_latency, results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Synthetic review corpus and FAISS index in the same layout as the downloaded files.
+
+Rows get a product title, a templated combined_context and a sentiment label; vectors are
+clustered per product and unit-normalized, so product-filtered and global search behave like
+the real ada-002 index. Vectors are generated and added in chunks to bound memory.
+
+Usage:
+    python benchmarks/synthetic.py --rows 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import faiss
+
+# The repo modules live one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BRANDS = ["Head & Shoulders", "Pantene", "Dove", "Suave", "Nizoral", "Aveeno", "Neutrogena", "Garnier", "Tresemme", "Ogx"]
+LINES = ["Clinical", "Daily Moisture", "Volume", "Anti-Dandruff", "Sulfate-Free", "Repair", "Clarifying", "Curl", "Color Care"]
+OPENINGS = ["Love this shampoo.", "It's okay.", "Would not buy again.", "Great value.", "Smells amazing.", "Meh."]
+CONCERNS = [
+    "It cleared up my dandruff within a week.", "My hair feels dry after using it.", "Gives my fine hair real volume.",
+    "The ketoconazole formula works for my scalp.", "Gentle enough for color treated hair.", "Leaves a residue.",
+    "Too expensive for what it does.", "Lathers well and rinses clean.", "My scalp stopped itching.",
+]
+SENTIMENTS = ["positive", "neutral", "negative"]
+
+
+def generate_corpus(n_rows, dim=1536, n_products=None, seed=0):
+    """Return (DataFrame, per-row product codes, product centers)."""
+    rng = np.random.default_rng(seed)
+    n_products = n_products or max(10, n_rows // 50)
+
+    titles = [
+        f"{BRANDS[i % len(BRANDS)]} {LINES[(i // len(BRANDS)) % len(LINES)]} Shampoo {8 + i % 25} oz #{i}"
+        for i in range(n_products)
+    ]
+    # Skewed popularity, like real review counts
+    weights = 1.0 / np.arange(1, n_products + 1) ** 0.8
+    product_codes = rng.choice(n_products, size=n_rows, p=weights / weights.sum())
+
+    openings = rng.integers(0, len(OPENINGS), n_rows)
+    concerns = rng.integers(0, len(CONCERNS), n_rows)
+    df = pd.DataFrame({
+        "product_title": np.asarray(titles, dtype=object)[product_codes],
+        "combined_context": [f"{OPENINGS[o]} {CONCERNS[c]}" for o, c in zip(openings, concerns)],
+        "sentiment": np.asarray(SENTIMENTS, dtype=object)[rng.integers(0, len(SENTIMENTS), n_rows)],
+    })
+
+    centers = rng.normal(size=(n_products, dim)).astype("float32")
+    faiss.normalize_L2(centers)
+    return df, product_codes, centers
+
+
+def build_flat_index(product_codes, centers, noise=0.5, chunk_size=50000, seed=1):
+    """Add clustered unit vectors to an IndexFlatIP chunk by chunk."""
+    rng = np.random.default_rng(seed)
+    dim = centers.shape[1]
+    index = faiss.IndexFlatIP(dim)
+    for start in range(0, len(product_codes), chunk_size):
+        codes = product_codes[start:start + chunk_size]
+        vectors = centers[codes] + rng.normal(scale=noise / np.sqrt(dim), size=(len(codes), dim)).astype("float32")
+        faiss.normalize_L2(vectors)
+        index.add(vectors)
+    return index
+
+
+def write_dataset(out_dir, n_rows, dim=1536, columnar=True):
+    """Write reviews_data.pkl and faiss_index.idx (plus the columnar copies) into out_dir."""
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+
+    df, product_codes, centers = generate_corpus(n_rows, dim=dim)
+    df.to_pickle(os.path.join(out_dir, "reviews_data.pkl"))
+    index = build_flat_index(product_codes, centers)
+    faiss.write_index(index, os.path.join(out_dir, "faiss_index.idx"))
+
+    if columnar:
+        from review_table import convert
+        convert(
+            data_path=os.path.join(out_dir, "reviews_data.pkl"),
+            index_path=os.path.join(out_dir, "faiss_index.idx"),
+            table_path=os.path.join(out_dir, "reviews_data.feather"),
+            embeddings_path=os.path.join(out_dir, "review_embeddings.npy"),
+        )
+
+    print(f"Wrote {n_rows} rows ({df['product_title'].nunique()} products, dim {dim}) to {out_dir} "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+def dataset_dir(n_rows, root=None):
+    """Return the directory holding the synthetic dataset of a given size."""
+    root = root or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    return os.path.join(root, str(n_rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic review corpora and indexes.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--no-columnar", action="store_true", help="Skip the Feather/.npy copies")
+    args = parser.parse_args()
+
+    for n_rows in args.rows:
+        write_dataset(dataset_dir(n_rows), n_rows, dim=args.dim, columnar=not args.no_columnar)
+
+
+if __name__ == "__main__":
+    main()
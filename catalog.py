@@ -0,0 +1,58 @@
+"""Product catalog built once when the review table is loaded.
+
+Product titles are categorical-encoded and each product's rows are stored as one contiguous
+slice of a row-id array, so product lookups, review counts and the sorted product list are
+all O(1) on the query path, with no boolean scan or table copy.
+"""
+import bisect
+import numpy as np
+import pandas as pd
+
+
+class ProductCatalog:
+    def __init__(self, product_titles):
+        """Build the catalog from the product_title column (row positions are the FAISS ids)."""
+        codes, categories = pd.factorize(product_titles, sort=True)
+        self.codes = codes.astype("int32")
+        self.products = list(categories)
+        self._code_of = {product: code for code, product in enumerate(self.products)}
+
+        # Rows sorted by product: product c owns row_ids[offsets[c]:offsets[c + 1]]
+        valid = self.codes >= 0
+        order = np.argsort(self.codes[valid], kind="stable")
+        self.row_ids = np.flatnonzero(valid)[order].astype("int64")
+        self.counts = np.bincount(self.codes[valid], minlength=len(self.products))
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+
+        # Case-insensitive prefix search over the sorted titles
+        self._search_keys = sorted((product.lower(), product) for product in self.products)
+
+    def __contains__(self, product):
+        return product in self._code_of
+
+    def __len__(self):
+        return len(self.products)
+
+    def ids(self, product):
+        """Return the row ids of a product's reviews (a view, not a copy)."""
+        code = self._code_of[product]
+        return self.row_ids[self.offsets[code]:self.offsets[code + 1]]
+
+    def count(self, product):
+        """Return the number of reviews of a product."""
+        return int(self.counts[self._code_of[product]])
+
+    def categorical(self):
+        """Return the product titles as a Categorical sharing the catalog's codes."""
+        return pd.Categorical.from_codes(self.codes, categories=self.products)
+
+    def search(self, prefix, limit=50):
+        """Return up to limit products whose title starts with prefix (case-insensitive), sorted."""
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._search_keys, (prefix,))
+        matches = []
+        for key, product in self._search_keys[start:]:
+            if not key.startswith(prefix) or len(matches) == limit:
+                break
+            matches.append(product)
+        return matches
@@ -0,0 +1,382 @@
+"""One pooled, rate-limited OpenAI client shared by every agent in the process.
+
+ClientPool runs an AsyncOpenAI client (one HTTP connection pool) on a background event loop.
+Each request first waits for capacity in two token buckets for its model, requests per minute
+and tokens per minute, and waiters are admitted by lane: user-facing ("interactive") calls go
+ahead of "batch" work, which goes ahead of "background" evaluation judges. Lower lanes also
+leave headroom (LANE_RESERVE): they may not draw a bucket below that fraction of its capacity,
+so a burst of background judges cannot use up the budget user-facing calls need. Rate limits, timeouts,
+connection errors and 5xx responses are retried with full-jitter exponential backoff, honouring
+Retry-After; a 429 also pauses that model's lane scheduler so queued calls do not pile on.
+
+The agents keep their synchronous code: get_client(api_key, lane) returns a PooledClient with
+the chat.completions.create / embeddings.create interface of OpenAI (stream=True included).
+Set the per-model limits of the deployment's OpenAI usage tier with the OPENAI_RATE_LIMITS
+environment variable, e.g. OPENAI_RATE_LIMITS='{"gpt-4o": [5000, 800000]}'. Models it leaves out
+fall back to DEFAULT_LIMITS, which are low-tier values: on most accounts they throttle the
+batch and background lanes well below the real limit, so the pool warns when it uses them.
+
+Usage:
+    python client_pool.py loadtest --requests 300 --concurrency 64 --server-rpm 1200
+"""
+import argparse
+import asyncio
+import atexit
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+import numpy as np
+from openai import AsyncOpenAI, APIConnectionError, InternalServerError, RateLimitError
+from token_budget import count_tokens
+from tracing import record
+
+LANES = {"interactive": 0, "batch": 1, "background": 2}
+
+# Fraction of each bucket a lane leaves for the lanes above it
+LANE_RESERVE = {"interactive": 0.0, "batch": 0.2, "background": 0.4}
+
+# (requests per minute, tokens per minute); conservative low-tier values, override with OPENAI_RATE_LIMITS
+DEFAULT_LIMITS = {
+    "gpt-4o": (500, 30000),
+    "text-embedding-ada-002": (3000, 1000000),
+}
+FALLBACK_LIMITS = (500, 200000)
+
+RETRYABLE = (RateLimitError, APIConnectionError, InternalServerError)
+
+
+def configured_limits():
+    """DEFAULT_LIMITS with the overrides from OPENAI_RATE_LIMITS applied; warns about models left on the defaults."""
+    limits = dict(DEFAULT_LIMITS)
+    overrides = json.loads(os.getenv("OPENAI_RATE_LIMITS") or "{}")
+    limits.update({model: tuple(values) for model, values in overrides.items()})
+
+    defaulted = sorted(model for model in DEFAULT_LIMITS if model not in overrides)
+    if defaulted:
+        print(f"Using built-in rate limits for {', '.join(defaulted)}; set OPENAI_RATE_LIMITS to your "
+              f"account's limits, e.g. OPENAI_RATE_LIMITS='{{\"gpt-4o\": [5000, 800000]}}'")
+    return limits
+
+
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None):
+        """Refills at per_minute / 60 units per second up to capacity (default: one minute's worth)."""
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, reserve=0.0):
+        """Seconds until amount units are available with reserve (a fraction of capacity) left over.
+
+        Requests larger than the bucket wait for a full one.
+        """
+        self._refill()
+        needed = min(amount + reserve * self.capacity, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def take(self, amount):
+        """Remove amount units; a negative amount returns over-estimated units."""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class ModelLimiter:
+    """Admits the waiting requests for one model in lane order as its two buckets allow.
+
+    reserve maps a lane priority to the fraction of each bucket that lane must leave unused.
+    """
+
+    def __init__(self, rpm, tpm, reserve=None):
+        # OpenAI may enforce requests per minute over shorter windows, so requests only burst a second's worth
+        self.requests = TokenBucket(rpm, capacity=max(rpm / 60, 1))
+        self.tokens = TokenBucket(tpm)
+        self.reserve = reserve or {}
+        self.paused_until = 0.0
+        self._waiting = []
+        self._order = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def acquire(self, priority, tokens):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._admit())
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._order), tokens, future))
+        self._wakeup.set()
+        await future
+
+    def pause(self, seconds):
+        """Hold every waiter back, e.g. for the Retry-After of a 429."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self._wakeup.set()
+
+    async def _admit(self):
+        while True:
+            if not self._waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            priority, _, tokens, future = self._waiting[0]
+            reserve = self.reserve.get(priority, 0.0)
+            delay = max(self.paused_until - time.monotonic(), self.requests.wait_time(1, reserve),
+                        self.tokens.wait_time(tokens, reserve))
+            if delay > 0:
+                # A new, more urgent arrival or a pause wakes the loop to re-check the head of the queue
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._waiting)
+            if not future.done():
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                future.set_result(None)
+
+
+def estimate_tokens(kind, kwargs):
+    """Tokens a request will count against tokens per minute: the prompt plus the completion ceiling."""
+    model = kwargs.get("model", "gpt-4o")
+    if kind == "embeddings":
+        texts = kwargs["input"] if isinstance(kwargs["input"], list) else [kwargs["input"]]
+        return sum(count_tokens(str(text), model) for text in texts)
+    prompt = sum(count_tokens(str(message.get("content") or ""), model) for message in kwargs.get("messages", []))
+    return prompt + (kwargs.get("max_tokens") or 0)
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ClientPool:
+    def __init__(self, api_key=None, limits=None, max_retries=4, backoff=0.5, max_backoff=30, timeout=60,
+                 lane_reserve=None):
+        """Share one AsyncOpenAI connection pool; limits maps model -> (requests/min, tokens/min)."""
+        self.api_key = api_key
+        self.limits = limits or configured_limits()
+        self.lane_reserve = LANE_RESERVE if lane_reserve is None else lane_reserve
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _start(self):
+        """Start the event loop thread; again after a fork, since the thread does not survive it."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, daemon=True, name="openai-pool").start()
+            # Retries are done here, with the lane scheduler in the loop
+            self._client = AsyncOpenAI(api_key=self.api_key, max_retries=0, timeout=self.timeout)
+            self._limiters = {}
+            self._pid = os.getpid()
+
+    def close(self):
+        """Stop the lane schedulers, close the connections and the event loop."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+
+            async def shutdown():
+                for limiter in self._limiters.values():
+                    if limiter._task is not None:
+                        limiter._task.cancel()
+                await self._client.close()
+
+            self._run(shutdown())
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._pid = None
+
+    def _limiter(self, model):
+        if model not in self._limiters:
+            reserve = {LANES[lane]: fraction for lane, fraction in self.lane_reserve.items()}
+            self._limiters[model] = ModelLimiter(*self.limits.get(model, FALLBACK_LIMITS), reserve=reserve)
+        return self._limiters[model]
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _call(self, kind, lane, kwargs):
+        limiter = self._limiter(kwargs.get("model"))
+        tokens = estimate_tokens(kind, kwargs)
+        endpoint = self._client.embeddings if kind == "embeddings" else self._client.chat.completions
+
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            await limiter.acquire(LANES[lane], tokens)
+            record("openai.queue_wait", (time.perf_counter() - start) * 1000, lane=lane, model=kwargs.get("model"))
+            self.stats["requests"] += 1
+            try:
+                response = await endpoint.create(**kwargs)
+            except RETRYABLE as e:
+                if isinstance(e, RateLimitError):
+                    self.stats["rate_limited"] += 1
+                if attempt == self.max_retries:
+                    self.stats["failed"] += 1
+                    raise
+                delay = _retry_after(e) or random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                if isinstance(e, RateLimitError):
+                    limiter.pause(delay)
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+                continue
+
+            usage = getattr(response, "usage", None)
+            if usage is not None and getattr(usage, "total_tokens", None) is not None:
+                limiter.tokens.take(usage.total_tokens - tokens)
+            return response
+
+    def create(self, kind, lane, kwargs):
+        """Run one request on the pool and block for its result (an iterator of chunks when streaming)."""
+        self._start()
+        response = self._run(self._call(kind, lane, kwargs))
+        if kwargs.get("stream"):
+            return self._iterate(response)
+        return response
+
+    def _iterate(self, stream):
+        chunks = stream.__aiter__()
+        while True:
+            try:
+                yield self._run(chunks.__anext__())
+            except StopAsyncIteration:
+                return
+
+
+class _Endpoint:
+    def __init__(self, client, kind):
+        self.client = client
+        self.kind = kind
+
+    def create(self, **kwargs):
+        return self.client.pool.create(self.kind, self.client.lane, kwargs)
+
+
+class PooledClient:
+    """Synchronous stand-in for OpenAI(...) that sends every request through a ClientPool lane."""
+
+    def __init__(self, pool, lane="interactive"):
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane {lane!r}; expected one of {list(LANES)}")
+        self.pool = pool
+        self.lane = lane
+        self.chat = SimpleNamespace(completions=_Endpoint(self, "chat"))
+        self.embeddings = _Endpoint(self, "embeddings")
+
+
+_pools = {}
+_clients = {}
+_pools_lock = threading.Lock()
+
+
+def _close_pools():
+    for pool in list(_pools.values()):
+        pool.close()
+
+
+atexit.register(_close_pools)
+
+
+def get_client_pool(api_key=None):
+    """Return the process-wide pool for an API key, creating it on first use."""
+    with _pools_lock:
+        if api_key not in _pools:
+            _pools[api_key] = ClientPool(api_key=api_key)
+        return _pools[api_key]
+
+
+def get_client(api_key=None, lane="interactive"):
+    """Return the client for the given lane on the shared pool (the same object on every call)."""
+    pool = get_client_pool(api_key)
+    with _pools_lock:
+        if (api_key, lane) not in _clients:
+            _clients[api_key, lane] = PooledClient(pool, lane)
+        return _clients[api_key, lane]
+
+
+def loadtest(requests=300, concurrency=64, server_rpm=1200, latency=0.05, interactive_share=0.2, limits=None):
+    """Fire mixed-lane chat requests at a rate-limited fake API, through the pool and through plain clients."""
+    from concurrent.futures import ThreadPoolExecutor
+    from openai import OpenAI
+    import fake_openai
+
+    server = fake_openai.serve(port=0, latency=latency, rpm=server_rpm, background=True)
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    lanes = ["interactive" if random.random() < interactive_share else "background" for _ in range(requests)]
+
+    def run(label, make_client):
+        failures = []
+
+        def one(lane):
+            start = time.perf_counter()
+            try:
+                make_client(lane).chat.completions.create(
+                    model="gpt-4o", max_tokens=50, messages=[{"role": "user", "content": "Summarize the reviews."}]
+                )
+            except Exception as e:
+                failures.append(e)
+            return lane, (time.perf_counter() - start) * 1000
+
+        rejected = server.settings.rejected
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, lanes))
+        elapsed = time.perf_counter() - start
+
+        for lane in ("interactive", "background"):
+            latencies = [ms for result_lane, ms in results if result_lane == lane] or [float("nan")]
+            p50, p95 = np.percentile(latencies, [50, 95])
+            print(f"{label:<8}{lane:<13}{len(latencies):>6}{p50:>10.0f}{p95:>10.0f}", end="")
+            print(f"{requests / elapsed:>9.1f}{server.settings.rejected - rejected:>7}{len(failures):>8}"
+                  if lane == "background" else "")
+
+    print(f"{requests} requests, {concurrency} threads, fake API limited to {server_rpm} requests/min")
+    print(f"{'client':<8}{'lane':<13}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'req/s':>9}{'429s':>7}{'failed':>8}")
+    run("direct", lambda lane: OpenAI(api_key="load-test", base_url=base_url, max_retries=0))
+    # Stay just under the server's limit, as the real limits in DEFAULT_LIMITS do
+    pool = ClientPool(api_key="load-test", limits=limits or {"gpt-4o": (server_rpm * 0.95, 10 ** 9)})
+    run("pool", lambda lane: PooledClient(pool, lane))
+    print(f"pool stats: {pool.stats}")
+    pool.close()
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the shared OpenAI client pool against the fake API.")
+    parser.add_argument("command", choices=["loadtest"])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--server-rpm", type=int, default=1200, help="Requests per minute the fake API accepts")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake API seconds per request")
+    parser.add_argument("--interactive-share", type=float, default=0.2, help="Fraction of interactive requests")
+    args = parser.parse_args()
+    loadtest(args.requests, args.concurrency, args.server_rpm, args.latency, args.interactive_share)
+
+
+if __name__ == "__main__":
+    main()
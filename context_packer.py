@@ -0,0 +1,103 @@
+"""Fit retrieved reviews into a token budget before they go into the summary prompt.
+
+Reviews are assumed to arrive in relevance order. Near-duplicates are dropped, long reviews are
+cut down to the sentences that overlap most with the question, and reviews are then admitted
+so that the positive/neutral/negative mix of the packed context follows the retrieved one.
+"""
+import re
+from token_budget import count_tokens, truncate_tokens
+
+_WORD = re.compile(r"[a-z0-9']+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _words(text):
+    return set(_WORD.findall(text.lower()))
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def format_review(text, sentiment):
+    return f"- {text} (Sentiment: {sentiment})"
+
+
+def relevant_excerpt(text, query, max_tokens, model="gpt-4o"):
+    """Shorten text to max_tokens by keeping the sentences that share the most words with the query."""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+
+    query_words = {word for word in _words(query) if len(word) > 2}
+    sentences = [sentence for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+    ranked = sorted(range(len(sentences)), key=lambda i: (-len(_words(sentences[i]) & query_words), i))
+
+    chosen, used = [], 0
+    for i in ranked:
+        tokens = count_tokens(sentences[i], model)
+        if used + tokens <= max_tokens:
+            chosen.append(i)
+            used += tokens
+
+    if not chosen:
+        return truncate_tokens(text, max_tokens, model)
+    # Keep the sentences in their original order so the excerpt still reads naturally
+    return " ... ".join(sentences[i] for i in sorted(chosen))
+
+
+def pack_reviews(user_query, reviews, max_tokens=1500, max_review_tokens=150, duplicate_threshold=0.9,
+                 model="gpt-4o"):
+    """Return (review lines for the prompt, stats) for a DataFrame with combined_context and sentiment."""
+    texts = [str(text) for text in reviews["combined_context"]]
+    sentiments = [str(sentiment) for sentiment in reviews["sentiment"]]
+    original_tokens = sum(count_tokens(format_review(t, s), model) for t, s in zip(texts, sentiments))
+
+    # Drop near-duplicates, keeping the more relevant (earlier) copy
+    kept, seen = [], []
+    for i, text in enumerate(texts):
+        words = _words(text)
+        if any(_jaccard(words, other) >= duplicate_threshold for other in seen):
+            continue
+        seen.append(words)
+        kept.append(i)
+    duplicates = len(texts) - len(kept)
+
+    candidates = {}
+    for i in kept:
+        line = format_review(relevant_excerpt(texts[i], user_query, max_review_tokens, model), sentiments[i])
+        candidates[i] = (line, count_tokens(line, model) + 1)
+
+    # Admit the top review of every sentiment first, then from whichever sentiment is furthest
+    # below its share of the retrieved set
+    groups = {}
+    for i in kept:
+        groups.setdefault(sentiments[i], []).append(i)
+    targets = {sentiment: len(ids) / len(kept) for sentiment, ids in groups.items()}
+    picked_by_sentiment = {sentiment: 0 for sentiment in groups}
+
+    selected, used = [], 0
+    while groups:
+        total = max(len(selected), 1)
+        sentiment = min(groups, key=lambda s: (
+            picked_by_sentiment[s] > 0, picked_by_sentiment[s] / total - targets[s], -targets[s]
+        ))
+        i = groups[sentiment].pop(0)
+        if not groups[sentiment]:
+            del groups[sentiment]
+        line, tokens = candidates[i]
+        if used + tokens > max_tokens:
+            continue
+        selected.append(i)
+        picked_by_sentiment[sentiment] += 1
+        used += tokens
+
+    lines = [candidates[i][0] for i in sorted(selected)]
+    stats = {
+        "reviews_in": len(texts),
+        "reviews_packed": len(lines),
+        "duplicates_dropped": duplicates,
+        "context_tokens_original": original_tokens,
+        "context_tokens": used,
+        "context_tokens_saved": max(original_tokens - used, 0),
+    }
+    return lines, stats
@@ -0,0 +1,172 @@
+"""Pluggable text embedders for retrieval: OpenAI's API or a CPU-only local model.
+
+Both return unit-normalized float32 matrices and go through the shared embedding cache, so
+ReviewRetriever does not care which one it holds. The local backend uses sentence-transformers
+(optionally with its ONNX runtime backend), which removes the network hop from every query.
+An index built with one embedder cannot be searched with another; reindex rebuilds
+faiss_index.idx (and review_embeddings.npy) for the chosen embedder and records it next to the
+index in faiss_index.idx.json.
+
+Usage:
+    python embedders.py reindex                      # OpenAI, the retriever's default
+    python embedders.py reindex --embedder local --model sentence-transformers/all-MiniLM-L6-v2   # run with EMBEDDER=local
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+import faiss
+from embedding_cache import EMBEDDING_MODEL, get_embedding_cache
+from tracing import span
+
+DEFAULT_LOCAL_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype="float32")
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class OpenAIEmbedder:
+    def __init__(self, api_key=None, client=None, model=EMBEDDING_MODEL, cache=None):
+        from client_pool import get_client
+
+        # Standalone use is bulk embedding (reindex, benchmarks); the retriever passes its own client
+        self.client = client or get_client(api_key, lane="batch")
+        self.model = model
+        self.name = f"openai:{model}"
+        self.cache = cache or get_embedding_cache()
+
+    def embed(self, texts, batch_size=1000, use_cache=True):
+        """Return an (n, d) unit-normalized matrix; only cache misses are sent, in batched requests."""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+        if use_cache:
+            return _normalize(np.vstack(self.cache.embed(self.client, texts, self.model, batch_size=batch_size)))
+
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            with span("embeddings.request", inputs=len(batch), model=self.model) as request_span:
+                response = self.client.embeddings.create(input=batch, model=self.model)
+                request_span.record_usage(response)
+            vectors.extend(item.embedding for item in response.data)
+        return _normalize(vectors)
+
+
+class LocalEmbedder:
+    def __init__(self, model=DEFAULT_LOCAL_MODEL, backend="torch", batch_size=64, cache=None):
+        """Load a sentence-transformers model on CPU; backend="onnx" runs it with onnxruntime."""
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "The local embedder needs sentence-transformers: pip install sentence-transformers"
+                + (" onnxruntime" if backend == "onnx" else "")
+            ) from e
+
+        kwargs = {"backend": backend} if backend != "torch" else {}
+        self.encoder = SentenceTransformer(model, device="cpu", **kwargs)
+        self.model = model
+        self.name = f"local:{model}"
+        self.batch_size = batch_size
+        self.cache = cache or get_embedding_cache()
+
+    def embed(self, texts, batch_size=None, use_cache=True):
+        """Return an (n, d) unit-normalized matrix, encoding cache misses in batches."""
+        texts = list(texts)
+        vectors = [self.cache.get(text, self.name) if use_cache else None for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+        if missing:
+            with span("embeddings.local", inputs=len(missing), model=self.model):
+                encoded = self.encoder.encode(
+                    [texts[i] for i in missing], batch_size=batch_size or self.batch_size,
+                    normalize_embeddings=True, convert_to_numpy=True
+                )
+            for i, vector in zip(missing, encoded):
+                if use_cache:
+                    self.cache.put(texts[i], self.name, vector)
+                vectors[i] = vector
+
+        if not vectors:
+            return np.zeros((0, self.encoder.get_sentence_embedding_dimension()), dtype="float32")
+        return _normalize(np.vstack(vectors))
+
+
+def get_embedder(kind="openai", api_key=None, model=None, client=None, **kwargs):
+    """Build an embedder by kind ("openai" or "local"); model overrides the default model."""
+    if kind == "openai":
+        return OpenAIEmbedder(api_key=api_key, client=client, model=model or EMBEDDING_MODEL, **kwargs)
+    if kind == "local":
+        return LocalEmbedder(model=model or DEFAULT_LOCAL_MODEL, **kwargs)
+    raise ValueError(f"Unknown embedder {kind!r}; expected 'openai' or 'local'")
+
+
+def index_metadata_path(index_path):
+    return f"{index_path}.json"
+
+
+def read_index_metadata(index_path):
+    """Return the embedder recorded for an index, or None for indexes built before reindex existed."""
+    path = index_metadata_path(index_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def reindex(embedder, texts, index_path="faiss_index.idx", embeddings_path=None, batch_size=256):
+    """Embed every review with embedder and write a flat inner-product index (and the .npy copy)."""
+    start = time.perf_counter()
+    chunks = []
+    for offset in range(0, len(texts), batch_size):
+        # Review texts are embedded once, so they are kept out of the query cache
+        chunks.append(embedder.embed(texts[offset:offset + batch_size], use_cache=False))
+        done = min(offset + batch_size, len(texts))
+        print(f"{done}/{len(texts)} reviews ({done / (time.perf_counter() - start):.0f} reviews/s)")
+    vectors = np.vstack(chunks).astype("float32")
+
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    faiss.write_index(index, index_path)
+    if embeddings_path:
+        np.save(embeddings_path, vectors)
+    with open(index_metadata_path(index_path), "w") as f:
+        json.dump({"embedder": embedder.name, "dim": int(vectors.shape[1]), "rows": len(texts)}, f)
+
+    print(f"Wrote {index_path} ({vectors.shape}) for {embedder.name} in {time.perf_counter() - start:.1f}s")
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the review index for an embedder.")
+    parser.add_argument("command", choices=["reindex"])
+    parser.add_argument("--embedder", choices=["openai", "local"], default="openai",
+                        help="Must match the retriever's EMBEDDER setting (default openai)")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch", help="Local embedder runtime")
+    parser.add_argument("--index-path", default="faiss_index.idx")
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from review_table import TABLE_PATH, EMBEDDINGS_PATH, load_reviews
+    import pandas as pd
+
+    load_dotenv()
+    kwargs = {"backend": args.backend} if args.embedder == "local" else {"api_key": os.getenv("OpenAI_API_Key")}
+    embedder = get_embedder(args.embedder, model=args.model, **kwargs)
+
+    df = load_reviews(TABLE_PATH) if os.path.exists(TABLE_PATH) else pd.read_pickle("reviews_data.pkl")
+    # Keep the memory-mapped copy in step with the index, or ANN and hybrid rescoring would mix models
+    embeddings_path = EMBEDDINGS_PATH if os.path.exists(EMBEDDINGS_PATH) else None
+    reindex(embedder, df["combined_context"].tolist(), args.index_path, embeddings_path, args.batch_size)
+    print("ANN variants built by index_variants.py are now stale; rebuild them if you use them.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Embedding cache keyed on normalized text: an in-process LRU backed by a SQLite file.
+
+Shared by retriever.py and evaluation.py so a repeated question never hits the network.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+from tracing import span
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+def normalize_text(text):
+    """Collapse whitespace and case so trivially different queries share a cache entry."""
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+class EmbeddingCache:
+    def __init__(self, path="embedding_cache.db", max_items=10000):
+        """Open (or create) the on-disk store and an empty in-memory LRU of max_items vectors."""
+        self.path = path
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT, vector BLOB)"
+        )
+        self._conn.commit()
+
+    def reopen(self):
+        """Replace the SQLite connection and lock, e.g. in a forked child (connections must not cross a fork)."""
+        self._lock = threading.Lock()
+        # Closing the inherited handle would release the parent's POSIX locks, so it is only dropped
+        self._inherited_conn = self._conn
+        self._connect()
+
+    @staticmethod
+    def _key(text, model):
+        return hashlib.sha1(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def get(self, text, model=EMBEDDING_MODEL):
+        """Return the cached float32 vector for text, or None."""
+        key = self._key(text, model)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+            row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            vector = np.frombuffer(row[0], dtype="float32")
+            self._remember(key, vector)
+            self.hits += 1
+            return vector
+
+    def put(self, text, model, vector):
+        """Store a vector in memory and on disk."""
+        key = self._key(text, model)
+        vector = np.asarray(vector, dtype="float32")
+        with self._lock:
+            self._remember(key, vector)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                (key, model, vector.tobytes())
+            )
+            self._conn.commit()
+
+    def embed(self, client, texts, model=EMBEDDING_MODEL, batch_size=1000):
+        """Return one float32 vector per text, embedding only the misses in batched requests."""
+        vectors = [self.get(text, model) for text in texts]
+
+        # Deduplicate misses by normalized text so one request covers repeats in the batch
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(normalize_text(texts[i]), []).append(i)
+
+        pending = [(texts[positions[0]], positions) for positions in missing.values()]
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            with span("embeddings.request", inputs=len(batch), model=model) as request_span:
+                response = client.embeddings.create(input=[text for text, _ in batch], model=model)
+                request_span.record_usage(response)
+            for (text, positions), item in zip(batch, response.data):
+                self.put(text, model, item.embedding)
+                for i in positions:
+                    vectors[i] = np.asarray(item.embedding, dtype="float32")
+
+        return vectors
+
+    def stats(self):
+        """Return hit/miss counters and the current in-memory size."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_items": len(self._memory),
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(path="embedding_cache.db", max_items=10000):
+    """Return the process-wide cache for a given file, creating it on first use."""
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = EmbeddingCache(path, max_items=max_items)
+        return _caches[path]
+
+
+def _reopen_after_fork():
+    global _caches_lock
+    _caches_lock = threading.Lock()
+    for cache in _caches.values():
+        cache.reopen()
+
+
+# retrieval_server.py forks workers after loading the retriever, which already holds a cache
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reopen_after_fork)
@@ -0,0 +1,209 @@
+"""SQLite-backed job queue that scores answers in background worker processes.
+
+The Q&A app enqueues (query, retrieved reviews, answer) and returns straight away; workers
+claim jobs, run evaluate_answer_cosine and record the outcome. No outside broker is needed:
+every process talks to the same eval_queue.db file.
+
+Usage:
+    python eval_queue.py worker --workers 2
+    python eval_queue.py stats
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from contextlib import closing
+import pandas as pd
+from dotenv import load_dotenv
+from eval_store import STORE_PATH
+
+QUEUE_PATH = "eval_queue.db"
+
+
+class EvaluationQueue:
+    def __init__(self, path=QUEUE_PATH, max_attempts=3, stale_after=600):
+        """Create the jobs table if needed. Jobs running longer than stale_after seconds are presumed lost."""
+        self.path = path
+        self.max_attempts = max_attempts
+        self.stale_after = stale_after
+
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    enqueued_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    error TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def _connect(self):
+        # Autocommit mode so claim() can take the write lock explicitly with BEGIN IMMEDIATE
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def enqueue(self, user_query, retrieved_reviews, generated_answer):
+        """Queue an answer for scoring and return the job id."""
+        payload = {
+            "user_query": user_query,
+            "reviews": retrieved_reviews["combined_context"].tolist(),
+            "review_ids": retrieved_reviews["review_id"].tolist() if "review_id" in retrieved_reviews else None,
+            "generated_answer": generated_answer,
+        }
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (payload, enqueued_at) VALUES (?, ?)", (json.dumps(payload), time.time())
+            )
+            return cursor.lastrowid
+
+    def claim(self):
+        """Atomically mark the oldest queued job as running and return (id, payload), or None."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT id, payload FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (time.time(), row[0])
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def complete(self, job_id):
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE jobs SET status = 'done', finished_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def fail(self, job_id, error):
+        """Put a failed job back in the queue, or mark it failed after max_attempts."""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                "finished_at = ?, error = ? WHERE id = ?",
+                (self.max_attempts, time.time(), error, job_id)
+            )
+
+    def requeue_stale(self):
+        """Return jobs whose worker died mid-run to the queue."""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND started_at < ?",
+                (time.time() - self.stale_after,)
+            )
+
+    def purge(self, older_than=86400):
+        """Delete finished jobs older than the given number of seconds."""
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM jobs WHERE status = 'done' AND finished_at < ?", (time.time() - older_than,))
+
+    def metrics(self):
+        """Return queue depth, the age of the oldest queued job and recent end-to-end latency."""
+        with closing(self._connect()) as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = conn.execute("SELECT MIN(enqueued_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            recent = conn.execute(
+                "SELECT AVG(finished_at - enqueued_at) FROM "
+                "(SELECT finished_at, enqueued_at FROM jobs WHERE status = 'done' ORDER BY finished_at DESC LIMIT 100)"
+            ).fetchone()[0]
+
+        return {
+            "depth": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "lag_seconds": time.time() - oldest if oldest else 0.0,
+            "avg_completion_seconds": recent or 0.0,
+        }
+
+
+def _reviews_frame(payload):
+    reviews = pd.DataFrame({"combined_context": payload["reviews"]})
+    if payload.get("review_ids") is not None:
+        reviews["review_id"] = payload["review_ids"]
+    return reviews
+
+
+def run_worker(api_key, queue_path=QUEUE_PATH, store_path=STORE_PATH, poll_interval=1.0, stop_when_empty=False,
+               requeue_interval=60.0):
+    """Claim and score jobs until stopped (or until the queue is empty if stop_when_empty).
+
+    Every requeue_interval seconds the worker also returns jobs stranded by a crashed worker to the queue.
+    """
+    # Imported here so spawned workers only pay for nltk/sklearn when they actually run
+    from evaluation import evaluate_answer_cosine
+
+    queue = EvaluationQueue(queue_path)
+    queue.purge()
+
+    last_requeue = None
+    while True:
+        if last_requeue is None or time.time() - last_requeue >= requeue_interval:
+            queue.requeue_stale()
+            last_requeue = time.time()
+
+        job = queue.claim()
+        if job is None:
+            if stop_when_empty:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        job_id, payload = job
+        try:
+            evaluate_answer_cosine(
+                api_key=api_key,
+                user_query=payload["user_query"],
+                retrieved_reviews=_reviews_frame(payload),
+                generated_answer=payload["generated_answer"],
+                store_path=store_path
+            )
+            queue.complete(job_id)
+        except Exception as e:
+            queue.fail(job_id, str(e))
+
+
+def start_workers(api_key, workers=1, queue_path=QUEUE_PATH, store_path=STORE_PATH):
+    """Start daemon worker processes and return them."""
+    # spawn rather than fork: the parent may be a multi-threaded Streamlit server
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for _ in range(workers):
+        process = context.Process(target=run_worker, args=(api_key, queue_path, store_path), daemon=True)
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background evaluation queue.")
+    parser.add_argument("command", choices=["worker", "stats"])
+    parser.add_argument("--queue-path", default=QUEUE_PATH)
+    parser.add_argument("--store-path", default=STORE_PATH)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        print(json.dumps(EvaluationQueue(args.queue_path).metrics(), indent=2))
+        return
+
+    load_dotenv()
+    api_key = os.getenv("OpenAI_API_Key")
+    processes = start_workers(api_key, args.workers, args.queue_path, args.store_path)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
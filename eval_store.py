@@ -0,0 +1,236 @@
+"""Append-only evaluation store (SQLite, WAL) with incremental Google Sheets sync.
+
+Every evaluate_answer_cosine result is one INSERT, so concurrent writers (the apps and the
+eval_queue workers) never interleave partial rows. A per-sheet high-water mark records the
+last row pushed, so each sync sends only new rows in batches instead of the whole history.
+SheetSync runs that sync on a timer in a background thread, off the apps' request path.
+
+Usage:
+    python eval_store.py import-csv evaluation_logs.csv
+    python eval_store.py export-csv evaluation_export.csv
+"""
+import argparse
+import sqlite3
+import threading
+import time
+from contextlib import closing
+import pandas as pd
+
+STORE_PATH = "evaluation_logs.db"
+
+EVAL_COLUMNS = [
+    "question", "generated_answer", "rouge1", "rouge2", "rougeL", "meteor", "cosine_similarity",
+    "accuracy", "relevance", "coherence", "clarity", "consistency", "sentiment_alignment"
+]
+
+
+class EvaluationStore:
+    def __init__(self, path=STORE_PATH):
+        """Create the results and sync-state tables if needed."""
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            columns = ", ".join(f'"{column}"' for column in EVAL_COLUMNS)
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS results (id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL, {columns})"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS sync_state (sink TEXT PRIMARY KEY, last_id INTEGER NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def append(self, result):
+        """Insert one evaluation result and return its row id."""
+        columns = ", ".join(f'"{column}"' for column in EVAL_COLUMNS)
+        placeholders = ", ".join("?" for _ in EVAL_COLUMNS)
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                f"INSERT INTO results (created_at, {columns}) VALUES (?, {placeholders})",
+                [time.time()] + [result.get(column) for column in EVAL_COLUMNS]
+            )
+            return cursor.lastrowid
+
+    def high_water_mark(self, sink):
+        """Return the id of the last row pushed to a sink (0 if never synced)."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT last_id FROM sync_state WHERE sink = ?", (sink,)).fetchone()
+        return row[0] if row else 0
+
+    def has_unsynced(self, sink):
+        """Return True if rows were added since the last sync to a sink."""
+        with closing(self._connect()) as conn:
+            latest = conn.execute("SELECT MAX(id) FROM results").fetchone()[0]
+        return latest is not None and latest > self.high_water_mark(sink)
+
+    def claim_batch(self, sink, batch_size=500):
+        """Advance the sink's high-water mark past the next batch; return (previous mark, rows, new mark).
+
+        Claiming before pushing means two apps syncing at once never send the same rows.
+        """
+        columns = ", ".join(f'"{column}"' for column in EVAL_COLUMNS)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT last_id FROM sync_state WHERE sink = ?", (sink,)).fetchone()
+            last_id = row[0] if row else 0
+            rows = conn.execute(
+                f"SELECT id, {columns} FROM results WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+            ).fetchall()
+            if rows:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sync_state (sink, last_id) VALUES (?, ?)", (sink, rows[-1][0])
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return last_id, [list(row[1:]) for row in rows], (rows[-1][0] if rows else last_id)
+
+    def release_batch(self, sink, previous_id, claimed_id):
+        """Roll the high-water mark back after a failed push, unless another sync moved it since."""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE sync_state SET last_id = ? WHERE sink = ? AND last_id = ?", (previous_id, sink, claimed_id)
+            )
+
+    def to_dataframe(self):
+        """Return every stored result as a DataFrame."""
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query("SELECT * FROM results ORDER BY id", conn)
+
+    def import_csv(self, csv_path):
+        """Append the rows of an old evaluation_logs.csv."""
+        df = pd.read_csv(csv_path)
+        for result in df.to_dict(orient="records"):
+            self.append(result)
+        return len(df)
+
+
+def sync_to_sheet(store, service, sheet_id, sheet_name="Sheet1", batch_size=500):
+    """Push rows added since the last sync to a Google Sheet and return how many were sent.
+
+    The first sync writes the header and rows from A1 (replacing the old full-overwrite output);
+    later syncs append below it.
+    """
+    sent = 0
+    while True:
+        previous_id, rows, claimed_id = store.claim_batch(sheet_id, batch_size)
+        if not rows:
+            return sent
+
+        values = service.spreadsheets().values()
+        try:
+            if previous_id == 0:
+                values.update(
+                    spreadsheetId=sheet_id,
+                    range=f"{sheet_name}!A1",
+                    valueInputOption="RAW",
+                    body={"values": [EVAL_COLUMNS] + rows}
+                ).execute()
+            else:
+                values.append(
+                    spreadsheetId=sheet_id,
+                    range=f"{sheet_name}!A1",
+                    valueInputOption="RAW",
+                    insertDataOption="INSERT_ROWS",
+                    body={"values": rows}
+                ).execute()
+        except Exception:
+            store.release_batch(sheet_id, previous_id, claimed_id)
+            raise
+
+        sent += len(rows)
+
+
+class SheetSync:
+    """Pushes new evaluation rows to a Google Sheet every interval seconds from a daemon thread.
+
+    make_service builds the Sheets client in that thread, since the Google API clients are not
+    thread-safe. sent, last_sync and last_error report progress to the UI.
+    """
+
+    def __init__(self, make_service, sheet_id, store_path=STORE_PATH, sheet_name="Sheet1", interval=60.0):
+        self.make_service = make_service
+        self.sheet_id = sheet_id
+        self.store_path = store_path
+        self.sheet_name = sheet_name
+        self.interval = interval
+        self.sent = 0
+        self.last_sync = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="sheet-sync")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        store = EvaluationStore(self.store_path)
+        service = None
+        while True:
+            try:
+                if store.has_unsynced(self.sheet_id):
+                    service = service or self.make_service()
+                    self.sent += sync_to_sheet(store, service, self.sheet_id, self.sheet_name)
+                self.last_sync = time.time()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+            if self._stop.wait(self.interval):
+                return
+
+
+class FakeSheetsService:
+    """Local stand-in for the Sheets API client: service.spreadsheets().values().update/append."""
+
+    def __init__(self):
+        self.sheets = {}
+        self.calls = []
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def update(self, spreadsheetId, range, valueInputOption, body):
+        self.calls.append(("update", spreadsheetId, len(body["values"])))
+        self.sheets[spreadsheetId] = [list(row) for row in body["values"]]
+        return _FakeRequest({"updatedRows": len(body["values"])})
+
+    def append(self, spreadsheetId, range, valueInputOption, body, insertDataOption=None):
+        self.calls.append(("append", spreadsheetId, len(body["values"])))
+        self.sheets.setdefault(spreadsheetId, []).extend(list(row) for row in body["values"])
+        return _FakeRequest({"updates": {"updatedRows": len(body["values"])}})
+
+
+class _FakeRequest:
+    def __init__(self, response):
+        self.response = response
+
+    def execute(self):
+        return self.response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluation store maintenance.")
+    parser.add_argument("command", choices=["import-csv", "export-csv"])
+    parser.add_argument("csv_path")
+    parser.add_argument("--store-path", default=STORE_PATH)
+    args = parser.parse_args()
+
+    store = EvaluationStore(args.store_path)
+    if args.command == "import-csv":
+        print(f"Imported {store.import_csv(args.csv_path)} rows into {args.store_path}")
+    else:
+        df = store.to_dataframe()
+        df.to_csv(args.csv_path, index=False)
+        print(f"Exported {len(df)} rows to {args.csv_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,108 @@
+import json
 import os
-import pandas as pd
-import nltk
-from nltk.translate.meteor_score import meteor_score
-from rouge_score import rouge_scorer
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
-from openai import OpenAI
+from client_pool import get_client
+from embedding_cache import EMBEDDING_MODEL, get_embedding_cache
+from embedders import read_index_metadata
+from eval_store import EvaluationStore, STORE_PATH
+from review_table import EMBEDDINGS_PATH, load_embeddings
+from text_metrics import compute_rouge, compute_meteor, pooled_cosine, score_batch
+from tracing import span
 
-nltk.download("wordnet")
-nltk.download("omw-1.4")
+# Judges and answer embeddings go through the shared pool's lowest-priority lane, so they queue
+# behind user-facing calls; set by _use_api_key, which hands back the same client every time
+client = None
+
+_review_vectors = {}
+_review_vectors_lock = threading.Lock()
+
+def _use_api_key(api_key):
+    global client
+    client = get_client(api_key, lane="background")
 
 # TEXT METRICS
-def compute_rouge(reference, candidate):
-    scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
-    return scorer.score(reference, candidate)
+def stored_review_vectors(review_ids, embeddings_path=EMBEDDINGS_PATH, index_path="faiss_index.idx"):
+    """Return the stored ada-002 vectors of the given rows, or None if they are not available.
+
+    The matrix is memory-mapped once per process. Vectors from another embedder (see
+    embedders.py reindex) are not comparable with an ada-002 answer embedding, so they are not used.
+    """
+    with _review_vectors_lock:
+        if embeddings_path not in _review_vectors:
+            metadata = read_index_metadata(index_path)
+            same_model = metadata is None or metadata["embedder"] == f"openai:{EMBEDDING_MODEL}"
+            usable = same_model and os.path.exists(embeddings_path)
+            _review_vectors[embeddings_path] = load_embeddings(embeddings_path) if usable else None
+        vectors = _review_vectors[embeddings_path]
+
+    review_ids = np.asarray(review_ids, dtype="int64")
+    if vectors is None or not len(review_ids) or review_ids.min() < 0 or review_ids.max() >= len(vectors):
+        return None
+    return np.asarray(vectors[review_ids], dtype="float32")
 
-def compute_cosine_similarity(reference, candidate):
-    ref_response = client.embeddings.create(input=[reference], model="text-embedding-ada-002")
-    cand_response = client.embeddings.create(input=[candidate], model="text-embedding-ada-002")
+def compute_cosine_similarity(reference, candidate, review_vectors=None):
+    """Cosine between the answer and the reviews.
 
-    ref_emb = list(ref_response.data[0].embedding)
-    cand_emb = list(cand_response.data[0].embedding)
+    With review_vectors (the reviews' stored embeddings) only the answer is embedded and compared
+    with their mean; otherwise the concatenated review text is embedded as well.
+    """
+    if review_vectors is not None:
+        cand_emb, = get_embedding_cache().embed(client, [candidate])
+        return float(pooled_cosine(review_vectors, [cand_emb])[0])
+
+    ref_emb, cand_emb = get_embedding_cache().embed(client, [reference, candidate])
 
     score = cosine_similarity([ref_emb], [cand_emb])[0][0]
     return float(score)
 
-def compute_meteor(reference, candidate):
-    reference_tokens = reference.split()
-    candidate_tokens = candidate.split()
-    return meteor_score([reference_tokens], candidate_tokens)
+def score_text_metrics_batch(api_key, references, candidates, review_vectors=None):
+    """Text metrics and cosine similarity for many (reference, candidate) pairs at once.
+
+    review_vectors is optional, one array of stored review vectors per pair. All answers are
+    embedded in one batched request. Returns a DataFrame with one row per pair.
+    """
+    _use_api_key(api_key)
+    with span("evaluation.text_metrics_batch", pairs=len(candidates)):
+        scores = score_batch(list(references), list(candidates))
+        if review_vectors is not None:
+            candidate_vectors = get_embedding_cache().embed(client, list(candidates))
+            scores["cosine_similarity"] = pooled_cosine(list(review_vectors), np.vstack(candidate_vectors))
+        else:
+            vectors = get_embedding_cache().embed(client, list(references) + list(candidates))
+            scores["cosine_similarity"] = [
+                float(cosine_similarity([ref], [cand])[0][0])
+                for ref, cand in zip(vectors[:len(candidates)], vectors[len(candidates):])
+            ]
+    return scores
 
 # LLM EVALUATOR
-def call_llm(prompt, model="gpt-4o", temperature=0):
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=temperature
-    )
+LLM_METRICS = ["accuracy", "relevance", "coherence", "clarity", "consistency", "sentiment_alignment"]
+
+def call_llm(prompt, model="gpt-4o", temperature=0, timeout=None, **kwargs):
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    with span("evaluation.judge", model=model) as judge_span:
+        response = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            **kwargs
+        )
+        judge_span.record_usage(response)
     return response.choices[0].message.content.strip()
 
-def llm_metric_prompt(metric, question, reviews, answer):
+def or_none(fn, *args, **kwargs):
+    """Call fn; returns None if it fails. The client pool already retries transient errors with backoff."""
+    try:
+        return fn(*args, **kwargs)
+    except Exception as e:
+        print(f"{getattr(fn, '__name__', fn)} failed: {e}")
+        return None
+
+def llm_metric_prompt(metric, question, reviews, answer, timeout=None):
     prompts = {
         "accuracy": f"On a scale of 1 to 5, where 1 is unreliable and 5 is very reliable, rate the factual accuracy of the following answer based only on the information from the reviews. Respond ONLY with a single number (1-5).\n\nAnswer: {answer}\n\nReviews: {reviews}\n\nScore:",
         "relevance": f"On a scale of 1 to 5, where 1 is irrelevant and 5 is highly relevant, rate how well the answer addresses the user's question using only the information from the reviews. Respond ONLY with a single number (1-5).\n\nQuestion: {question}\n\nAnswer: {answer}\n\nReviews: {reviews}\n\nScore:",
@@ -47,22 +111,65 @@ def llm_metric_prompt(metric, question, reviews, answer):
         "consistency": f"On a scale of 1 to 5, where 1 is inconsistent and 5 is very consistent, rate whether the answer avoids contradictions. Respond ONLY with a single number (1-5).\n\nAnswer: {answer}\n\nScore:",
         "sentiment_alignment": f"On a scale of 1 to 5, where 1 is not aligned and 5 is well aligned, rate whether the answer reflects the overall sentiment from the reviews. Respond ONLY with a single number (1-5).\n\nAnswer: {answer}\n\nReviews: {reviews}\n\nScore:"
     }
-    return call_llm(prompts[metric])
+    return call_llm(prompts[metric], timeout=timeout)
+
+def llm_metrics_json_prompt(question, reviews, answer, timeout=None):
+    """Score every metric in one structured-JSON judge call."""
+    prompt = f"""On a scale of 1 to 5, rate the following answer on each criterion:
+- accuracy: factual accuracy based only on the information from the reviews (1 unreliable, 5 very reliable)
+- relevance: how well the answer addresses the user's question using only the reviews (1 irrelevant, 5 highly relevant)
+- coherence: how well structured the answer is (1 poorly structured, 5 very well structured)
+- clarity: how clear the answer is (1 unclear, 5 very clear)
+- consistency: whether the answer avoids contradictions (1 inconsistent, 5 very consistent)
+- sentiment_alignment: whether the answer reflects the overall sentiment from the reviews (1 not aligned, 5 well aligned)
+
+Respond ONLY with a JSON object with the keys {", ".join(LLM_METRICS)} and a single number (1-5) for each.
+
+Question: {question}
+
+Answer: {answer}
+
+Reviews: {reviews}"""
+    raw_output = call_llm(prompt, timeout=timeout, response_format={"type": "json_object"})
+    scores = json.loads(raw_output)
+    return {metric: str(scores[metric]) for metric in LLM_METRICS}
+
+def score_llm_metrics(question, reviews, answer, single_call=False, max_workers=6, timeout=60):
+    """Run the LLM judges concurrently (or as one JSON call) with a per-call timeout; a failed judge scores None."""
+    if single_call:
+        scores = or_none(llm_metrics_json_prompt, question, reviews, answer, timeout=timeout)
+        return scores or {metric: None for metric in LLM_METRICS}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            metric: pool.submit(or_none, llm_metric_prompt, metric, question, reviews, answer, timeout=timeout)
+            for metric in LLM_METRICS
+        }
+        return {metric: future.result() for metric, future in futures.items()}
 
 # MAIN EVALUATION FUNCTION
-def evaluate_answer_cosine(api_key, user_query, retrieved_reviews, generated_answer, export_csv_path="evaluation_logs.csv"):
-    global client
-    client = OpenAI(api_key=api_key)
-    combined_reviews = " ".join(retrieved_reviews['combined_context'].tolist())
+def evaluate_answer_cosine(api_key, user_query, retrieved_reviews, generated_answer, store_path=STORE_PATH,
+                           single_call=False, max_workers=6, timeout=60):
+    """Score an answer with text metrics and LLM judges; network calls run concurrently.
 
-    rouge = compute_rouge(combined_reviews, generated_answer)
-    cosine_sim = compute_cosine_similarity(combined_reviews, generated_answer)
-    meteor = compute_meteor(combined_reviews, generated_answer)
+    single_call=True asks for all six judge scores in one structured-JSON request.
+    """
+    _use_api_key(api_key)
+    combined_reviews = " ".join(retrieved_reviews['combined_context'].tolist())
+    review_vectors = None
+    if "review_id" in retrieved_reviews:
+        review_vectors = stored_review_vectors(retrieved_reviews["review_id"].tolist())
 
-    llm_metrics = {
-        metric: llm_metric_prompt(metric, user_query, combined_reviews, generated_answer)
-        for metric in ["accuracy", "relevance", "coherence", "clarity", "consistency", "sentiment_alignment"]
-    }
+    # The embedding request overlaps with the judges instead of running before them
+    with span("evaluation", single_call=single_call), ThreadPoolExecutor(max_workers=1) as pool:
+        cosine_future = pool.submit(or_none, compute_cosine_similarity, combined_reviews, generated_answer,
+                                    review_vectors)
+        llm_metrics = score_llm_metrics(user_query, combined_reviews, generated_answer, single_call=single_call,
+                                        max_workers=max_workers, timeout=timeout)
+        with span("evaluation.text_metrics"):
+            rouge = compute_rouge(combined_reviews, generated_answer)
+            meteor = compute_meteor(combined_reviews, generated_answer)
+        cosine_sim = cosine_future.result()
 
     result = {
         "question": user_query,
@@ -75,10 +182,7 @@ def evaluate_answer_cosine(api_key, user_query, retrieved_reviews, generated_ans
         **llm_metrics
     }
 
-    df = pd.DataFrame([result])
-    if os.path.exists(export_csv_path):
-        df.to_csv(export_csv_path, mode='a', index=False, header=False)
-    else:
-        df.to_csv(export_csv_path, index=False)
+    # One INSERT per result, safe with concurrent workers and apps
+    EvaluationStore(store_path).append(result)
 
     return result
\ No newline at end of file
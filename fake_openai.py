@@ -0,0 +1,283 @@
+"""Offline stand-ins for the OpenAI API used by the agents.
+
+FakeOpenAI mimics client.chat.completions.create (including stream=True) and
+client.embeddings.create in process. serve() runs the same deterministic responses as a
+local HTTP server, so an unmodified OpenAI client can be pointed at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1. Both have configurable latency. For load tests the
+server can also enforce a requests-per-minute limit (429 with Retry-After, checked per second as
+OpenAI may do) and fail a fraction of requests with 500s.
+
+Usage:
+    python fake_openai.py --port 8555 --latency 0.2 --token-latency 0.01
+    python fake_openai.py --port 8555 --rpm 600 --error-rate 0.02
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+import numpy as np
+
+DEFAULT_ANSWER = (
+    "Reviewers mostly describe this shampoo positively, praising how it cleans without drying the scalp. "
+    "A few neutral reviews mention the scent, and negative reviews focus on the price."
+)
+
+SENTIMENT_CYCLE = ["positive", "positive", "neutral", "negative"]
+JUDGE_METRICS = ["accuracy", "relevance", "coherence", "clarity", "consistency", "sentiment_alignment"]
+
+
+def fake_embedding(text, dim=1536):
+    """Return a deterministic unit vector derived from the text."""
+    seed = int.from_bytes(hashlib.sha1(str(text).encode("utf-8")).digest()[:4], "little")
+    vector = np.random.default_rng(seed).normal(size=dim).astype("float32")
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def default_reply(messages):
+    """Answer the prompts the agents send with output of the shape they expect."""
+    prompt = str(messages[-1]["content"])
+
+    if '"sentiments"' in prompt:
+        # SentimentAgent._label_chunk embeds the reviews as a JSON list of {"id", "text"}
+        match = re.search(r"Reviews:\s*(\[.*\])\s*Return the output", prompt, re.S)
+        try:
+            ids = [review["id"] for review in json.loads(match.group(1))] if match else []
+        except (ValueError, KeyError, TypeError):
+            ids = []
+        return json.dumps({"sentiments": [
+            {"id": review_id, "sentiment": SENTIMENT_CYCLE[i % len(SENTIMENT_CYCLE)]} for i, review_id in enumerate(ids)
+        ]})
+
+    if "JSON object with the keys" in prompt:
+        return json.dumps({metric: 4 for metric in JUDGE_METRICS})
+
+    if "Respond ONLY with a single number" in prompt:
+        return "4"
+
+    return DEFAULT_ANSWER
+
+
+def _reply_tokens(reply, messages, max_tokens):
+    text = reply(messages) if callable(reply) else reply
+    tokens = text.split(" ")
+    if max_tokens is not None:
+        tokens = tokens[:max_tokens]
+    return tokens
+
+
+def _usage(messages, completion_tokens):
+    prompt_tokens = sum(len(str(message["content"]).split()) for message in messages)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+class _Completions:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, model, messages, stream=False, max_tokens=None, **kwargs):
+        owner = self.owner
+        tokens = _reply_tokens(owner.reply, messages, max_tokens)
+        usage = SimpleNamespace(**_usage(messages, len(tokens)))
+
+        if not stream:
+            time.sleep(owner.latency + owner.token_latency * len(tokens))
+            message = SimpleNamespace(role="assistant", content=" ".join(tokens))
+            return SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, message=message)], usage=usage)
+
+        return self._stream(model, tokens, usage, kwargs.get("stream_options"))
+
+    def _stream(self, model, tokens, usage, stream_options):
+        time.sleep(self.owner.latency)
+        for i, token in enumerate(tokens):
+            time.sleep(self.owner.token_latency)
+            delta = SimpleNamespace(content=token if i == 0 else " " + token)
+            yield SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, delta=delta)], usage=None)
+
+        if stream_options and stream_options.get("include_usage"):
+            yield SimpleNamespace(model=model, choices=[], usage=usage)
+
+
+class _Embeddings:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, input, model, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        time.sleep(self.owner.latency)
+        data = [SimpleNamespace(index=i, embedding=fake_embedding(text, self.owner.dim)) for i, text in enumerate(texts)]
+        tokens = sum(len(text.split()) for text in texts)
+        return SimpleNamespace(model=model, data=data, usage=SimpleNamespace(prompt_tokens=tokens, total_tokens=tokens))
+
+
+class FakeOpenAI:
+    def __init__(self, reply=default_reply, latency=0.0, token_latency=0.0, dim=1536):
+        """reply is a fixed string or a callable taking the messages; latencies are in seconds."""
+        self.reply = reply
+        self.latency = latency
+        self.token_latency = token_latency
+        self.dim = dim
+        self.chat = SimpleNamespace(completions=_Completions(self))
+        self.embeddings = _Embeddings(self)
+
+
+class _FakeAPIHandler(BaseHTTPRequestHandler):
+    # Set by serve()
+    settings = None
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, error_type, message, retry_after=None):
+        body = json.dumps({"error": {"message": message, "type": error_type, "code": error_type}}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if retry_after is not None:
+            self.send_header("Retry-After", f"{retry_after:.3f}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _rejected(self):
+        """Apply the configured rate limit and error rate; returns True if an error was sent."""
+        settings = self.settings
+        if settings.rpm:
+            with settings.lock:
+                now = time.time()
+                if now - settings.window_start >= 1:
+                    settings.window_start, settings.window_count = now, 0
+                settings.window_count += 1
+                over = settings.window_count > max(settings.rpm / 60, 1)
+                if over:
+                    settings.rejected += 1
+            if over:
+                self._send_error(429, "rate_limit_exceeded", "Rate limit reached for requests",
+                                 retry_after=settings.window_start + 1 - now)
+                return True
+        if settings.error_rate and random.random() < settings.error_rate:
+            self._send_error(500, "server_error", "The server had an error while processing your request")
+            return True
+        return False
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.settings.requests += 1
+        if self._rejected():
+            return
+
+        if self.path.endswith("/embeddings"):
+            self._embeddings(request)
+        elif self.path.endswith("/chat/completions"):
+            self._chat(request)
+        else:
+            self.send_error(404)
+
+    def _embeddings(self, request):
+        settings = self.settings
+        texts = request["input"] if isinstance(request["input"], list) else [request["input"]]
+        time.sleep(settings.latency)
+
+        data = []
+        for i, text in enumerate(texts):
+            vector = fake_embedding(text, settings.dim)
+            # The OpenAI SDK asks for base64 float32 by default
+            if request.get("encoding_format") == "base64":
+                vector = base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+
+        tokens = sum(len(str(text).split()) for text in texts)
+        self._send_json({"object": "list", "data": data, "model": request.get("model"),
+                         "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    def _chat(self, request):
+        settings = self.settings
+        messages = request["messages"]
+        tokens = _reply_tokens(settings.reply, messages, request.get("max_tokens"))
+        usage = _usage(messages, len(tokens))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = request.get("model")
+
+        if not request.get("stream"):
+            time.sleep(settings.latency + settings.token_latency * len(tokens))
+            self._send_json({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(tokens)}}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        def send_event(payload):
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        time.sleep(settings.latency)
+        for i, token in enumerate(tokens):
+            time.sleep(settings.token_latency)
+            send_event({"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "finish_reason": None,
+                                     "delta": {"content": token if i == 0 else " " + token}}]})
+        send_event({"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop", "delta": {}}]})
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send_event({"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=8555, latency=0.0, token_latency=0.0, dim=1536, reply=default_reply, background=False, rpm=None,
+          error_rate=0.0):
+    """Run the fake API on 127.0.0.1:port; with background=True return the server after starting a thread.
+
+    rpm rejects requests beyond rpm / 60 per second with 429s; error_rate is the fraction answered with a 500.
+    """
+    settings = SimpleNamespace(latency=latency, token_latency=token_latency, dim=dim, reply=reply, requests=0,
+                               rpm=rpm, error_rate=error_rate, rejected=0, lock=threading.Lock(),
+                               window_start=0.0, window_count=0)
+    handler = type("FakeAPIHandler", (_FakeAPIHandler,), {"settings": settings})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.settings = settings
+
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    print(f"Fake OpenAI API on http://127.0.0.1:{server.server_port}/v1")
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake OpenAI API for offline runs and load tests.")
+    parser.add_argument("--port", type=int, default=8555)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each response starts")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds per generated token")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--rpm", type=int, default=None, help="Requests per minute before answering 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 500")
+    args = parser.parse_args()
+    serve(args.port, args.latency, args.token_latency, args.dim, rpm=args.rpm, error_rate=args.error_rate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Build approximate-nearest-neighbour variants of the review index and measure their recall.
+
+The flat faiss_index.idx stays the source of truth: every variant is built from its vectors
+and scored against it, so memory and latency can be traded for recall using real numbers.
+
+Usage:
+    python index_variants.py --type ivf
+    python index_variants.py --type hnsw --hnsw-m 32 --ef-search 16 64 128
+    python index_variants.py --type ivfpq --pq-m 64 --nprobe 8 32 64
+"""
+import argparse
+import os
+import time
+import numpy as np
+import faiss
+
+INDEX_TYPES = ["flat", "ivf", "hnsw", "ivfpq"]
+
+
+def variant_path(index_path, index_type):
+    """Return the file name of an index variant, e.g. faiss_index_ivf.idx."""
+    if index_type == "flat":
+        return index_path
+    root, ext = os.path.splitext(index_path)
+    return f"{root}_{index_type}{ext}"
+
+
+def build_index(vectors, index_type, nlist=None, pq_m=64, pq_bits=8, hnsw_m=32, ef_construction=200):
+    """Build an inner-product index of the given type over unit-length vectors."""
+    n, d = vectors.shape
+    metric = faiss.METRIC_INNER_PRODUCT
+    # Rule of thumb from the FAISS wiki: around 4 * sqrt(n) inverted lists
+    nlist = nlist or max(1, int(4 * np.sqrt(n)))
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(d)
+    elif index_type == "ivf":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatIP(d), d, nlist, metric)
+    elif index_type == "ivfpq":
+        index = faiss.IndexIVFPQ(faiss.IndexFlatIP(d), d, nlist, pq_m, pq_bits, metric)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, hnsw_m, metric)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+
+    # Lets the retriever reconstruct a product's vectors for filtered search when review_embeddings.npy
+    # is missing; IVFPQ reconstructions are PQ approximations, not the original vectors
+    if index_type in ("ivf", "ivfpq"):
+        index.make_direct_map()
+
+    return index
+
+
+def tune_index(index, nprobe=None, ef_search=None):
+    """Apply query-time search parameters to an IVF or HNSW index."""
+    params = faiss.ParameterSpace()
+    if nprobe is not None and faiss.try_extract_index_ivf(index) is not None:
+        params.set_index_parameter(index, "nprobe", nprobe)
+    if ef_search is not None and hasattr(index, "hnsw"):
+        params.set_index_parameter(index, "efSearch", ef_search)
+    return index
+
+
+def load_index(index_path, index_type="flat", nprobe=None, ef_search=None, mmap=False):
+    """Read a flat index or one of its variants and apply search parameters.
+
+    With mmap the stored vectors stay in the file's page cache instead of being copied onto the
+    heap, so processes that load the same index share one copy.
+    """
+    path = variant_path(index_path, index_type)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found. Build it with: python index_variants.py --type {index_type}")
+
+    index = faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC) if mmap else faiss.read_index(path)
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+
+    return tune_index(index, nprobe=nprobe, ef_search=ef_search)
+
+
+def index_size_mb(index):
+    """Return the serialized size of an index in megabytes."""
+    return faiss.serialize_index(index).nbytes / 1e6
+
+
+def sample_queries(vectors, n_queries=500, noise=0.05, seed=0):
+    """Sample database vectors and perturb them so queries are not exact self-matches."""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + rng.normal(scale=noise, size=(len(picks), vectors.shape[1])).astype("float32")
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def recall_at_k(flat_index, ann_index, queries, k=10):
+    """Return (recall@k against the flat index, milliseconds per query) for an ANN index."""
+    _, truth = flat_index.search(queries, k)
+
+    start = time.perf_counter()
+    _, found = ann_index.search(queries, k)
+    ms_per_query = (time.perf_counter() - start) * 1000 / len(queries)
+
+    hits = sum(len(set(t[t >= 0]) & set(f[f >= 0])) for t, f in zip(truth, found))
+    return hits / truth.size, ms_per_query
+
+
+def report(flat_index, ann_index, queries, index_type, k=10, nprobes=(), ef_searches=()):
+    """Print recall@k, latency and memory for each search setting of a variant."""
+    print(f"flat: {index_size_mb(flat_index):.1f} MB | {index_type}: {index_size_mb(ann_index):.1f} MB")
+    print(f"{'setting':<16}{'recall@' + str(k):>12}{'ms/query':>12}")
+
+    _, flat_ms = recall_at_k(flat_index, flat_index, queries, k)
+    print(f"{'flat (exact)':<16}{1.0:>12.4f}{flat_ms:>12.3f}")
+
+    if index_type in ("ivf", "ivfpq"):
+        settings = [(f"nprobe={value}", {"nprobe": value}) for value in nprobes]
+    elif index_type == "hnsw":
+        settings = [(f"efSearch={value}", {"ef_search": value}) for value in ef_searches]
+    else:
+        settings = []
+
+    for label, params in settings:
+        tune_index(ann_index, **params)
+        recall, ms = recall_at_k(flat_index, ann_index, queries, k)
+        print(f"{label:<16}{recall:>12.4f}{ms:>12.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and evaluate ANN variants of the review index.")
+    parser.add_argument("--index-path", default="faiss_index.idx")
+    parser.add_argument("--type", choices=INDEX_TYPES[1:], required=True)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--pq-m", type=int, default=64, help="PQ sub-quantizers, must divide the dimension")
+    parser.add_argument("--pq-bits", type=int, default=8)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--eval-only", action="store_true", help="Evaluate an existing variant without rebuilding")
+    args = parser.parse_args()
+
+    flat_index = faiss.read_index(args.index_path)
+    vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+    faiss.normalize_L2(vectors)
+
+    out_path = variant_path(args.index_path, args.type)
+    if args.eval_only:
+        ann_index = load_index(args.index_path, args.type)
+    else:
+        start = time.perf_counter()
+        ann_index = build_index(
+            vectors, args.type, nlist=args.nlist, pq_m=args.pq_m, pq_bits=args.pq_bits,
+            hnsw_m=args.hnsw_m, ef_construction=args.ef_construction
+        )
+        faiss.write_index(ann_index, out_path)
+        print(f"Built {out_path} with {ann_index.ntotal} vectors in {time.perf_counter() - start:.1f}s")
+
+    report(flat_index, ann_index, sample_queries(vectors, args.queries), args.type,
+           k=args.k, nprobes=args.nprobe, ef_searches=args.ef_search)
+
+    from review_table import EMBEDDINGS_PATH
+    if args.type == "ivfpq" and not os.path.exists(EMBEDDINGS_PATH):
+        print(f"{EMBEDDINGS_PATH} not found: product-filtered search on this index will score PQ-reconstructed "
+              f"vectors, so its results are approximate. Write it with: python review_table.py convert")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""Append new reviews to the search data as delta segments, without rebuilding faiss_index.idx.
+
+ingest streams rows in the Amazon US reviews TSV format (plain, gzipped or stdin), keeps the
+shampoo reviews, splits long reviews into chunks and embeds them in batches with the embedder
+that built the index. Each batch becomes a segment under segments/ (a Feather table and a .npy
+of vectors) and is listed in segments/manifest.json. ReviewRetriever polls the manifest and
+adds new segment rows behind the base rows, so a running app picks them up without a restart.
+
+Row ids never change: segments are listed in the order they were written, and compaction,
+which runs in the background while ingesting (or on demand), merges a run of segments into one
+with the same rows in the same order. The manifest is replaced atomically under a file lock,
+so ingest and compact can run from different processes.
+
+Usage:
+    python ingest.py ingest amazon_reviews_us_Beauty_v1_00.tsv.gz --batch-size 500
+    zcat new_reviews.tsv.gz | python ingest.py ingest -
+    python ingest.py compact
+    python ingest.py status
+"""
+import argparse
+import csv
+import fcntl
+import gzip
+import html
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from review_table import REVIEW_COLUMNS
+from token_budget import count_tokens
+
+SEGMENTS_DIR = "segments"
+MANIFEST = "manifest.json"
+
+# Columns of the Amazon US reviews dataset (amazon_reviews_us_*.tsv)
+TSV_COLUMNS = [
+    "marketplace", "customer_id", "review_id", "product_id", "product_parent", "product_title", "product_category",
+    "star_rating", "helpful_votes", "total_votes", "vine", "verified_purchase", "review_headline", "review_body",
+    "review_date",
+]
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_TAG = re.compile(r"<[^>]+>")
+
+
+def manifest_path(segments_dir=SEGMENTS_DIR):
+    return os.path.join(segments_dir, MANIFEST)
+
+
+def read_manifest(segments_dir=SEGMENTS_DIR):
+    """Return the manifest, or None when nothing has been ingested."""
+    try:
+        with open(manifest_path(segments_dir)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(segments_dir, manifest):
+    tmp = manifest_path(segments_dir) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, manifest_path(segments_dir))
+
+
+@contextmanager
+def _locked(segments_dir):
+    """Hold the segment directory's lock while the manifest is read and replaced."""
+    os.makedirs(segments_dir, exist_ok=True)
+    with open(os.path.join(segments_dir, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def load_segment(segments_dir, name):
+    """Return (reviews DataFrame, memory-mapped vectors) of one segment."""
+    path = os.path.join(segments_dir, name)
+    df = pd.read_feather(os.path.join(path, "reviews.feather"))
+    return df, np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+
+
+def _write_segment(segments_dir, name, df, vectors):
+    # Written under a temporary name and renamed, so a listed segment is always complete
+    tmp = os.path.join(segments_dir, f".{name}.tmp")
+    os.makedirs(tmp, exist_ok=True)
+    df.reset_index(drop=True).to_feather(os.path.join(tmp, "reviews.feather"), compression="uncompressed")
+    np.save(os.path.join(tmp, "embeddings.npy"), np.asarray(vectors, dtype="float32"))
+    os.replace(tmp, os.path.join(segments_dir, name))
+
+
+def append_segment(segments_dir, df, vectors, embedder_name, base_rows):
+    """Write df and its vectors as a new segment and list it in the manifest; returns its name."""
+    with _locked(segments_dir):
+        manifest = read_manifest(segments_dir) or {
+            "embedder": embedder_name, "dim": int(vectors.shape[1]), "base_rows": base_rows, "next_id": 1,
+            "segments": [],
+        }
+        if manifest["embedder"] != embedder_name or manifest["base_rows"] != base_rows:
+            raise ValueError(f"{segments_dir} holds segments for {manifest['embedder']} over {manifest['base_rows']} "
+                             f"base rows, not {embedder_name} over {base_rows}")
+        name = f"seg-{manifest['next_id']:06d}"
+        _write_segment(segments_dir, name, df, vectors)
+        manifest["next_id"] += 1
+        manifest["segments"].append({"name": name, "rows": len(df), "created": time.time()})
+        _write_manifest(segments_dir, manifest)
+    return name
+
+
+def compact(segments_dir=SEGMENTS_DIR, min_segments=4, stale_after=3600):
+    """Merge every segment listed now into one (segments appended meanwhile stay after it).
+
+    Returns the number of segments merged; nothing happens below min_segments or while another
+    compaction (started less than stale_after seconds ago) is running.
+    """
+    with _locked(segments_dir):
+        manifest = read_manifest(segments_dir)
+        if not manifest or len(manifest["segments"]) < min_segments:
+            return 0
+        if time.time() - manifest.get("compacting", 0) < stale_after:
+            return 0
+        merging = list(manifest["segments"])
+        name = f"seg-{manifest['next_id']:06d}"
+        manifest["next_id"] += 1
+        manifest["compacting"] = time.time()
+        _write_manifest(segments_dir, manifest)
+
+    # The slow part runs unlocked so ingest can keep appending
+    start = time.perf_counter()
+    try:
+        parts = [load_segment(segments_dir, segment["name"]) for segment in merging]
+        df = pd.concat([part for part, _ in parts], ignore_index=True)
+        _write_segment(segments_dir, name, df, np.vstack([vectors for _, vectors in parts]))
+    finally:
+        with _locked(segments_dir):
+            manifest = read_manifest(segments_dir)
+            manifest.pop("compacting", None)
+            if os.path.exists(os.path.join(segments_dir, name)):
+                # Appends only add to the tail, so the merged run is still the head of the list
+                manifest["segments"] = [{"name": name, "rows": len(df), "created": time.time()}] \
+                    + manifest["segments"][len(merging):]
+            _write_manifest(segments_dir, manifest)
+
+    # Retrievers copy segment rows as they load them; one caught mid-load by this retries on its next poll
+    for segment in merging:
+        shutil.rmtree(os.path.join(segments_dir, segment["name"]), ignore_errors=True)
+    print(f"Compacted {len(merging)} segments ({len(df)} rows) into {name} in {time.perf_counter() - start:.1f}s")
+    return len(merging)
+
+
+def clean_text(text):
+    return re.sub(r"\s+", " ", _TAG.sub(" ", html.unescape(text or ""))).strip()
+
+
+def chunk_text(text, max_tokens=300):
+    """Split text into pieces of at most about max_tokens, on sentence boundaries where possible."""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    chunks, current, used = [], [], 0
+    for sentence in _SENTENCE_END.split(text):
+        tokens = count_tokens(sentence)
+        if current and used + tokens > max_tokens:
+            chunks.append(" ".join(current))
+            current, used = [], 0
+        current.append(sentence)
+        used += tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def read_tsv(path):
+    """Yield the rows of an Amazon reviews TSV (".gz" or "-" for stdin) as dicts."""
+    if path == "-":
+        f = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", errors="replace")
+    elif path.endswith(".gz"):
+        f = gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    else:
+        f = open(path, encoding="utf-8", errors="replace")
+    try:
+        reader = csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+        header = next(reader, None)
+        columns = header if header and "review_body" in header else TSV_COLUMNS
+        if header and columns is TSV_COLUMNS:
+            yield dict(zip(columns, header))
+        for row in reader:
+            if len(row) == len(columns):
+                yield dict(zip(columns, row))
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def review_rows(rows, title_contains="shampoo", max_chunk_tokens=300, seen=()):
+    """Turn TSV rows into review table rows: filtered, cleaned, deduplicated and chunked."""
+    seen = set(seen)
+    for row in rows:
+        title = row.get("product_title", "")
+        if title_contains and title_contains.lower() not in title.lower():
+            continue
+        if row.get("review_id") in seen:
+            continue
+        seen.add(row.get("review_id"))
+        text = clean_text(f"{row.get('review_headline', '')}. {row.get('review_body', '')}")
+        for chunk in chunk_text(text, max_chunk_tokens):
+            yield {"product_title": title, "combined_context": chunk, "sentiment": None,
+                   "source_review_id": row.get("review_id")}
+
+
+def ingested_review_ids(segments_dir=SEGMENTS_DIR):
+    """Source review ids already in a segment, so re-running ingest on the same file adds nothing."""
+    manifest = read_manifest(segments_dir)
+    ids = set()
+    for segment in (manifest or {}).get("segments", []):
+        path = os.path.join(segments_dir, segment["name"], "reviews.feather")
+        ids.update(pd.read_feather(path, columns=["source_review_id"])["source_review_id"].dropna())
+    return ids
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ingest(path, embedder, base_rows, segments_dir=SEGMENTS_DIR, batch_size=500, workers=4, title_contains="shampoo",
+           max_chunk_tokens=300, compact_every=8):
+    """Embed and append the reviews of a TSV as segments; returns throughput stats.
+
+    Up to workers batches are embedded at once and written in order. Once compact_every segments
+    are listed, a background thread merges them.
+    """
+    start = time.perf_counter()
+    seen = ingested_review_ids(segments_dir)
+    stats = {"rows_read": 0, "chunks": 0, "segments": 0}
+
+    def counted(rows):
+        for row in rows:
+            stats["rows_read"] += 1
+            yield row
+
+    def embed(batch):
+        return batch, embedder.embed([row["combined_context"] for row in batch], use_cache=False)
+
+    compactor = None
+    rows = review_rows(counted(read_tsv(path)), title_contains, max_chunk_tokens, seen)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for batch in _batches(rows, batch_size):
+            pending.append(pool.submit(embed, batch))
+            if len(pending) < workers:
+                continue
+            batch, vectors = pending.pop(0).result()
+            compactor = _append(segments_dir, batch, vectors, embedder.name, base_rows, stats, start, compact_every,
+                                compactor)
+        for future in pending:
+            batch, vectors = future.result()
+            compactor = _append(segments_dir, batch, vectors, embedder.name, base_rows, stats, start, compact_every,
+                                compactor)
+
+    if compactor is not None:
+        compactor.join()
+    seconds = time.perf_counter() - start
+    stats.update(seconds=seconds, rows_per_second=stats["rows_read"] / seconds if seconds else 0.0,
+                 chunks_per_second=stats["chunks"] / seconds if seconds else 0.0)
+    return stats
+
+
+def _append(segments_dir, batch, vectors, embedder_name, base_rows, stats, start, compact_every, compactor):
+    name = append_segment(segments_dir, pd.DataFrame(batch, columns=REVIEW_COLUMNS + ["source_review_id"]),
+                          vectors, embedder_name, base_rows)
+    stats["chunks"] += len(batch)
+    stats["segments"] += 1
+    elapsed = time.perf_counter() - start
+    print(f"{name}: {stats['rows_read']} rows read, {stats['chunks']} chunks embedded "
+          f"({stats['rows_read'] / elapsed:.0f} rows/s)", flush=True)
+
+    listed = len(read_manifest(segments_dir)["segments"])
+    if listed >= compact_every and (compactor is None or not compactor.is_alive()):
+        compactor = threading.Thread(target=compact, args=(segments_dir, compact_every), daemon=True)
+        compactor.start()
+    return compactor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest new reviews as delta segments and compact them.")
+    parser.add_argument("command", choices=["ingest", "compact", "status"])
+    parser.add_argument("path", nargs="?", help="Amazon reviews TSV (.tsv, .tsv.gz or - for stdin)")
+    parser.add_argument("--segments-dir", default=SEGMENTS_DIR)
+    parser.add_argument("--index-path", default="faiss_index.idx")
+    parser.add_argument("--batch-size", type=int, default=500, help="Chunks per segment (and embedding batch)")
+    parser.add_argument("--workers", type=int, default=4, help="Batches embedded concurrently")
+    parser.add_argument("--title-contains", default="shampoo", help="Keep products whose title contains this")
+    parser.add_argument("--max-chunk-tokens", type=int, default=300)
+    parser.add_argument("--compact-every", type=int, default=8, help="Segments that trigger a compaction")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        manifest = read_manifest(args.segments_dir)
+        if not manifest:
+            print("No segments")
+            return
+        rows = sum(segment["rows"] for segment in manifest["segments"])
+        print(f"{len(manifest['segments'])} segments, {rows} rows over {manifest['base_rows']} base rows "
+              f"({manifest['embedder']})")
+        return
+    if args.command == "compact":
+        compact(args.segments_dir, min_segments=2)
+        return
+    if not args.path:
+        parser.error("ingest needs a TSV path")
+
+    import faiss
+    from dotenv import load_dotenv
+    from embedders import get_embedder, read_index_metadata
+    from embedding_cache import EMBEDDING_MODEL
+
+    load_dotenv()
+    # New vectors must come from the embedder that built the index
+    metadata = read_index_metadata(args.index_path)
+    kind, model = (metadata["embedder"] if metadata else f"openai:{EMBEDDING_MODEL}").split(":", 1)
+    kwargs = {"api_key": os.getenv("OpenAI_API_Key")} if kind == "openai" else {}
+    embedder = get_embedder(kind, model=model, **kwargs)
+    base_rows = faiss.read_index(args.index_path, faiss.IO_FLAG_MMAP_IFC).ntotal
+
+    stats = ingest(args.path, embedder, base_rows, args.segments_dir, args.batch_size, args.workers,
+                   args.title_contains, args.max_chunk_tokens, args.compact_every)
+    print(f"Ingested {stats['chunks']} chunks from {stats['rows_read']} rows in {stats['segments']} segments: "
+          f"{stats['rows_per_second']:.0f} rows/s, {stats['chunks_per_second']:.0f} chunks/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Label the sentiment of every review in reviews_data.pkl once, offline.
+
+Labels are appended to a JSONL checkpoint as batches finish, so an interrupted run resumes
+where it stopped. When every row is labelled they are written back as a "sentiment" column,
+which SentimentAgent.analyze_reviews reuses instead of calling the model per request.
+
+ReviewRetriever reads reviews_data.feather when it exists, so the labels are written to that
+table too. Run review_table.py convert first (or again afterwards); labelling an older pickle
+and converting it later would drop the labels from the table.
+
+Usage:
+    python review_table.py convert
+    python label_sentiment.py --batch-size 20 --workers 8
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from dotenv import load_dotenv
+from sentiment import SentimentAgent, SENTIMENT_LABELS
+from client_pool import get_client
+from review_table import TABLE_PATH, write_table
+
+
+def load_checkpoint(checkpoint_path):
+    """Return {row position: label} for every row already labelled."""
+    labels = {}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            for line in f:
+                # A crash can leave a half-written last line
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                labels[record["row"]] = record["sentiment"]
+    return labels
+
+
+def label_reviews(agent, df, checkpoint_path, batch_size=20, workers=8):
+    """Label all unlabelled rows of df in concurrent batches, appending results to the checkpoint."""
+    labels = load_checkpoint(checkpoint_path)
+    todo = [row for row in range(len(df)) if labels.get(row) not in SENTIMENT_LABELS]
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    print(f"{len(labels)} rows already labelled, {len(todo)} to go in {len(batches)} batches")
+
+    texts = df["combined_context"].tolist()
+    start = time.perf_counter()
+    done = 0
+
+    with open(checkpoint_path, "a") as checkpoint, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(agent.label_texts, [texts[row] for row in batch]): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                sentiments = future.result()
+            except Exception as e:
+                print(f"Batch starting at row {batch[0]} failed: {e}")
+                continue
+
+            # "error" rows are left out of the checkpoint so the next run retries them
+            for row, sentiment in zip(batch, sentiments):
+                if sentiment in SENTIMENT_LABELS:
+                    labels[row] = sentiment
+                    checkpoint.write(json.dumps({"row": row, "sentiment": sentiment}) + "\n")
+            checkpoint.flush()
+
+            done += len(batch)
+            print(f"{done}/{len(todo)} rows ({done / (time.perf_counter() - start):.1f} rows/s)")
+
+    return labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute review sentiment labels.")
+    parser.add_argument("--data-path", default="reviews_data.pkl")
+    parser.add_argument("--output-path", default=None, help="Defaults to overwriting --data-path")
+    parser.add_argument("--table-path", default=TABLE_PATH, help="Feather table to update too, if it exists")
+    parser.add_argument("--checkpoint-path", default="sentiment_labels.jsonl")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    load_dotenv()
+    api_key = os.getenv("OpenAI_API_Key")
+    agent = SentimentAgent(api_key=api_key, client=get_client(api_key, lane="batch"))
+    df = pd.read_pickle(args.data_path)
+
+    labels = label_reviews(agent, df, args.checkpoint_path, args.batch_size, args.workers)
+
+    # Rows that still failed stay empty and are labelled live by analyze_reviews
+    df["sentiment"] = pd.Series(labels, dtype="object").reindex(range(len(df))).values
+    df.to_pickle(args.output_path or args.data_path)
+    print(f"Wrote {df['sentiment'].notna().sum()}/{len(df)} labels to {args.output_path or args.data_path}")
+    if os.path.exists(args.table_path):
+        write_table(df, args.table_path)
+        print(f"Updated {args.table_path}")
+
+
+if __name__ == "__main__":
+    main()
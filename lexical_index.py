@@ -0,0 +1,249 @@
+"""BM25 inverted index over combined_context, for lexical and hybrid retrieval.
+
+Dense ada-002 retrieval misses queries that hinge on a rare word ("ketoconazole", "sulfate-free");
+BM25 catches those and needs no embedding call. Postings are stored CSR-style (term offsets into
+flat doc id / weight arrays) with the BM25 weight of every posting precomputed, so scoring a
+query is a gather and a sum. The index is saved next to the data and rebuilt when the data changes.
+Reviews ingested as segments (ingest.py) get a small in-memory index of their own, scored with the
+saved index's corpus statistics, so new reviews never invalidate the saved file.
+
+Usage:
+    python lexical_index.py build
+    python lexical_index.py eval --queries queries.txt
+    python lexical_index.py eval --labels labelled_queries.jsonl
+"""
+import argparse
+import json
+import os
+import re
+import time
+from collections import Counter
+import numpy as np
+
+LEXICAL_INDEX_PATH = "bm25_index.npz"
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has", "have", "i", "in", "is", "it",
+    "its", "my", "of", "on", "or", "so", "that", "the", "this", "to", "was", "were", "with", "you", "what",
+    "which", "does", "do", "best", "good", "shampoo",
+}
+
+
+def tokenize(text):
+    """Lowercase word tokens without stopwords; hyphenated words also yield their parts."""
+    tokens = []
+    for token in _TOKEN.findall(str(text).lower()):
+        if "-" in token:
+            tokens.extend(part for part in token.split("-") if part not in STOPWORDS)
+        if token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Merge ranked lists of row ids; returns [(row id, fused score)] best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, row_id in enumerate(ranking):
+            scores[row_id] = scores.get(row_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+class BM25Index:
+    def __init__(self, vocabulary, offsets, doc_ids, weights, n_docs, source_mtime=0.0, avg_length=1.0):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.n_docs = n_docs
+        self.source_mtime = source_mtime
+        self.avg_length = avg_length
+
+    @classmethod
+    def build(cls, texts, k1=1.5, b=0.75, source_mtime=0.0, reference=None, first_id=0):
+        """Index an iterable of documents; document ids are their positions plus first_id.
+
+        With a reference index over the rest of the corpus, document frequencies and the average
+        length include the reference's, so the two indexes' scores can be compared.
+        """
+        postings = {}
+        doc_lengths = []
+        for doc_id, text in enumerate(texts, start=first_id):
+            counts = Counter(tokenize(text))
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        n_docs = len(doc_lengths)
+        doc_lengths = np.asarray(doc_lengths, dtype="float32")
+        avg_length = float(doc_lengths.mean()) if n_docs else 1.0
+        corpus_docs = n_docs
+        if reference is not None:
+            corpus_docs += reference.n_docs
+            avg_length = reference.avg_length
+
+        vocabulary = {}
+        offsets = [0]
+        doc_id_chunks, weight_chunks = [], []
+        for term_id, (term, entries) in enumerate(sorted(postings.items())):
+            vocabulary[term] = term_id
+            ids = np.fromiter((doc_id for doc_id, _ in entries), dtype="int32", count=len(entries))
+            tfs = np.fromiter((tf for _, tf in entries), dtype="float32", count=len(entries))
+            doc_freq = len(entries) + (reference.doc_freq(term) if reference is not None else 0)
+            idf = np.log(1 + (corpus_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+            norm = k1 * (1 - b + b * doc_lengths[ids - first_id] / avg_length)
+            doc_id_chunks.append(ids)
+            weight_chunks.append((idf * tfs * (k1 + 1) / (tfs + norm)).astype("float32"))
+            offsets.append(offsets[-1] + len(entries))
+
+        return cls(
+            vocabulary,
+            np.asarray(offsets, dtype="int64"),
+            np.concatenate(doc_id_chunks) if doc_id_chunks else np.zeros(0, dtype="int32"),
+            np.concatenate(weight_chunks) if weight_chunks else np.zeros(0, dtype="float32"),
+            n_docs,
+            source_mtime,
+            avg_length,
+        )
+
+    def doc_freq(self, term):
+        """Number of documents containing term."""
+        term_id = self.vocabulary.get(term)
+        return 0 if term_id is None else int(self.offsets[term_id + 1] - self.offsets[term_id])
+
+    def save(self, path=LEXICAL_INDEX_PATH):
+        terms = np.asarray(sorted(self.vocabulary, key=self.vocabulary.get))
+        np.savez(path, terms=terms, offsets=self.offsets, doc_ids=self.doc_ids, weights=self.weights,
+                 meta=np.asarray([self.n_docs, self.source_mtime, self.avg_length], dtype="float64"))
+
+    @classmethod
+    def load(cls, path=LEXICAL_INDEX_PATH):
+        with np.load(path) as data:
+            vocabulary = {term: term_id for term_id, term in enumerate(data["terms"].tolist())}
+            n_docs, source_mtime, avg_length = data["meta"]
+            return cls(vocabulary, data["offsets"], data["doc_ids"], data["weights"], int(n_docs), float(source_mtime),
+                       float(avg_length))
+
+    def search(self, query, top_k=10, ids=None):
+        """Return (scores, row ids) of the top_k documents, best first, optionally restricted to ids."""
+        ranges = [
+            (self.offsets[term_id], self.offsets[term_id + 1])
+            for term_id in (self.vocabulary.get(term) for term in set(tokenize(query))) if term_id is not None
+        ]
+        if not ranges:
+            return np.zeros(0, dtype="float32"), np.zeros(0, dtype="int64")
+
+        docs = np.concatenate([self.doc_ids[start:end] for start, end in ranges])
+        weights = np.concatenate([self.weights[start:end] for start, end in ranges])
+        if ids is not None:
+            keep = np.isin(docs, ids)
+            docs, weights = docs[keep], weights[keep]
+
+        # Only documents that contain a query term are scored
+        candidates, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights).astype("float32")
+        if len(scores) > top_k:
+            top = np.argpartition(-scores, top_k)[:top_k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return scores[top], candidates[top].astype("int64")
+
+
+def load_or_build(texts, path=LEXICAL_INDEX_PATH, source_path=None):
+    """Load the saved index if it matches the data, otherwise build it and save it."""
+    source_mtime = os.path.getmtime(source_path) if source_path and os.path.exists(source_path) else 0.0
+    if os.path.exists(path):
+        index = BM25Index.load(path)
+        if index.n_docs == len(texts) and index.source_mtime == source_mtime:
+            return index
+
+    start = time.perf_counter()
+    index = BM25Index.build(texts, source_mtime=source_mtime)
+    index.save(path)
+    print(f"Built BM25 index over {index.n_docs} reviews ({len(index.vocabulary)} terms) "
+          f"in {time.perf_counter() - start:.1f}s")
+    return index
+
+
+def search_all(indexes, query, top_k=10, ids=None):
+    """Search indexes over disjoint documents (the saved one and the ingested rows') and merge by score."""
+    results = [index.search(query, top_k, ids=ids) for index in indexes if index is not None]
+    if len(results) == 1:
+        return results[0]
+    scores = np.concatenate([scores for scores, _ in results])
+    doc_ids = np.concatenate([doc_ids for _, doc_ids in results])
+    top = np.argsort(-scores, kind="stable")[:top_k]
+    return scores[top], doc_ids[top]
+
+
+def read_queries(queries_path=None, labels_path=None):
+    """Return [(query, relevant row ids or None)] from a labels JSONL, a text file or the evaluation log."""
+    if labels_path:
+        with open(labels_path) as f:
+            return [(record["query"], set(record["relevant"])) for record in map(json.loads, f) if record]
+    if queries_path:
+        with open(queries_path) as f:
+            return [(line.strip(), None) for line in f if line.strip()]
+
+    from eval_store import EvaluationStore
+    questions = EvaluationStore().to_dataframe()["question"].dropna().unique().tolist()
+    return [(question, None) for question in questions]
+
+
+def evaluate(retriever, queries, k=10, modes=("dense", "lexical", "hybrid")):
+    """Print recall@k (for labelled queries), overlap with the dense and lexical results and latency per mode.
+
+    Without labels there is no ground truth, so only the overlap columns are meaningful: they show
+    how far each mode departs from pure dense or pure lexical retrieval.
+    """
+    results = {mode: [] for mode in modes}
+    latencies = {mode: [] for mode in modes}
+    for query, _ in queries:
+        # Warm the embedding cache so dense latency reflects search, not one network call per mode
+        retriever.embed_query(query)
+        for mode in modes:
+            start = time.perf_counter()
+            ids, _ = retriever.get_top_k_ids(query, top_k=k, mode=mode)
+            latencies[mode].append((time.perf_counter() - start) * 1000)
+            results[mode].append(set(ids.tolist()))
+
+    def mean_overlap(found_sets, reference_sets):
+        overlaps = [len(found & reference) / min(len(reference), k)
+                    for found, reference in zip(found_sets, reference_sets) if reference]
+        return np.mean(overlaps) if overlaps else float("nan")
+
+    labels = [relevant for _, relevant in queries]
+    labelled = any(relevant is not None for relevant in labels)
+    print(f"{len(queries)} queries, k={k}" + ("" if labelled else " (no relevance labels, recall not measured)"))
+    print(f"{'mode':<10}{'recall@k':>10}{'vs dense':>10}{'vs lexical':>12}{'p50 ms':>10}{'p95 ms':>10}")
+    for mode in modes:
+        recall = mean_overlap(results[mode], [relevant or set() for relevant in labels])
+        vs_dense = mean_overlap(results[mode], results["dense"]) if "dense" in results else float("nan")
+        vs_lexical = mean_overlap(results[mode], results["lexical"]) if "lexical" in results else float("nan")
+        p50, p95 = np.percentile(latencies[mode], [50, 95])
+        print(f"{mode:<10}{recall:>10.3f}{vs_dense:>10.3f}{vs_lexical:>12.3f}{p50:>10.1f}{p95:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and evaluate the BM25 review index.")
+    parser.add_argument("command", choices=["build", "eval"])
+    parser.add_argument("--queries", default=None, help="Text file with one query per line")
+    parser.add_argument("--labels", default=None, help='JSONL of {"query": ..., "relevant": [row ids]}')
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from retriever import ReviewRetriever
+
+    load_dotenv()
+    if args.command == "build" and os.path.exists(LEXICAL_INDEX_PATH):
+        os.remove(LEXICAL_INDEX_PATH)
+    retriever = ReviewRetriever(api_key=os.getenv("OpenAI_API_Key"))
+    if args.command == "eval":
+        evaluate(retriever, read_queries(args.queries, args.labels), k=args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""Grid sweeps over summary generation parameters for several queries at once.
+
+Reviews are retrieved and labelled once per query; every (query, parameter combination) cell
+then generates and scores its answer concurrently, bounded by max_workers. Each cell is
+checkpointed in sweep_results.db as soon as its answer exists and again once it is scored, so
+re-running the same run_id after a crash only pays for the cells that did not finish.
+
+Usage:
+    python param_sweep.py --queries queries.txt --temperature 0.3 0.7 1.0 --top-p 1.0 0.9
+    python param_sweep.py --queries queries.txt --temperature 0.3 0.7 --run-id 1a2b3c4d   # resume
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+import pandas as pd
+from dotenv import load_dotenv
+from eval_store import STORE_PATH
+
+SWEEP_PATH = "sweep_results.db"
+
+BASELINE_PARAMS = {
+    "temperature": 0.3,
+    "max_tokens": 200,
+    "top_p": 1.0,
+    "frequency_penalty": 0.0,
+    "presence_penalty": 0.0
+}
+
+
+def parse_grid(grid_text):
+    """Parse {parameter: "comma-separated values"} into a grid, typed like the baseline values."""
+    grid = {name: [type(BASELINE_PARAMS[name])(float(value)) for value in text.split(",") if value.strip()]
+            for name, text in grid_text.items()}
+    expand_grid(grid)
+    return grid
+
+
+def expand_grid(grid):
+    """Return one parameter dict per combination; parameters missing from grid keep the baseline value.
+
+    Raises ValueError if a parameter lists the same value twice, which would run duplicate cells.
+    """
+    values = {name: list(grid.get(name) or [baseline]) for name, baseline in BASELINE_PARAMS.items()}
+    for name, options in values.items():
+        if len(set(options)) != len(options):
+            raise ValueError(f"{name} lists a value more than once: {options}")
+    return [dict(zip(values, combination)) for combination in itertools.product(*values.values())]
+
+
+def is_scored(metrics):
+    """True once a cell has every judge score; a failed judge call leaves None and the cell is rerun."""
+    from evaluation import LLM_METRICS
+    return metrics is not None and all(metrics.get(metric) is not None for metric in LLM_METRICS)
+
+
+def cell_key(query, product, params):
+    payload = json.dumps([query, product, sorted(params.items())])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class SweepStore:
+    def __init__(self, path=SWEEP_PATH):
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cells (
+                    run_id TEXT NOT NULL,
+                    cell_key TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    product TEXT,
+                    params TEXT NOT NULL,
+                    answer TEXT,
+                    metrics TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (run_id, cell_key)
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self, run_id):
+        """Return {cell_key: (answer, metrics or None)} for the cells of a run that have an answer."""
+        with closing(self._connect()) as conn, conn:
+            rows = conn.execute("SELECT cell_key, answer, metrics FROM cells WHERE run_id = ?", (run_id,)).fetchall()
+        return {key: (answer, json.loads(metrics) if metrics else None) for key, answer, metrics in rows}
+
+    def save(self, run_id, key, query, product, params, answer, metrics=None):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cells (run_id, cell_key, query, product, params, answer, metrics, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, key, query, product, json.dumps(params), answer,
+                 json.dumps(metrics) if metrics is not None else None, time.time())
+            )
+
+    def to_dataframe(self, run_id):
+        """Return the run as a tidy table: one row per cell with its parameters, answer and scores."""
+        with closing(self._connect()) as conn, conn:
+            rows = conn.execute(
+                "SELECT query, product, params, answer, metrics FROM cells WHERE run_id = ? ORDER BY query, params", (run_id,)
+            ).fetchall()
+
+        records = []
+        for query, product, params, answer, metrics in rows:
+            metrics = json.loads(metrics) if metrics else {}
+            metrics.pop("question", None)
+            metrics.pop("generated_answer", None)
+            records.append({"run_id": run_id, "query": query, "product": product, **json.loads(params),
+                            "answer": answer, **metrics})
+        return pd.DataFrame(records)
+
+
+def run_sweep(api_key, retriever, sentiment_agent, summary_agent, queries, grid, run_id=None, product=None,
+              max_workers=8, store=None, store_path=STORE_PATH, on_cell=None):
+    """Run every (query, parameter combination) cell not already finished under run_id; returns (run_id, DataFrame).
+
+    on_cell(done, total) is called as cells finish, e.g. to drive a progress bar.
+    """
+    from evaluation import evaluate_answer_cosine, or_none
+
+    run_id = run_id or uuid.uuid4().hex[:8]
+    store = store or SweepStore()
+    finished = store.load(run_id)
+    combinations = expand_grid(grid)
+
+    cells = [(query, params, cell_key(query, product, params)) for query in queries for params in combinations]
+    todo = [cell for cell in cells if not is_scored((finished.get(cell[2]) or (None, None))[1])]
+    if on_cell:
+        on_cell(len(cells) - len(todo), len(cells))
+    if not todo:
+        return run_id, store.to_dataframe(run_id)
+
+    # Retrieval and sentiment depend only on the query, so they run once per query
+    reviews = {}
+    pending_queries = list(dict.fromkeys(query for query, _, _ in todo))
+    batch = retriever.get_top_k_reviews_batch(pending_queries, product)
+    for query, top_reviews in zip(pending_queries, batch.to_frames()):
+        reviews[query] = sentiment_agent.analyze_reviews(top_reviews) if not top_reviews.empty else top_reviews
+
+    def run_cell(query, params, key):
+        if reviews[query].empty:
+            return
+        answer = (finished.get(key) or (None, None))[0]
+        if answer is None:
+            answer = or_none(summary_agent.generate_summary, query, reviews[query], **params)
+            if answer is None:
+                return
+            store.save(run_id, key, query, product, params, answer)
+
+        # One structured judge request per cell keeps the request count within rate limits
+        metrics = evaluate_answer_cosine(api_key, user_query=query, retrieved_reviews=reviews[query],
+                                         generated_answer=answer, store_path=store_path, single_call=True)
+        if not is_scored(metrics):
+            # Keep the answer only, so resuming the run asks the judge again
+            return
+        store.save(run_id, key, query, product, params, answer, metrics)
+
+    done = len(cells) - len(todo)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(run_cell, *cell) for cell in todo]
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Sweep cell failed, it will be retried on resume: {e}")
+            done += 1
+            if on_cell:
+                on_cell(done, len(cells))
+
+    return run_id, store.to_dataframe(run_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep summary generation parameters over several queries.")
+    parser.add_argument("--queries", required=True, help="Text file with one query per line")
+    parser.add_argument("--product", default=None)
+    parser.add_argument("--run-id", default=None, help="Resume an earlier run")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--output", default=None, help="CSV file for the results table")
+    for name in BASELINE_PARAMS:
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=float, nargs="+")
+    args = parser.parse_args()
+
+    from client_pool import get_client
+    from retriever import ReviewRetriever
+    from sentiment import SentimentAgent
+    from summary import SummaryAgent
+
+    load_dotenv()
+    api_key = os.getenv("OpenAI_API_Key")
+    with open(args.queries) as f:
+        queries = [line.strip() for line in f if line.strip()]
+    grid = {name: getattr(args, name) for name in BASELINE_PARAMS}
+    if grid["max_tokens"]:
+        grid["max_tokens"] = [int(value) for value in grid["max_tokens"]]
+    try:
+        expand_grid(grid)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # A sweep is bulk work: it yields to any interactive traffic sharing the pool
+    batch_client = get_client(api_key, lane="batch")
+    run_id, results = run_sweep(
+        api_key, ReviewRetriever(api_key=api_key), SentimentAgent(api_key=api_key, client=batch_client),
+        SummaryAgent(api_key=api_key, client=batch_client), queries, grid,
+        run_id=args.run_id, product=args.product, max_workers=args.workers,
+        on_cell=lambda done, total: print(f"{done}/{total} cells"),
+    )
+    print(f"Run {run_id}")
+    print(results.drop(columns=["answer"], errors="ignore").to_string())
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Retrieval, sentiment and summary for one question, with the two gpt-4o stages overlapped.
+
+Serially the answer waits for retrieval, then sentiment labelling, then summary generation.
+Here the summary starts as soon as retrieval finishes: reviews that have no precomputed label
+go into the prompt as "unlabelled" and the summary model judges their sentiment itself, while
+SentimentAgent labels them in parallel for the sentiment badges and the evaluation log.
+serial=True restores the strict order (labels first, then the answer) for quality comparisons.
+
+Every run records when each stage started and ended, so timings() shows the critical path
+next to what the same stages would take back to back.
+
+Usage:
+    python pipeline.py "does it help with dandruff" --repeat 5 --relabel
+    python pipeline.py "does it help with dandruff" --repeat 5 --relabel --serial
+"""
+import argparse
+import contextvars
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+import numpy as np
+from sentiment import SENTIMENT_LABELS, UNLABELLED
+from tracing import record
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pipeline")
+
+
+def _done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class PipelineRun:
+    """One question in flight: the retrieved reviews, the pending sentiment labels and stage times."""
+
+    def __init__(self, pipeline, user_query, serial):
+        self.pipeline = pipeline
+        self.user_query = user_query
+        self.serial = serial
+        self.reviews = None
+        self.stages = {}
+        self.time_to_first_token = None
+        self.stream_stats = {}
+        self._start = time.perf_counter()
+        self._sentiment = None
+
+    @contextmanager
+    def stage(self, name):
+        """Record the start and end of a stage as offsets from the start of the run."""
+        start = time.perf_counter() - self._start
+        try:
+            yield
+        finally:
+            self.stages[name] = (start, time.perf_counter() - self._start)
+
+    def _label(self, reviews):
+        with self.stage("sentiment"):
+            return self.pipeline.sentiment_agent.analyze_reviews(reviews)
+
+    def summary_input(self):
+        """Reviews for the summary prompt: labelled if the labels are ready, else marked unlabelled."""
+        if self._sentiment.done():
+            return self._sentiment.result()
+        reviews = self.reviews.copy()
+        if "sentiment" not in reviews:
+            reviews["sentiment"] = UNLABELLED
+        reviews.loc[~reviews["sentiment"].isin(SENTIMENT_LABELS), "sentiment"] = UNLABELLED
+        return reviews
+
+    def stream_answer(self, **generation_params):
+        """Yield the answer token by token (see SummaryAgent.generate_summary_stream)."""
+        start = time.perf_counter() - self._start
+        for token in self.pipeline.summary_agent.generate_summary_stream(self.user_query, self.summary_input(),
+                                                                        stats=self.stream_stats, **generation_params):
+            if self.time_to_first_token is None:
+                self.time_to_first_token = time.perf_counter() - self._start
+            yield token
+        self.stages["summary"] = (start, time.perf_counter() - self._start)
+
+    def answer(self, **generation_params):
+        """Return the whole answer at once."""
+        with self.stage("summary"):
+            answer = self.pipeline.summary_agent.generate_summary(self.user_query, self.summary_input(),
+                                                                  **generation_params)
+        self.time_to_first_token = self.stages["summary"][1]
+        return answer
+
+    def reviews_with_sentiment(self):
+        """The retrieved reviews with their sentiment labels, waiting for the labelling if needed."""
+        return self._sentiment.result()
+
+    def timings(self):
+        """Seconds per stage, the elapsed critical path ("total") and the back-to-back sum ("serial_estimate").
+
+        A streamed answer also reports its completion_tokens and tokens_per_second.
+        """
+        durations = {name: end - start for name, (start, end) in self.stages.items()}
+        total = max((end for _, end in self.stages.values()), default=0.0)
+        serial_estimate = sum(durations.values())
+        return {
+            **durations,
+            "time_to_first_token": self.time_to_first_token,
+            "completion_tokens": self.stream_stats.get("completion_tokens"),
+            "tokens_per_second": self.stream_stats.get("tokens_per_second"),
+            "total": total,
+            "serial_estimate": serial_estimate,
+            "saved": serial_estimate - total,
+        }
+
+    def finish(self):
+        """Wait for any outstanding labelling and export the run's timings as a trace span."""
+        self.reviews_with_sentiment()
+        timings = self.timings()
+        record("pipeline", timings["total"] * 1000, serial=self.serial, reviews=len(self.reviews),
+               **{key: value for key, value in timings.items() if value is not None and key != "total"})
+        return timings
+
+
+class ReviewPipeline:
+    def __init__(self, retriever, sentiment_agent, summary_agent, serial=False):
+        self.retriever = retriever
+        self.sentiment_agent = sentiment_agent
+        self.summary_agent = summary_agent
+        self.serial = serial
+
+    def start(self, user_query, selected_product=None, query_embedding=None, mode=None, serial=None, relabel=False):
+        """Retrieve the reviews and start (serial: finish) the sentiment labelling; returns a PipelineRun.
+
+        serial overrides the pipeline's default for this run; relabel ignores precomputed labels,
+        e.g. to time the sentiment stage.
+        """
+        run = PipelineRun(self, user_query, self.serial if serial is None else serial)
+        with run.stage("retrieval"):
+            run.reviews = self.retriever.get_top_k_reviews(user_query, selected_product=selected_product,
+                                                           query_embedding=query_embedding, mode=mode)
+            if relabel:
+                run.reviews = run.reviews.drop(columns=["sentiment"], errors="ignore")
+
+        already_labelled = "sentiment" in run.reviews and run.reviews["sentiment"].isin(SENTIMENT_LABELS).all()
+        if run.reviews.empty or already_labelled:
+            run._sentiment = _done(self.sentiment_agent.analyze_reviews(run.reviews) if not run.reviews.empty
+                                   else run.reviews)
+        elif run.serial:
+            run._sentiment = _done(run._label(run.reviews))
+        else:
+            # Copying the context keeps the sentiment spans in the same trace as the request
+            run._sentiment = _executor.submit(contextvars.copy_context().run, run._label, run.reviews)
+        return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the question pipeline, overlapped or serial.")
+    parser.add_argument("query")
+    parser.add_argument("--product", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--serial", action="store_true", help="Label sentiment before generating the answer")
+    parser.add_argument("--relabel", action="store_true", help="Ignore precomputed sentiment labels")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from retriever import ReviewRetriever
+    from sentiment import SentimentAgent
+    from summary import SummaryAgent
+
+    load_dotenv()
+    api_key = os.getenv("OpenAI_API_Key")
+    pipeline = ReviewPipeline(ReviewRetriever(api_key=api_key), SentimentAgent(api_key=api_key),
+                              SummaryAgent(api_key=api_key), serial=args.serial)
+
+    runs = []
+    for _ in range(args.repeat):
+        run = pipeline.start(args.query, selected_product=args.product, relabel=args.relabel)
+        if run.reviews.empty:
+            print("No reviews found")
+            return
+        "".join(run.stream_answer())
+        runs.append(run.finish())
+
+    print(f"{'serial' if args.serial else 'overlapped'} pipeline, median of {len(runs)} runs (seconds)")
+    for key in runs[0]:
+        values = [run[key] for run in runs if run.get(key) is not None]
+        if values:
+            print(f"  {key:<22}{np.median(values):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Process-wide agents shared by the Streamlit apps.
+
+Streamlit reruns the whole script on every widget change. st.cache_resource keeps one
+ReviewRetriever, SentimentAgent and SummaryAgent per process, shared by every session,
+so the pickle, the FAISS index and the OpenAI clients are only loaded once.
+"""
+import os
+import weakref
+import streamlit as st
+from retriever import ReviewRetriever
+from sentiment import SentimentAgent
+from summary import SummaryAgent
+from eval_queue import EvaluationQueue, start_workers
+from answer_cache import SemanticAnswerCache
+from tracing import serve_metrics
+
+DATA_FILES = [
+    "faiss_index.idx", "faiss_index.idx.json", "reviews_data.pkl", "reviews_data.feather", "review_embeddings.npy"
+]
+
+# Retrievers handed out by get_retriever; replaced ones are closed so their watcher threads stop
+_retrievers = weakref.WeakSet()
+
+
+def _data_version():
+    """Return the modification times of the data files; a replaced file changes the cache key."""
+    return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in DATA_FILES)
+
+
+# max_entries=1 drops the stale retriever as soon as the data files change
+@st.cache_resource(show_spinner="Loading review index...", max_entries=1)
+def _load_retriever(api_key, data_version):
+    return ReviewRetriever(api_key=api_key)
+
+
+@st.cache_resource(max_entries=4)
+def _load_sentiment_agent(api_key):
+    return SentimentAgent(api_key=api_key)
+
+
+@st.cache_resource(max_entries=4)
+def _load_summary_agent(api_key):
+    return SummaryAgent(api_key=api_key)
+
+
+# Keyed on the data version too: answers built from old data must not outlive it
+@st.cache_resource(max_entries=1)
+def _load_answer_cache(data_version, dim):
+    return SemanticAnswerCache(dim=dim)
+
+
+@st.cache_resource
+def _start_eval_workers(api_key, workers):
+    return start_workers(api_key, workers=workers)
+
+
+@st.cache_resource
+def start_metrics_endpoint(port=9464):
+    """Expose traced stage latencies at http://127.0.0.1:<port>/metrics, once per process."""
+    return serve_metrics(port)
+
+
+def get_retriever(api_key):
+    """Return the shared ReviewRetriever, reloading it if the data files changed on disk."""
+    retriever = _load_retriever(api_key, _data_version())
+    for stale in [other for other in _retrievers if other is not retriever]:
+        stale.close()
+        _retrievers.discard(stale)
+    _retrievers.add(retriever)
+    return retriever
+
+
+def get_sentiment_agent(api_key):
+    """Return the shared SentimentAgent."""
+    return _load_sentiment_agent(api_key)
+
+
+def get_summary_agent(api_key):
+    """Return the shared SummaryAgent."""
+    return _load_summary_agent(api_key)
+
+
+def get_answer_cache(dim=1536):
+    """Return the process-wide semantic answer cache for query embeddings of size dim."""
+    return _load_answer_cache(_data_version(), dim)
+
+
+def get_eval_queue(api_key, workers=1):
+    """Return the evaluation queue, starting this process's background workers on first use."""
+    _start_eval_workers(api_key, workers)
+    return EvaluationQueue()
+
+
+def invalidate_resources():
+    """Drop every cached agent and cached answer so the next rerun rebuilds them from the current files.
+
+    The data-version key only notices files whose modification time changed; this covers the
+    rest, e.g. data files copied in with their original timestamps.
+    """
+    for retriever in list(_retrievers):
+        retriever.close()
+    _retrievers.clear()
+    _load_retriever.clear()
+    _load_sentiment_agent.clear()
+    _load_summary_agent.clear()
+    _load_answer_cache.clear()
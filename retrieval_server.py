@@ -0,0 +1,392 @@
+"""Retrieval as a local HTTP service: N worker processes sharing one read-only copy of the index.
+
+The parent loads ReviewRetriever once with the FAISS index and embeddings memory-mapped, binds
+the socket and forks the workers, so the index pages, the Feather table and the BM25 arrays are
+shared instead of copied into every Streamlit replica. Inside each worker a MicroBatcher gathers
+the requests that arrive within a few milliseconds of each other and answers them with one
+embedding request and one index search.
+
+POST /search {"query": ..., "product": null, "top_k": 10, "mode": null} returns the same columns as
+get_top_k_reviews; GET /products lists the products; GET /health reports the worker's counters.
+RetrievalClient wraps these for code that would otherwise hold its own ReviewRetriever.
+
+Usage:
+    python retrieval_server.py serve --workers 4 --port 8600
+    python retrieval_server.py serve --workers 4 --socket /tmp/retrieval.sock
+    python retrieval_server.py benchmark --requests 500 --concurrency 32
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+
+DEFAULT_PORT = 8600
+SAMPLE_QUERIES = [
+    "best shampoo for dandruff", "does it dry out my hair", "good for fine hair volume",
+    "ketoconazole shampoo that works", "safe for color treated hair", "does it leave residue",
+    "is it worth the price", "does it lather well", "helps an itchy scalp", "sulfate-free recommendation",
+]
+
+
+class MicroBatcher:
+    """Collects concurrent searches for up to max_wait_ms and runs them as batched retrieval calls."""
+
+    def __init__(self, retriever, max_batch=32, max_wait_ms=5):
+        self.retriever = retriever
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.requests = 0
+        self.batches = 0
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def search(self, query, product=None, top_k=10, mode=None):
+        """Return (ids, scores, batch size) for one query once its batch has been searched."""
+        future = Future()
+        self._queue.put((query, product, top_k, mode, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.perf_counter(), 0)))
+                except queue.Empty:
+                    break
+            self._search(batch)
+
+    def _search(self, batch):
+        self.requests += len(batch)
+        self.batches += 1
+
+        # get_top_k_ids_batch takes one filter, mode and k, so each combination is its own call
+        groups = {}
+        for item in batch:
+            groups.setdefault(item[1:4], []).append(item)
+        for (product, top_k, mode), items in groups.items():
+            try:
+                results = self.retriever.get_top_k_ids_batch([item[0] for item in items], product, top_k, mode)
+            except Exception as e:
+                for item in items:
+                    item[4].set_exception(e)
+                continue
+            for item, (ids, scores) in zip(items, results):
+                item[4].set_result((ids, scores, len(batch)))
+
+    def stats(self):
+        return {"pid": os.getpid(), "requests": self.requests, "batches": self.batches,
+                "mean_batch": self.requests / self.batches if self.batches else 0.0}
+
+
+def review_records(df, ids, scores):
+    """Rows of get_top_k_reviews as JSON-ready dicts (NaN scores become null)."""
+    records = df.iloc[ids].to_dict(orient="records")
+    for position, (record, row_id) in enumerate(zip(records, ids.tolist())):
+        record["review_id"] = row_id
+        for column, values in scores.items():
+            value = float(values[position])
+            record[column] = None if np.isnan(value) else value
+    return records
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _reply(self, status, payload):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/products":
+            self._reply(200, {"products": list(self.server.retriever.get_product_list())})
+        elif self.path == "/health":
+            self._reply(200, self.server.batcher.stats())
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/search":
+            self._reply(404, {"error": "not found"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            query = request["query"]
+        except (ValueError, KeyError):
+            self._reply(400, {"error": 'expected a JSON body with "query"'})
+            return
+
+        retriever = self.server.retriever
+        product = request.get("product")
+        if (product and product not in retriever.catalog) or len(retriever.df) == 0:
+            self._reply(200, {"reviews": [], "batch": 0, "worker": os.getpid()})
+            return
+        try:
+            ids, scores, batch = self.server.batcher.search(query, product, int(request.get("top_k", 10)),
+                                                            request.get("mode"))
+        except Exception as e:
+            self._reply(502, {"error": repr(e)})
+            return
+        self._reply(200, {"reviews": review_records(retriever.df, ids, scores), "batch": batch,
+                          "worker": os.getpid()})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RetrievalHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 resets connections as soon as a burst of users arrives
+    request_queue_size = 128
+
+
+class UnixHTTPServer(RetrievalHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # HTTPServer.server_bind expects a (host, port) address
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+    def get_request(self):
+        request, _ = self.socket.accept()
+        return request, ("local", 0)
+
+
+def _worker(server, max_batch, max_wait_ms):
+    import faiss
+
+    # One search thread per process; the processes themselves use the cores
+    faiss.omp_set_num_threads(1)
+    server.batcher = MicroBatcher(server.retriever, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    signal.signal(signal.SIGTERM, lambda *_: os._exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        os._exit(0)
+
+
+def serve(workers=1, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None, max_batch=32, max_wait_ms=5,
+          **retriever_kwargs):
+    """Load the retriever, bind the socket and fork the workers; returns when they have all exited."""
+    from retriever import ReviewRetriever
+
+    retriever = ReviewRetriever(mmap_index=True, **retriever_kwargs)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, _Handler)
+    else:
+        server = RetrievalHTTPServer((host, port), _Handler)
+    server.retriever = retriever
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            _worker(server, max_batch, max_wait_ms)
+        children.append(pid)
+    print(f"Serving {len(retriever.df)} reviews on {socket_path or f'http://{host}:{port}'} "
+          f"with {workers} workers (pids {', '.join(map(str, children))})", flush=True)
+
+    def stop(*_):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for pid in children:
+        while True:
+            try:
+                os.waitpid(pid, 0)
+                break
+            except InterruptedError:
+                continue
+    server.server_close()
+    if socket_path and os.path.exists(socket_path):
+        os.remove(socket_path)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=30):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class RetrievalClient:
+    """The read side of ReviewRetriever, answered by a retrieval server.
+
+    address is an http://host:port URL or the path of the server's Unix socket.
+    """
+
+    def __init__(self, address=f"http://127.0.0.1:{DEFAULT_PORT}", timeout=30):
+        self.address = address
+        self.timeout = timeout
+
+    def _request(self, method, path, payload=None):
+        if self.address.startswith("http"):
+            url = urllib.parse.urlsplit(self.address)
+            conn = http.client.HTTPConnection(url.hostname, url.port, timeout=self.timeout)
+        else:
+            conn = _UnixHTTPConnection(self.address, timeout=self.timeout)
+        try:
+            body = json.dumps(payload) if payload is not None else None
+            conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            result = json.loads(response.read())
+        finally:
+            conn.close()
+        if response.status != 200:
+            raise RuntimeError(f"Retrieval server returned {response.status}: {result.get('error')}")
+        return result
+
+    def get_product_list(self):
+        return self._request("GET", "/products")["products"]
+
+    def search(self, query_text, selected_product=None, top_k=10, mode=None):
+        """Return the raw response: {"reviews": [...], "batch": batch size, "worker": pid}."""
+        return self._request("POST", "/search",
+                             {"query": query_text, "product": selected_product, "top_k": top_k, "mode": mode})
+
+    def get_top_k_reviews(self, query_text, selected_product=None, top_k=10, mode=None):
+        return pd.DataFrame(self.search(query_text, selected_product, top_k, mode)["reviews"])
+
+    def health(self):
+        return self._request("GET", "/health")
+
+
+def _memory_mb(pids):
+    """Total RSS and PSS of the given processes; PSS splits shared pages between the processes using them."""
+    totals = {"Rss": 0, "Pss": 0}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key in totals:
+                        totals[key] += int(value.split()[0])
+        except OSError:
+            pass
+    return totals["Rss"] / 1024, totals["Pss"] / 1024
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def _wait_until_up(client, process, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Retrieval server exited during startup")
+        try:
+            return client.health()
+        except (OSError, http.client.HTTPException):
+            time.sleep(0.2)
+    raise TimeoutError("Retrieval server did not start")
+
+
+def benchmark(worker_counts, queries, requests=500, concurrency=32, port=DEFAULT_PORT, max_batch=32, max_wait_ms=5,
+              mode=None):
+    """Serve with each worker count in turn and print throughput, latency, batch size and memory.
+
+    Queries get a unique suffix so every request pays for its embedding, as new user questions do.
+    """
+    print(f"{requests} requests, {concurrency} concurrent clients")
+    print(f"{'workers':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'batch':>8}{'RSS MB':>10}{'PSS MB':>10}")
+    for workers in worker_counts:
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "serve", "--workers", str(workers), "--port", str(port),
+             "--max-batch", str(max_batch), "--max-wait-ms", str(max_wait_ms)],
+            stdout=subprocess.DEVNULL
+        )
+        client = RetrievalClient(f"http://127.0.0.1:{port}")
+        try:
+            _wait_until_up(client, process)
+
+            def timed(i):
+                start = time.perf_counter()
+                response = client.search(f"{queries[i % len(queries)]} #{i}-{time.time_ns()}", mode=mode)
+                return (time.perf_counter() - start) * 1000, response["batch"]
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = list(pool.map(timed, range(requests)))
+            elapsed = time.perf_counter() - start
+
+            rss, pss = _memory_mb([process.pid] + _children(process.pid))
+            latencies = [latency for latency, _ in results]
+            p50, p95 = np.percentile(latencies, [50, 95])
+            mean_batch = np.mean([batch for _, batch in results])
+            print(f"{workers:>8}{requests / elapsed:>10.1f}{p50:>10.1f}{p95:>10.1f}{mean_batch:>8.1f}"
+                  f"{rss:>10.0f}{pss:>10.0f}", flush=True)
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve review retrieval from shared worker processes.")
+    parser.add_argument("command", choices=["serve", "benchmark"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes for serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", default=None, help="Serve on a Unix socket instead of TCP")
+    parser.add_argument("--max-batch", type=int, default=32, help="Most queries searched together")
+    parser.add_argument("--max-wait-ms", type=float, default=5, help="How long a batch waits to fill")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per benchmark step")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent benchmark clients")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count(), help="Largest worker count benchmarked")
+    parser.add_argument("--mode", choices=["dense", "lexical", "hybrid"], default=None)
+    parser.add_argument("--queries", default=None, help="Text file with one benchmark query per line")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if args.command == "serve":
+        serve(args.workers, args.host, args.port, args.socket, args.max_batch, args.max_wait_ms,
+              api_key=os.getenv("OpenAI_API_Key"), **({"mode": args.mode} if args.mode else {}))
+        return
+
+    queries = SAMPLE_QUERIES
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [line.strip() for line in f if line.strip()]
+    # 1, 2, 4, ... up to the core count, always ending at max_workers
+    counts = sorted({min(2 ** i, args.max_workers) for i in range(args.max_workers.bit_length() + 1)})
+    benchmark(counts, queries, args.requests, args.concurrency, args.port, args.max_batch, args.max_wait_ms,
+              args.mode)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,62 @@
 import gdown
 import os
+import threading
+import weakref
 import numpy as np
 import faiss
 import pandas as pd
-from openai import OpenAI
+from index_variants import load_index
+from embedding_cache import EMBEDDING_MODEL, get_embedding_cache
+from embedders import get_embedder, read_index_metadata
+from tracing import span
+from client_pool import get_client
+from catalog import ProductCatalog
+from review_table import TABLE_PATH, EMBEDDINGS_PATH, REVIEW_COLUMNS, load_reviews, load_embeddings
+from lexical_index import LEXICAL_INDEX_PATH, BM25Index, load_or_build, reciprocal_rank_fusion, search_all
+from ingest import SEGMENTS_DIR, manifest_path, read_manifest, load_segment
 #from dotenv import load_dotenv
 #import streamlit as st
 
 #load_dotenv()
 #api_key = os.getenv("OpenAI_API_Key")
 
+def _watch_segments(retriever_ref, stop, interval):
+    """Poll for new segments until stopped or until the retriever is garbage collected.
+
+    Only a weak reference is held, so a watcher never keeps an evicted retriever (its index,
+    table and BM25 index) alive.
+    """
+    while not stop.wait(interval):
+        retriever = retriever_ref()
+        if retriever is None:
+            return
+        try:
+            retriever.refresh()
+        except Exception as e:
+            print(f"Could not load new review segments: {e}")
+        del retriever
+
+
 class ReviewRetriever:
-    def __init__(self, api_key):
-        """Initialize FAISS index and review dataset from Google Drive."""
+    def __init__(self, api_key, index_type="flat", nprobe=None, ef_search=None, mode="dense", fusion_depth=50,
+                 embedder=None, mmap_index=False, segments_dir=SEGMENTS_DIR, refresh_interval=5.0):
+        """Initialize FAISS index and review dataset from Google Drive.
+
+        index_type picks the flat index or an ANN variant built by index_variants.py
+        ("ivf", "hnsw" or "ivfpq"); nprobe and ef_search tune how hard the ANN search looks.
+        mode is the default retrieval mode: "dense", "lexical" (BM25, no embedding call) or
+        "hybrid" (both, merged by reciprocal-rank fusion over fusion_depth results each).
+        embedder embeds queries: an object from embedders.py, or "openai" / "local" (default: the
+        EMBEDDER environment variable, else "openai"). It must match the one that built the index.
+        mmap_index maps the index vectors from disk instead of copying them, so that worker
+        processes serving the same files (retrieval_server.py) share one copy.
+        Reviews added by ingest.py live in segments_dir behind the base rows; a background thread
+        checks for new ones every refresh_interval seconds (None disables it, see refresh()).
+        """
         self.index_path = "faiss_index.idx"
         self.data_path = "reviews_data.pkl"
+        self.table_path = TABLE_PATH
+        self.embeddings_path = EMBEDDINGS_PATH
 
         # Google Drive file IDs
         self.drive_files = {
@@ -25,30 +67,70 @@ class ReviewRetriever:
         # Download files if not already present
         self._download_files()
 
-        # Load data
-        self.df = pd.read_pickle(self.data_path)
-        self.index = faiss.read_index(self.index_path)
-        self.client = OpenAI(api_key=api_key)
+        # Load data, preferring the columnar copy written by review_table.py
+        if os.path.exists(self.table_path):
+            self.df = load_reviews(self.table_path)
+        else:
+            self.df = pd.read_pickle(self.data_path)
+        self.embeddings = load_embeddings(self.embeddings_path) if os.path.exists(self.embeddings_path) else None
+        self.index_type = index_type
+        self.index = load_index(self.index_path, index_type, nprobe=nprobe, ef_search=ef_search, mmap=mmap_index)
+        if index_type == "ivfpq" and self.embeddings is None:
+            print(f"{self.embeddings_path} not found: product-filtered and hybrid scores on the ivfpq index use "
+                  f"PQ-reconstructed vectors and are approximate. Write it with: python review_table.py convert")
+        self.client = get_client(api_key, lane="interactive")
+        self.embedding_cache = get_embedding_cache()
+        if embedder is None or isinstance(embedder, str):
+            kind = embedder or os.getenv("EMBEDDER", "openai")
+            client = self.client if kind == "openai" else None
+            embedder = get_embedder(kind, api_key=api_key, client=client, cache=self.embedding_cache)
+        self.embedder = embedder
 
-class ReviewRetriever:
-    def __init__(self, api_key):
-        """Initialize FAISS index and review dataset from Google Drive."""
-        self.index_path = "faiss_index.idx"
-        self.data_path = "reviews_data.pkl"
+        # reindex records which embedder built the index; older indexes carry no record (ada-002)
+        metadata = read_index_metadata(self.index_path)
+        built_with = metadata["embedder"] if metadata else f"openai:{EMBEDDING_MODEL}"
+        if built_with != self.embedder.name:
+            raise ValueError(
+                f"{self.index_path} was built with {built_with}, not {self.embedder.name}. "
+                f"Rebuild it with: python embedders.py reindex"
+            )
 
-        # Google Drive file IDs
-        self.drive_files = {
-            "faiss_index": "1LckdBqXv0VuUDJ8pFV9kwKEiDROeiWL4",  # Replace with actual file ID for FAISS index
-            "reviews_data": "1ppeVQ02us2T5TTFOEhx3XfpqHDM2IOXw"  # Replace with actual file ID for DataFrame
-        }
+        # FAISS ids are the DataFrame row positions, so they must line up
+        if self.index.ntotal != len(self.df):
+            raise ValueError(
+                f"{self.index_path} holds {self.index.ntotal} vectors but {self.data_path} has {len(self.df)} rows"
+            )
 
-        # Download files if not already present
-        self._download_files()
+        # Ingested segments extend the table and get exact search next to the FAISS index
+        self.base_rows = len(self.df)
+        self.segments_dir = segments_dir
+        self.refresh_interval = refresh_interval
+        self.delta_embeddings = np.zeros((0, self.index.d), dtype="float32")
+        self._manifest_mtime = self._manifest_version()
+        self._refresh_lock = threading.Lock()
+        self._watcher_pid = None
+        self._stop_watcher = None
+        self._closed = False
+        self._warned_segments = False
+        segment_rows = self._read_new_segments()
+        if segment_rows is not None:
+            rows, self.delta_embeddings = segment_rows
+            rows.index = pd.RangeIndex(len(self.df), len(self.df) + len(rows))
+            self.df = pd.concat([self.df, rows])
 
-        # Load data
-        self.df = pd.read_pickle(self.data_path)
-        self.index = faiss.read_index(self.index_path)
-        self.client = OpenAI(api_key=api_key)
+        # Product -> row ids, counts and sorted titles, built once so queries never scan the table
+        self.catalog = ProductCatalog(self.df["product_title"])
+        self.df["product_title"] = self.catalog.categorical()
+        self._selectors = {}
+
+        # BM25 over the base reviews, rebuilt only when the data file changes; ingested rows get their own
+        self.mode = mode
+        self.fusion_depth = fusion_depth
+        self.lexical_index = load_or_build(
+            self.df["combined_context"].iloc[:self.base_rows].tolist(), LEXICAL_INDEX_PATH,
+            source_path=self.table_path if os.path.exists(self.table_path) else self.data_path
+        )
+        self.delta_lexical_index = self._build_delta_lexical(self.df)
 
     def _download_files(self):
         """Download FAISS index and review data from Google Drive if not available."""
@@ -59,40 +141,393 @@ class ReviewRetriever:
                 gdown.download(f"https://drive.google.com/uc?id={file_id}", self.index_path)
                 print("Successfully downloaded!")
 
-            elif file_name == "reviews_data" and not os.path.exists(self.data_path):
+            elif file_name == "reviews_data" and not os.path.exists(self.data_path) and not os.path.exists(self.table_path):
                 print(f"Downloading {file_name} from Google Drive...")
                 gdown.download(f"https://drive.google.com/uc?id={file_id}", self.data_path)
                 print("Successfully downloaded!")
 
 
+    def _manifest_version(self):
+        try:
+            return os.path.getmtime(manifest_path(self.segments_dir))
+        except FileNotFoundError:
+            return None
+
+    def _read_new_segments(self):
+        """Return (rows, vectors) of the segment rows not loaded yet, or None."""
+        manifest = read_manifest(self.segments_dir)
+        if not manifest or not manifest["segments"]:
+            return None
+        if manifest["base_rows"] != self.base_rows or manifest["embedder"] != self.embedder.name:
+            if not self._warned_segments:
+                print(f"Ignoring {self.segments_dir}: its segments extend {manifest['base_rows']} rows embedded with "
+                      f"{manifest['embedder']}, not these {self.base_rows} rows with {self.embedder.name}")
+                self._warned_segments = True
+            return None
+
+        # Compaction keeps rows in order, so rows before len(delta_embeddings) are already loaded
+        loaded = len(self.delta_embeddings)
+        frames, vectors = [], []
+        offset = 0
+        for segment in manifest["segments"]:
+            end = offset + segment["rows"]
+            if end > loaded:
+                rows, segment_vectors = load_segment(self.segments_dir, segment["name"])
+                skip = max(loaded - offset, 0)
+                frames.append(rows.iloc[skip:])
+                vectors.append(np.asarray(segment_vectors[skip:], dtype="float32"))
+            offset = end
+        if not frames:
+            return None
+        rows = pd.concat(frames, ignore_index=True)
+        return rows[[column for column in REVIEW_COLUMNS if column in rows]], np.vstack(vectors)
+
+    def refresh(self):
+        """Add the rows ingested since the last check (see ingest.py); returns how many were added."""
+        version = self._manifest_version()
+        if version is None or version == self._manifest_mtime:
+            return 0
+        with self._refresh_lock:
+            try:
+                segment_rows = self._read_new_segments()
+            except FileNotFoundError:
+                # A compaction replaced a segment while it was being read; the next check sees the new manifest
+                return 0
+            self._manifest_mtime = version
+            if segment_rows is None:
+                return 0
+
+            rows, vectors = segment_rows
+            rows.index = pd.RangeIndex(len(self.df), len(self.df) + len(rows))
+            df = pd.concat([self.df.astype({"product_title": "object"}), rows])
+            catalog = ProductCatalog(df["product_title"])
+            df["product_title"] = catalog.categorical()
+            delta_embeddings = np.vstack([self.delta_embeddings, vectors])
+            delta_lexical_index = self._build_delta_lexical(df)
+
+            # Queries reach new row ids only through the catalog and the BM25 index, so those are swapped last
+            self.df = df
+            self.delta_embeddings = delta_embeddings
+            self._selectors = {}
+            self.delta_lexical_index = delta_lexical_index
+            self.catalog = catalog
+        print(f"Added {len(rows)} ingested reviews ({len(self.df)} rows)")
+        return len(rows)
+
+    def _build_delta_lexical(self, df):
+        """BM25 over the ingested rows only, scored with the saved index's corpus statistics."""
+        if len(df) == self.base_rows:
+            return None
+        return BM25Index.build(df["combined_context"].iloc[self.base_rows:].tolist(), reference=self.lexical_index,
+                               first_id=self.base_rows)
+
+    def _lexical_search(self, query_text, top_k, ids=None):
+        return search_all([self.lexical_index, self.delta_lexical_index], query_text, top_k, ids=ids)
+
+    @property
+    def segment_rows(self):
+        """Ingested rows loaded so far; grows whenever refresh() picks up new reviews."""
+        return len(self.delta_embeddings)
+
+    def _start_watcher(self):
+        """Start the segment watcher once per process (a forked worker needs its own thread)."""
+        if self.refresh_interval and self._watcher_pid != os.getpid() and not self._closed:
+            self._watcher_pid = os.getpid()
+            self._stop_watcher = threading.Event()
+            threading.Thread(target=_watch_segments, args=(weakref.ref(self), self._stop_watcher, self.refresh_interval),
+                             daemon=True, name="segment-watcher").start()
+
+    def close(self):
+        """Stop the segment watcher; call it when the retriever is replaced (see resources.py)."""
+        self._closed = True
+        if self._stop_watcher is not None:
+            self._stop_watcher.set()
+
     def get_product_list(self):
         """Return a sorted list of unique shampoo products from the dataset."""
-        return sorted(self.df["product_title"].unique())
+        self._start_watcher()
+        return self.catalog.products
+
+    def _product_selector(self, selected_product):
+        """Return a cached FAISS ID selector restricted to one product's rows."""
+        if selected_product not in self._selectors:
+            ids = self.catalog.ids(selected_product)
+            self._selectors[selected_product] = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+        return self._selectors[selected_product]
+
+    def _search(self, queries, top_k, selected_product=None):
+        """Search the index with an (n, d) query matrix and return (scores, row ids) arrays of shape (n, top_k).
 
-    def get_top_k_reviews(self, query_text, selected_product=None, top_k=10):
-        """Retrieve top-k most relevant reviews, either for a specific product or across all products."""
+        Missing hits (fewer than top_k rows for a product) are padded with NaN scores and -1 ids.
+        """
+        queries = np.asarray(queries, dtype="float32")
+        if queries.shape[-1] != self.index.d:
+            # reshape(-1, d) would silently fold mismatched embeddings into wrong rows
+            raise ValueError(
+                f"Query embeddings have dimension {queries.shape[-1]} but {self.index_path} has dimension {self.index.d}"
+            )
+        queries = queries.reshape(-1, self.index.d)
+
+        if selected_product and self.index_type != "flat":
+            # ANN structures lose recall on small filtered subsets, so score the product's rows by brute
+            # force (exact with review_embeddings.npy; IVFPQ without it can only reconstruct approximations)
+            ids = self.catalog.ids(selected_product)
+            similarities = queries @ self._vectors(ids).T
+            order = np.argsort(-similarities, axis=1)[:, :top_k]
+            scores = np.take_along_axis(similarities, order, axis=1)
+            return self._pad(scores, ids[order], top_k)
+
+        params = None
+        search_k = top_k
         if selected_product:
-            filtered_df = self.df[self.df["product_title"] == selected_product].copy()
+            search_k = min(top_k, self.catalog.count(selected_product))
+            params = faiss.SearchParameters(sel=self._product_selector(selected_product))
+
+        distances, labels = self.index.search(queries, search_k, params=params)
+
+        if self.index.metric_type == faiss.METRIC_L2:
+            # Embeddings are unit length, so ||a - b||^2 = 2 - 2 * cos(a, b)
+            distances = 1 - distances / 2
+
+        return self._pad(*self._merge_delta(queries, distances, labels, top_k, selected_product), top_k)
+
+    def _merge_delta(self, queries, scores, labels, top_k, selected_product=None):
+        """Score the ingested rows exactly and merge them into the index hits."""
+        delta = self.delta_embeddings
+        if not len(delta):
+            return scores, labels
+        if selected_product:
+            ids = self.catalog.ids(selected_product)
+            ids = ids[ids >= self.base_rows]
         else:
-            filtered_df = self.df.copy()
-        
-        if filtered_df.empty:
+            ids = np.arange(self.base_rows, self.base_rows + len(delta), dtype="int64")
+        if not len(ids):
+            return scores, labels
+
+        all_scores = np.hstack([np.where(labels >= 0, scores, -np.inf), queries @ delta[ids - self.base_rows].T])
+        all_ids = np.hstack([labels, np.broadcast_to(ids, (len(queries), len(ids)))])
+        order = np.argsort(-all_scores, axis=1, kind="stable")[:, :top_k]
+        return np.take_along_axis(all_scores, order, axis=1), np.take_along_axis(all_ids, order, axis=1)
+
+    def _vectors(self, ids):
+        """Return the stored embeddings of the given rows (ingested rows included).
+
+        Without review_embeddings.npy the base rows are reconstructed from the index, which is
+        lossy for IVFPQ.
+        """
+        ids = np.asarray(ids, dtype="int64")
+        delta = self.delta_embeddings
+        if len(delta) and len(ids) and ids.max() >= self.base_rows:
+            vectors = np.empty((len(ids), self.index.d), dtype="float32")
+            ingested = ids >= self.base_rows
+            vectors[ingested] = delta[ids[ingested] - self.base_rows]
+            if (~ingested).any():
+                vectors[~ingested] = self._vectors(ids[~ingested])
+            return vectors
+        if self.embeddings is not None:
+            return self.embeddings[ids]
+        return self.index.reconstruct_batch(ids)
+
+    @staticmethod
+    def _pad(scores, ids, top_k):
+        """Pad result arrays to top_k columns; FAISS already marks missing hits with -1."""
+        padded_scores = np.full((len(scores), top_k), np.nan, dtype="float32")
+        padded_ids = np.full((len(ids), top_k), -1, dtype="int64")
+        padded_scores[:, :scores.shape[1]] = scores
+        padded_ids[:, :ids.shape[1]] = ids
+        padded_scores[padded_ids < 0] = np.nan
+        return padded_scores, padded_ids
+
+    def _embed_queries(self, query_texts):
+        """Embed queries (cache first, misses in batches) and return a unit-normalized matrix."""
+        return self.embedder.embed(list(query_texts))
+
+    def embed_query(self, query_text):
+        """Return the unit-normalized embedding of one query."""
+        with span("retrieval.embed") as embed_span:
+            hits = self.embedding_cache.hits
+            query_embedding = self._embed_queries([query_text])[0]
+            embed_span.set("cache_hit", self.embedding_cache.hits > hits)
+        return query_embedding
+
+    def get_top_k_ids(self, query_text, selected_product=None, top_k=10, query_embedding=None, mode=None):
+        """Return (row ids best first, {column: scores}) for a query in the given retrieval mode.
+
+        Scores always include similarity_score: the cosine similarity in dense and hybrid mode,
+        and the BM25 score relative to the best hit in lexical mode.
+        """
+        self._start_watcher()
+        mode = mode or self.mode
+        product_ids = self.catalog.ids(selected_product) if selected_product else None
+
+        if mode == "lexical":
+            with span("retrieval.lexical", filtered=bool(selected_product)) as search_span:
+                scores, ids = self._lexical_search(query_text, top_k, ids=product_ids)
+                search_span.set("rows", len(ids))
+            relative = scores / scores[0] if len(scores) else scores
+            return ids, {"similarity_score": relative, "bm25_score": scores}
+
+        # Convert Query Text to Embedding (repeat questions are served from the cache)
+        if query_embedding is None:
+            query_embedding = self.embed_query(query_text)
+
+        depth = max(top_k, self.fusion_depth) if mode == "hybrid" else top_k
+
+        # Search FAISS Index, restricted to the product's rows when one is selected
+        with span("retrieval.search", index_type=self.index_type, filtered=bool(selected_product)) as search_span:
+            scores, dense_ids = self._search(query_embedding, depth, selected_product)
+            found = dense_ids[0] >= 0
+            search_span.set("rows", int(found.sum()))
+
+        return self._finish(query_text, query_embedding, dense_ids[0][found], scores[0][found], top_k, mode,
+                            selected_product, product_ids)
+
+    def _finish(self, query_text, query_embedding, dense_ids, scores, top_k, mode, selected_product, product_ids):
+        """Turn one query's dense hits into the (ids, scores) of get_top_k_ids, fusing with BM25 in hybrid mode."""
+        if mode != "hybrid":
+            return dense_ids, {"similarity_score": scores}
+
+        depth = max(top_k, self.fusion_depth)
+        with span("retrieval.hybrid", filtered=bool(selected_product)) as fusion_span:
+            bm25_scores, lexical_ids = self._lexical_search(query_text, depth, ids=product_ids)
+            fused = reciprocal_rank_fusion([dense_ids.tolist(), lexical_ids.tolist()])[:top_k]
+            ids = np.asarray([row_id for row_id, _ in fused], dtype="int64")
+
+            # Lexical-only hits have no dense score yet, so score every fused row exactly
+            query = np.asarray(query_embedding, dtype="float32").reshape(-1)
+            similarities = self._vectors(ids) @ query if len(ids) else np.zeros(0, dtype="float32")
+            bm25_by_id = dict(zip(lexical_ids.tolist(), bm25_scores.tolist()))
+            fusion_span.set("lexical_only", len(set(ids.tolist()) - set(dense_ids.tolist())))
+
+        return ids, {
+            "similarity_score": similarities,
+            "bm25_score": np.asarray([bm25_by_id.get(row_id, 0.0) for row_id in ids.tolist()], dtype="float32"),
+            "fusion_score": np.asarray([score for _, score in fused], dtype="float32"),
+        }
+
+    def get_top_k_ids_batch(self, query_texts, selected_product=None, top_k=10, mode=None, query_embeddings=None):
+        """get_top_k_ids for many queries with one embedding request and one index search.
+
+        Returns one (ids, scores) pair per query, identical to calling get_top_k_ids on each.
+        Pass query_embeddings (one row per query) to reuse embeddings that were already computed.
+        """
+        self._start_watcher()
+        mode = mode or self.mode
+        query_texts = list(query_texts)
+        if mode == "lexical" or not query_texts:
+            return [self.get_top_k_ids(query, selected_product, top_k, mode=mode) for query in query_texts]
+
+        product_ids = self.catalog.ids(selected_product) if selected_product else None
+        embeddings = query_embeddings
+        if embeddings is None:
+            with span("retrieval.embed", queries=len(query_texts)):
+                embeddings = self._embed_queries(query_texts)
+
+        depth = max(top_k, self.fusion_depth) if mode == "hybrid" else top_k
+        with span("retrieval.search_batch", queries=len(query_texts), filtered=bool(selected_product)):
+            scores, dense_ids = self._search(embeddings, depth, selected_product)
+
+        results = []
+        for i, query in enumerate(query_texts):
+            found = dense_ids[i] >= 0
+            results.append(self._finish(query, embeddings[i], dense_ids[i][found], scores[i][found], top_k, mode,
+                                        selected_product, product_ids))
+        return results
+
+    def get_top_k_reviews(self, query_text, selected_product=None, top_k=10, query_embedding=None, mode=None):
+        """Retrieve top-k most relevant reviews, either for a specific product or across all products.
+
+        Pass query_embedding (from embed_query) to reuse an embedding that was already computed.
+        mode overrides the retriever's default ("dense", "lexical" or "hybrid").
+        """
+        if selected_product and selected_product not in self.catalog:
+            return pd.DataFrame()
+        if len(self.df) == 0:
             return pd.DataFrame()
 
-        # Convert Query Text to Embedding
-        response = self.client.embeddings.create(input=[query_text], model="text-embedding-ada-002")
-        query_embedding = response.data[0].embedding  
+        ids, scores = self.get_top_k_ids(query_text, selected_product, top_k, query_embedding, mode)
+
+        # Retrieve matching reviews; review_id is the row position, which also addresses the stored vectors
+        top_reviews = self.df.iloc[ids].copy()
+        top_reviews["review_id"] = ids
+        for column, values in scores.items():
+            top_reviews[column] = values
+
+        return top_reviews
+
+    def get_top_k_reviews_batch(self, queries, products=None, k=10, mode=None):
+        """Retrieve top-k reviews for many queries at once, with the same results as get_top_k_reviews.
+
+        products is None (search all products), one product for every query, or a list with one
+        entry (product or None) per query. Queries are embedded in batched requests and each
+        product group goes through get_top_k_ids_batch. Returns a RetrievalBatch.
+        """
+        self._start_watcher()
+        mode = mode or self.mode
+        queries = list(queries)
+        if products is None or isinstance(products, str):
+            products = [products] * len(queries)
 
-        # Normalize Embedding
-        query_embedding = query_embedding / np.linalg.norm(query_embedding)
+        ids = np.full((len(queries), k), -1, dtype="int64")
+        scores = {"similarity_score": np.full((len(queries), k), np.nan, dtype="float32")}
+        if not queries or len(self.df) == 0:
+            return RetrievalBatch(self.df, ids, scores)
 
-        # Search FAISS Index for the most similar reviews
-        review_embeddings = self.index.reconstruct_n(0, len(filtered_df))  
-        distances = np.dot(review_embeddings, query_embedding)  
-        top_indices = np.argsort(distances)[-top_k:][::-1]  
+        embeddings = None
+        if mode != "lexical":
+            with span("retrieval.embed", queries=len(queries)):
+                embeddings = self._embed_queries(queries)
 
-        # Retrieve matching reviews
-        top_reviews = filtered_df.iloc[top_indices].copy()
-        top_reviews["similarity_score"] = distances[top_indices]
+        # One batched search per distinct product filter rather than one per query
+        groups = {}
+        for position, product in enumerate(products):
+            if product and product not in self.catalog:
+                continue
+            groups.setdefault(product or None, []).append(position)
 
+        with span("retrieval.search_batch", queries=len(queries), groups=len(groups)):
+            for product, positions in groups.items():
+                results = self.get_top_k_ids_batch(
+                    [queries[position] for position in positions], product, k, mode,
+                    query_embeddings=None if embeddings is None else embeddings[positions]
+                )
+                for position, (row_ids, row_scores) in zip(positions, results):
+                    ids[position, :len(row_ids)] = row_ids
+                    for column, values in row_scores.items():
+                        if column not in scores:
+                            scores[column] = np.full((len(queries), k), np.nan, dtype="float32")
+                        scores[column][position, :len(values)] = values
+
+        return RetrievalBatch(self.df, ids, scores)
+
+
+class RetrievalBatch:
+    """Results of get_top_k_reviews_batch as compact (n_queries, k) arrays of row ids and scores.
+
+    scores maps each score column of get_top_k_reviews (similarity_score, and bm25_score /
+    fusion_score in lexical and hybrid mode) to an array. Row ids are -1 (and scores NaN) where
+    fewer than k reviews matched. DataFrames are only built when asked for with to_frame / to_frames.
+    """
+
+    def __init__(self, df, ids, scores):
+        self.df = df
+        self.ids = ids
+        self.scores = scores
+
+    def __len__(self):
+        return len(self.ids)
+
+    def to_frame(self, i):
+        """Return the reviews for query i in the same shape as get_top_k_reviews."""
+        found = self.ids[i] >= 0
+        if not found.any():
+            return pd.DataFrame()
+        top_reviews = self.df.iloc[self.ids[i][found]].copy()
+        top_reviews["review_id"] = self.ids[i][found]
+        for column, values in self.scores.items():
+            top_reviews[column] = values[i][found]
         return top_reviews
+
+    def to_frames(self):
+        """Return one DataFrame per query."""
+        return [self.to_frame(i) for i in range(len(self))]
@@ -0,0 +1,136 @@
+"""Columnar copies of reviews_data.pkl and the index vectors for fast, shared loading.
+
+convert writes the review table as uncompressed Feather (Arrow IPC) and the embeddings as a
+raw float32 .npy. ReviewRetriever then reads only the columns it needs through a memory map.
+The text columns stay Arrow-backed instead of becoming Python strings, so, like the embeddings
+opened with np.load(mmap_mode="r"), their pages are shared by every worker process.
+
+Usage:
+    python review_table.py convert
+    python review_table.py benchmark
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+TABLE_PATH = "reviews_data.feather"
+EMBEDDINGS_PATH = "review_embeddings.npy"
+
+# The only columns the retriever and agents read
+REVIEW_COLUMNS = ["product_title", "combined_context", "sentiment"]
+
+# Feather needs a default RangeIndex, so the original row labels travel as a column
+INDEX_COLUMN = "__index__"
+
+# pandas' Arrow-backed string dtype, with NaN for missing values like object columns (pandas >= 2.3)
+try:
+    ARROW_STRING = pd.StringDtype("pyarrow", na_value=np.nan)
+except TypeError:
+    ARROW_STRING = pd.StringDtype("pyarrow")
+
+
+def _arrow_strings(arrow_type):
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return ARROW_STRING
+    return None
+
+
+def convert(data_path="reviews_data.pkl", index_path="faiss_index.idx", table_path=TABLE_PATH,
+            embeddings_path=EMBEDDINGS_PATH):
+    """Write the Feather table and the float32 embedding matrix."""
+    import faiss
+
+    df = pd.read_pickle(data_path)
+    write_table(df, table_path)
+
+    index = faiss.read_index(index_path)
+    embeddings = index.reconstruct_n(0, index.ntotal).astype("float32")
+    faiss.normalize_L2(embeddings)
+    np.save(embeddings_path, embeddings)
+
+    print(f"Wrote {len(df)} rows to {table_path} and a {embeddings.shape} matrix to {embeddings_path}")
+
+
+def write_table(df, table_path=TABLE_PATH):
+    """Write df as the Feather table, replacing the file atomically (running processes keep their map)."""
+    tmp_path = f"{table_path}.tmp"
+    df.rename_axis(INDEX_COLUMN).reset_index().to_feather(tmp_path, compression="uncompressed")
+    os.replace(tmp_path, table_path)
+
+
+def load_reviews(table_path=TABLE_PATH, columns=REVIEW_COLUMNS):
+    """Read the needed columns of the Feather table through a memory map, text kept in the mapped buffers."""
+    available = pa.ipc.open_file(pa.memory_map(table_path)).schema.names
+    wanted = [column for column in [INDEX_COLUMN] + columns if column in available]
+
+    # select() after reading keeps the mapped buffers; read_table(columns=...) would copy them
+    table = feather.read_table(table_path, memory_map=True).select(wanted)
+    df = table.to_pandas(types_mapper=_arrow_strings)
+    if INDEX_COLUMN in df.columns:
+        df = df.set_index(INDEX_COLUMN).rename_axis(None)
+    return df
+
+
+def load_embeddings(embeddings_path=EMBEDDINGS_PATH):
+    """Memory-map the embedding matrix read-only; pages are shared between processes."""
+    return np.load(embeddings_path, mmap_mode="r")
+
+
+def _max_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(fmt, data_path="reviews_data.pkl", index_path="faiss_index.idx"):
+    """Load one format in this process and print load time and peak RSS as JSON."""
+    baseline_rss = _max_rss_mb()
+    start = time.perf_counter()
+
+    if fmt == "pickle":
+        import faiss
+        df = pd.read_pickle(data_path)
+        embeddings = faiss.read_index(index_path)
+    else:
+        df = load_reviews()
+        embeddings = load_embeddings()
+        # Read every page so the timing includes faulting the vectors in
+        float(np.asarray(embeddings).sum())
+
+    seconds = time.perf_counter() - start
+    print(json.dumps({"format": fmt, "rows": len(df), "seconds": seconds,
+                      "rss_mb": _max_rss_mb(), "rss_delta_mb": _max_rss_mb() - baseline_rss}))
+
+
+def benchmark():
+    """Measure cold start and resident memory of both formats, each in a fresh process."""
+    print(f"{'format':<10}{'rows':>10}{'seconds':>10}{'rss MB':>10}{'delta MB':>10}")
+    for fmt in ["pickle", "columnar"]:
+        output = subprocess.run([sys.executable, __file__, "measure", fmt], capture_output=True, text=True, check=True)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        print(f"{fmt:<10}{result['rows']:>10}{result['seconds']:>10.2f}{result['rss_mb']:>10.0f}{result['rss_delta_mb']:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert and benchmark the review table formats.")
+    parser.add_argument("command", choices=["convert", "benchmark", "measure"])
+    parser.add_argument("format", nargs="?", choices=["pickle", "columnar"], help="Used by measure")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert()
+    elif args.command == "benchmark":
+        benchmark()
+    else:
+        measure(args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,139 @@
-from openai import OpenAI
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+from tracing import span
+from token_budget import count_tokens, truncate_tokens
+from client_pool import get_client
 #from dotenv import load_dotenv
 #import streamlit as st
 
 #load_dotenv()
 #api_key = os.getenv("OpenAI_API_Key")
 
+SENTIMENT_LABELS = ["positive", "neutral", "negative"]
+# Placeholder for reviews whose label is still being computed (see pipeline.py)
+UNLABELLED = "unlabelled"
+SENTIMENT_MODEL = "gpt-4o"
+
+# Instructions and JSON scaffolding around the reviews, in tokens
+PROMPT_OVERHEAD_TOKENS = 200
+
 class SentimentAgent:
-    def __init__(self, api_key):
-        """Initialize OpenAI client."""
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key, chunk_size=10, max_workers=8, retries=2, max_review_tokens=300,
+                 max_chunk_tokens=3000, client=None):
+        """Initialize OpenAI client (the shared pool's interactive lane unless one is given).
+
+        Reviews are labelled in chunks of at most chunk_size reviews and max_chunk_tokens prompt
+        tokens, sent concurrently; reviews longer than max_review_tokens are truncated.
+        """
+        self.client = client or get_client(api_key, lane="interactive")
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.retries = retries
+        self.max_review_tokens = max_review_tokens
+        self.max_chunk_tokens = max_chunk_tokens
 
     def analyze_reviews(self, reviews):
-        """Analyze sentiment of each review and return updated DataFrame with sentiment labels."""
-        review_texts = reviews["combined_context"].tolist()
+        """Analyze sentiment of each review and return updated DataFrame with sentiment labels.
+
+        Rows that already carry a precomputed label (see label_sentiment.py) are kept as is;
+        the model is only called for the rest.
+        """
+        reviews = reviews.copy()
+        if "sentiment" not in reviews.columns:
+            reviews["sentiment"] = None
+
+        missing = ~reviews["sentiment"].isin(SENTIMENT_LABELS)
+        with span("sentiment", rows=len(reviews), precomputed=int((~missing).sum())):
+            if missing.any():
+                reviews.loc[missing, "sentiment"] = self.label_texts(reviews.loc[missing, "combined_context"].tolist())
+
+        return reviews
+
+    def label_texts(self, review_texts):
+        """Return one sentiment label per review text; reviews that never get a valid label are "error"."""
+        items = {
+            review_id: truncate_tokens(str(text), self.max_review_tokens, SENTIMENT_MODEL)
+            for review_id, text in enumerate(review_texts)
+        }
+        labels = {}
+        pending = list(items)
+
+        # Each pass re-chunks only the reviews that are still unlabelled
+        for attempt in range(self.retries + 1):
+            chunks = self._chunk(pending, items)
+            if not chunks:
+                break
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as pool:
+                for chunk_labels in pool.map(lambda chunk: self._label_chunk(chunk, attempt), chunks):
+                    labels.update(chunk_labels)
+            pending = [review_id for review_id in pending if review_id not in labels]
+
+        return [labels.get(review_id, "error") for review_id in items]
+
+    def _chunk(self, review_ids, items):
+        """Split review ids into chunks that respect both the review count and the token budget."""
+        chunks, chunk, chunk_tokens = [], [], PROMPT_OVERHEAD_TOKENS
+        for review_id in review_ids:
+            tokens = count_tokens(items[review_id], SENTIMENT_MODEL) + 10
+            if chunk and (len(chunk) >= self.chunk_size or chunk_tokens + tokens > self.max_chunk_tokens):
+                chunks.append(chunk)
+                chunk, chunk_tokens = [], PROMPT_OVERHEAD_TOKENS
+            chunk.append((review_id, items[review_id]))
+            chunk_tokens += tokens
+        if chunk:
+            chunks.append(chunk)
+        return chunks
 
+    def _label_chunk(self, chunk, attempt=0):
+        """Label one chunk of (id, text) pairs; returns {id: label} for the reviews labelled validly."""
+        reviews_json = json.dumps([{"id": review_id, "text": text} for review_id, text in chunk], ensure_ascii=False)
         prompt = f"""
         Analyze the sentiment of each of the following product reviews individually.
         Categorize each review as 'positive', 'neutral', or 'negative'. 
 
         Reviews:
-        {review_texts}
+        {reviews_json}
 
-        Return the output in a valid JSON format, with one label per review in the same order:
+        Return the output in a valid JSON format, with one entry per review id:
         {{
-          "sentiments": ["positive", "negative", "neutral"]
+          "sentiments": [{{"id": 0, "sentiment": "positive"}}, {{"id": 1, "sentiment": "negative"}}]
         }}
         DO NOT include any explanations, markdown, or extra text—only the JSON object.
         """
 
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "system", "content": "You are an expert sentiment analyzer."},
-                      {"role": "user", "content": prompt}],
-            temperature=0.3
-        )
+        try:
+            with span("sentiment.llm", reviews=len(chunk), attempt=attempt) as llm_span:
+                response = self.client.chat.completions.create(
+                    model=SENTIMENT_MODEL,
+                    messages=[{"role": "system", "content": "You are an expert sentiment analyzer."},
+                              {"role": "user", "content": prompt}],
+                    temperature=0.3,
+                    response_format={"type": "json_object"}
+                )
+                llm_span.record_usage(response)
+        except Exception as e:
+            # The failed reviews stay pending and are retried in the next pass
+            print(f"Sentiment request for {len(chunk)} reviews failed: {e}")
+            return {}
 
         raw_output = response.choices[0].message.content.strip()
 
         # Ensure we extract only the JSON part
         try:
             cleaned_json = raw_output.replace("```json", "").replace("```", "").strip()
-            sentiment_data = json.loads(cleaned_json)  # Parse JSON safely
-            sentiments = sentiment_data.get("sentiments", [])
-        except json.JSONDecodeError:
-            sentiments = ["error"] * len(review_texts)
-
-        # Assign sentiment labels to DataFrame
-        reviews = reviews.copy()
-        reviews["sentiment"] = sentiments
+            entries = json.loads(cleaned_json).get("sentiments", [])
+        except (json.JSONDecodeError, AttributeError):
+            return {}
 
-        return reviews
+        # Labels are matched by id, so missing, extra or reordered entries only affect themselves
+        chunk_ids = {review_id for review_id, _ in chunk}
+        labels = {}
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            review_id, label = entry.get("id"), str(entry.get("sentiment", "")).strip().lower()
+            if review_id in chunk_ids and label in SENTIMENT_LABELS:
+                labels[review_id] = label
+        return labels
@@ -1,4 +1,8 @@
-from openai import OpenAI
+import time
+from tracing import span, record
+from context_packer import pack_reviews
+from client_pool import get_client
+from sentiment import UNLABELLED
 #import os
 #from dotenv import load_dotenv
 #import streamlit as st
@@ -7,21 +11,33 @@ from openai import OpenAI
 #api_key = os.getenv("OpenAI_API_Key")
 
 class SummaryAgent:
-    def __init__(self, api_key):
-        """Initialize OpenAI client."""
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key, client=None, context_tokens=1500, max_review_tokens=150):
+        """Initialize OpenAI client: the shared pool's interactive lane, or a given one (e.g. fake_openai.FakeOpenAI).
 
-    def generate_summary(self, user_query, reviews_with_sentiment, **generation_params):
-        """Generate a final AI-powered answer based on reviews and their sentiment."""
-        review_texts = "\n".join(
-            [f"- {row['combined_context']} (Sentiment: {row['sentiment']})" for _, row in reviews_with_sentiment.iterrows()]
+        Reviews are packed into at most context_tokens prompt tokens (see context_packer.py).
+        """
+        self.client = client or get_client(api_key, lane="interactive")
+        self.context_tokens = context_tokens
+        self.max_review_tokens = max_review_tokens
+
+    def _build_request(self, user_query, reviews_with_sentiment, **generation_params):
+        """Build the chat completion arguments shared by the blocking and streaming calls, plus context stats."""
+        review_lines, context_stats = pack_reviews(
+            user_query, reviews_with_sentiment, max_tokens=self.context_tokens, max_review_tokens=self.max_review_tokens
         )
+        review_texts = "\n".join(review_lines)
+        unlabelled_note = ""
+        if "sentiment" in reviews_with_sentiment and (reviews_with_sentiment["sentiment"] == UNLABELLED).any():
+            # Sentiment is labelled in parallel with this call (pipeline.py), so the model judges it here
+            unlabelled_note = (f"Reviews marked (Sentiment: {UNLABELLED}) have not been analyzed yet; "
+                               f"judge their sentiment yourself from the text.")
 
         prompt = f"""
         Based on the following shampoo product reviews and their sentiment analysis, answer the user's question: "{user_query}".
         
         Reviews:
         {review_texts}
+        {unlabelled_note}
 
         Summarize key insights, mentioning trends in positive, neutral, and negative sentiments. 
         The answer should be factual and concise, without making assumptions beyond the reviews.
@@ -43,7 +59,55 @@ class SummaryAgent:
             "frequency_penalty": generation_params.get("frequency_penalty", 0),
             "presence_penalty": generation_params.get("presence_penalty", 0)
         }
+        return gen_args, context_stats
 
-        response = self.client.chat.completions.create(**gen_args)
+    def generate_summary(self, user_query, reviews_with_sentiment, **generation_params):
+        """Generate a final AI-powered answer based on reviews and their sentiment."""
+        gen_args, context_stats = self._build_request(user_query, reviews_with_sentiment, **generation_params)
+
+        with span("summary", reviews=len(reviews_with_sentiment), **context_stats) as summary_span:
+            response = self.client.chat.completions.create(**gen_args)
+            summary_span.record_usage(response)
 
         return response.choices[0].message.content.strip()
+
+    def generate_summary_stream(self, user_query, reviews_with_sentiment, stats=None, **generation_params):
+        """Yield the answer token by token; if a stats dict is given, the stream's timing is put in it at the end.
+
+        The agent is shared between sessions, so the timing of a stream belongs to its caller, not to the agent.
+        """
+        gen_args, context_stats = self._build_request(user_query, reviews_with_sentiment, **generation_params)
+
+        start = time.perf_counter()
+        first_token_at = None
+        chunks = 0
+        completion_tokens = None
+
+        stream = self.client.chat.completions.create(**gen_args, stream=True, stream_options={"include_usage": True})
+        for chunk in stream:
+            # The final chunk carries usage and no choices
+            if chunk.usage is not None:
+                completion_tokens = chunk.usage.completion_tokens
+            if not chunk.choices:
+                continue
+
+            content = chunk.choices[0].delta.content
+            if content:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                chunks += 1
+                yield content
+
+        end = time.perf_counter()
+        tokens = completion_tokens if completion_tokens is not None else chunks
+        generation_seconds = end - (first_token_at or end)
+        stream_stats = {
+            "time_to_first_token": (first_token_at or end) - start,
+            "total_seconds": end - start,
+            "completion_tokens": tokens,
+            "tokens_per_second": tokens / generation_seconds if generation_seconds > 0 else 0.0,
+        }
+        if stats is not None:
+            stats.update(stream_stats)
+        record("summary.stream", stream_stats["total_seconds"] * 1000,
+               reviews=len(reviews_with_sentiment), **context_stats, **stream_stats)
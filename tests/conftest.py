@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Modules live at the repo root; spans from the code under test are not written to traces.jsonl
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["TRACE_PATH"] = ""
@@ -0,0 +1,161 @@
+import time
+import pandas as pd
+import pytest
+from eval_queue import EvaluationQueue
+from eval_store import EVAL_COLUMNS, EvaluationStore, FakeSheetsService, SheetSync, sync_to_sheet
+
+SHEET = "sheet-1"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EvaluationStore(str(tmp_path / "evaluation_logs.db"))
+
+
+def add_results(store, n, start=0):
+    for i in range(start, start + n):
+        store.append({"question": f"q{i}", "generated_answer": f"a{i}", "rouge1": 0.5})
+
+
+def reviews():
+    return pd.DataFrame({"combined_context": ["great lather"], "review_id": [0]})
+
+
+class FailingSheetsService(FakeSheetsService):
+    def append(self, *args, **kwargs):
+        raise RuntimeError("Sheets unavailable")
+
+
+def test_claim_batch_advances_high_water_mark(store):
+    add_results(store, 5)
+
+    previous, rows, claimed = store.claim_batch(SHEET, batch_size=3)
+    assert previous == 0
+    assert [row[0] for row in rows] == ["q0", "q1", "q2"]
+    assert store.high_water_mark(SHEET) == claimed
+
+    # A second claimer only sees rows past the first claim
+    _, rows, _ = store.claim_batch(SHEET, batch_size=3)
+    assert [row[0] for row in rows] == ["q3", "q4"]
+    assert not store.has_unsynced(SHEET)
+
+
+def test_release_batch_rolls_back_only_its_own_claim(store):
+    add_results(store, 4)
+    previous, _, claimed = store.claim_batch(SHEET, batch_size=2)
+
+    store.release_batch(SHEET, previous, claimed)
+    assert store.high_water_mark(SHEET) == previous
+
+    # Once another sync has moved the mark on, a stale release leaves it alone
+    store.claim_batch(SHEET, batch_size=2)
+    _, _, newer = store.claim_batch(SHEET, batch_size=2)
+    store.release_batch(SHEET, previous, claimed)
+    assert store.high_water_mark(SHEET) == newer
+
+
+def test_sync_sends_only_new_rows(store):
+    service = FakeSheetsService()
+    add_results(store, 3)
+
+    assert sync_to_sheet(store, service, SHEET, batch_size=2) == 3
+    assert service.sheets[SHEET][0] == EVAL_COLUMNS
+    assert service.calls == [("update", SHEET, 3), ("append", SHEET, 1)]
+
+    assert sync_to_sheet(store, service, SHEET) == 0
+    assert len(service.calls) == 2
+
+    add_results(store, 2, start=3)
+    assert sync_to_sheet(store, service, SHEET) == 2
+    assert [row[0] for row in service.sheets[SHEET][1:]] == ["q0", "q1", "q2", "q3", "q4"]
+
+
+def test_failed_push_is_retried_by_the_next_sync(store):
+    service = FakeSheetsService()
+    add_results(store, 1)
+    sync_to_sheet(store, service, SHEET)
+    mark = store.high_water_mark(SHEET)
+
+    add_results(store, 2, start=1)
+    with pytest.raises(RuntimeError):
+        sync_to_sheet(store, FailingSheetsService(), SHEET)
+    assert store.high_water_mark(SHEET) == mark
+
+    assert sync_to_sheet(store, service, SHEET) == 2
+    assert [row[0] for row in service.sheets[SHEET][1:]] == ["q0", "q1", "q2"]
+
+
+def test_sheets_are_tracked_separately(store):
+    add_results(store, 2)
+    service = FakeSheetsService()
+    assert sync_to_sheet(store, service, "a") == 2
+    assert sync_to_sheet(store, service, "b") == 2
+
+
+def test_sheet_sync_pushes_in_the_background(store):
+    service = FakeSheetsService()
+    add_results(store, 2)
+    sync = SheetSync(lambda: service, SHEET, store_path=store.path, interval=0.05).start()
+    try:
+        deadline = time.time() + 5
+        while sync.sent < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        add_results(store, 1, start=2)
+        while sync.sent < 3 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        sync.stop()
+    assert sync.sent == 3
+    assert sync.last_error is None
+    assert len(service.sheets[SHEET]) == 4
+
+
+def test_queue_claims_each_job_once(tmp_path):
+    queue = EvaluationQueue(str(tmp_path / "eval_queue.db"))
+    ids = [queue.enqueue(f"q{i}", reviews(), "answer") for i in range(2)]
+
+    first, second = queue.claim(), queue.claim()
+    assert [first[0], second[0]] == ids
+    assert first[1]["user_query"] == "q0"
+    assert queue.claim() is None
+
+    queue.complete(first[0])
+    assert queue.metrics()["done"] == 1
+    assert queue.metrics()["running"] == 1
+
+
+def test_queue_requeues_failed_and_stale_jobs(tmp_path):
+    queue = EvaluationQueue(str(tmp_path / "eval_queue.db"), max_attempts=2, stale_after=0)
+    job_id = queue.enqueue("q", reviews(), "answer")
+
+    queue.fail(queue.claim()[0], "timeout")
+    assert queue.claim()[0] == job_id
+    # The second failure reaches max_attempts
+    queue.fail(job_id, "timeout")
+    assert queue.claim() is None
+    assert queue.metrics()["failed"] == 1
+
+    other = queue.enqueue("q2", reviews(), "answer")
+    queue.claim()
+    time.sleep(0.01)
+    queue.requeue_stale()
+    assert queue.claim()[0] == other
+
+
+def test_worker_rescues_jobs_stranded_by_a_crashed_worker(tmp_path, monkeypatch):
+    import sqlite3
+    from contextlib import closing
+    import evaluation
+    from eval_queue import run_worker
+
+    scored = []
+    monkeypatch.setattr(evaluation, "evaluate_answer_cosine", lambda **kwargs: scored.append(kwargs["user_query"]))
+    queue = EvaluationQueue(str(tmp_path / "eval_queue.db"))
+    queue.enqueue("q", reviews(), "answer")
+    job_id, _ = queue.claim()
+    with closing(sqlite3.connect(queue.path)) as conn, conn:
+        conn.execute("UPDATE jobs SET started_at = 0 WHERE id = ?", (job_id,))
+
+    run_worker(None, queue_path=queue.path, store_path=str(tmp_path / "evaluation_logs.db"), stop_when_empty=True)
+    assert scored == ["q"]
+    assert queue.metrics()["done"] == 1
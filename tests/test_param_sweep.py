@@ -0,0 +1,82 @@
+import pandas as pd
+import pytest
+import evaluation
+from evaluation import LLM_METRICS
+from param_sweep import SweepStore, run_sweep
+
+GRID = {"temperature": [0.3, 0.7]}
+
+
+class Batch:
+    def __init__(self, frames):
+        self.frames = frames
+
+    def to_frames(self):
+        return self.frames
+
+
+class Retriever:
+    def get_top_k_reviews_batch(self, queries, product=None):
+        return Batch([pd.DataFrame({"combined_context": [f"review for {query}"]}) for query in queries])
+
+
+class Sentiment:
+    def analyze_reviews(self, top_reviews):
+        return top_reviews.assign(sentiment="positive")
+
+
+class Summary:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_summary(self, user_query, reviews, **params):
+        self.calls += 1
+        return f"answer to {user_query} at {params['temperature']}"
+
+
+class Judge:
+    """Stands in for evaluate_answer_cosine; the first `failures` calls come back like a failed judge."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self, api_key, user_query, retrieved_reviews, generated_answer, **kwargs):
+        self.calls += 1
+        score = None if self.calls <= self.failures else "4"
+        return {"question": user_query, "generated_answer": generated_answer, "rouge1": 0.5,
+                **{metric: score for metric in LLM_METRICS}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SweepStore(str(tmp_path / "sweep_results.db"))
+
+
+def sweep(store, summary, judge, monkeypatch, run_id=None):
+    monkeypatch.setattr(evaluation, "evaluate_answer_cosine", judge)
+    return run_sweep(None, Retriever(), Sentiment(), summary, ["q1", "q2"], GRID, run_id=run_id,
+                     max_workers=2, store=store)
+
+
+def test_resume_rescores_cells_after_a_judge_failure(store, monkeypatch):
+    summary = Summary()
+    run_id, results = sweep(store, summary, Judge(failures=2), monkeypatch)
+    assert len(results) == 4
+    assert results["accuracy"].isna().sum() == 2
+
+    judge = Judge()
+    _, results = sweep(store, summary, judge, monkeypatch, run_id=run_id)
+    # Only the two failed cells are judged again, and their answers are reused
+    assert judge.calls == 2
+    assert summary.calls == 4
+    assert results["accuracy"].notna().all()
+
+
+def test_finished_run_is_not_judged_again(store, monkeypatch):
+    run_id, _ = sweep(store, Summary(), Judge(), monkeypatch)
+
+    judge, summary = Judge(), Summary()
+    _, results = sweep(store, summary, judge, monkeypatch, run_id=run_id)
+    assert judge.calls == summary.calls == 0
+    assert len(results) == 4
@@ -0,0 +1,90 @@
+import pandas as pd
+import pytest
+from fake_openai import DEFAULT_ANSWER, FakeOpenAI
+from pipeline import ReviewPipeline
+from sentiment import UNLABELLED
+from summary import SummaryAgent
+
+
+@pytest.fixture
+def reviews():
+    return pd.DataFrame({
+        "product_title": ["Mint Shampoo", "Mint Shampoo"],
+        "combined_context": ["Cleared my dandruff in a week.", "Left my scalp dry."],
+        "sentiment": ["positive", "negative"],
+    })
+
+
+def test_stream_yields_the_whole_answer(reviews):
+    agent = SummaryAgent(api_key=None, client=FakeOpenAI())
+    tokens = list(agent.generate_summary_stream("does it help with dandruff", reviews))
+
+    assert len(tokens) > 1
+    assert "".join(tokens) == DEFAULT_ANSWER
+    assert "".join(tokens) == agent.generate_summary("does it help with dandruff", reviews)
+
+
+def test_stream_fills_the_callers_stats(reviews):
+    agent = SummaryAgent(api_key=None, client=FakeOpenAI(latency=0.02, token_latency=0.001))
+    stats = {}
+    answer = "".join(agent.generate_summary_stream("does it help with dandruff", reviews, stats=stats))
+
+    assert stats["completion_tokens"] == len(answer.split(" "))
+    assert stats["time_to_first_token"] >= 0.02
+    assert stats["total_seconds"] >= stats["time_to_first_token"]
+    assert stats["tokens_per_second"] > 0
+    assert not hasattr(agent, "last_stream_stats")
+
+
+def test_concurrent_streams_keep_their_own_stats(reviews):
+    agent = SummaryAgent(api_key=None, client=FakeOpenAI(reply=lambda messages: "one two three"))
+    first, second = {}, {}
+    first_stream = agent.generate_summary_stream("q1", reviews, stats=first)
+    second_stream = agent.generate_summary_stream("q2", reviews, stats=second, max_tokens=2)
+
+    next(first_stream)
+    assert list(second_stream) == ["one", " two"]
+    assert list(first_stream) == [" two", " three"]
+    assert first["completion_tokens"] == 3
+    assert second["completion_tokens"] == 2
+
+
+def test_stream_passes_generation_params(reviews):
+    agent = SummaryAgent(api_key=None, client=FakeOpenAI())
+    tokens = list(agent.generate_summary_stream("q", reviews, max_tokens=3))
+    assert len(tokens) == 3
+
+
+def test_unlabelled_reviews_are_flagged_in_the_prompt(reviews):
+    prompts = []
+
+    def reply(messages):
+        prompts.append(messages[-1]["content"])
+        return "ok"
+
+    agent = SummaryAgent(api_key=None, client=FakeOpenAI(reply=reply))
+    list(agent.generate_summary_stream("q", reviews.assign(sentiment=UNLABELLED)))
+    assert "have not been analyzed yet" in prompts[-1]
+
+    list(agent.generate_summary_stream("q", reviews))
+    assert "have not been analyzed yet" not in prompts[-1]
+
+
+def test_pipeline_reports_stream_stats(reviews):
+    class Retriever:
+        def get_top_k_reviews(self, user_query, **kwargs):
+            return reviews
+
+    class Sentiment:
+        def analyze_reviews(self, top_reviews):
+            return top_reviews
+
+    pipeline = ReviewPipeline(Retriever(), Sentiment(), SummaryAgent(api_key=None, client=FakeOpenAI()))
+    run = pipeline.start("does it help with dandruff")
+    answer = "".join(run.stream_answer())
+    timings = run.finish()
+
+    assert answer == DEFAULT_ANSWER
+    assert timings["completion_tokens"] == len(DEFAULT_ANSWER.split(" "))
+    assert timings["tokens_per_second"] > 0
+    assert timings["time_to_first_token"] <= timings["total"]
@@ -0,0 +1,172 @@
+"""ROUGE and METEOR for the evaluator, built once and cached.
+
+The scorer and the Porter stemmer are created on first use and reused; stems are memoized,
+and tokenized references are cached because one set of retrieved reviews is usually scored
+against several answers. score_batch scores many (reference, candidate) pairs with numpy n-gram
+counting and a row-vectorized LCS, giving the same numbers as rouge_score. The wordnet corpus
+METEOR needs is looked up once on disk (never downloaded at import or app start); without it
+METEOR is None. Install it with: python -m nltk.downloader wordnet omw-1.4
+"""
+import threading
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import nltk
+from nltk.stem.porter import PorterStemmer
+from rouge_score import rouge_scorer, tokenize
+
+ROUGE_TYPES = ["rouge1", "rouge2", "rougeL"]
+
+_lock = threading.Lock()
+_state = {"wordnet": None, "scorer": None}
+
+
+class CachedStemmer:
+    """Porter stemmer with memoized results; usable wherever nltk or rouge_score expect .stem()."""
+
+    def __init__(self, maxsize=200000):
+        self._stemmer = PorterStemmer()
+        self.stem = lru_cache(maxsize=maxsize)(self._stemmer.stem)
+
+
+STEMMER = CachedStemmer()
+
+
+class CachedTokenizer:
+    """rouge_score's default tokenization (lowercase, alphanumeric, stemmed) with a cache per text."""
+
+    def __init__(self, maxsize=1024):
+        self.tokenize = lru_cache(maxsize=maxsize)(self._tokenize)
+
+    @staticmethod
+    def _tokenize(text):
+        return tuple(tokenize.tokenize(text, STEMMER))
+
+
+TOKENIZER = CachedTokenizer()
+
+
+def wordnet_available():
+    """Return whether the wordnet data is installed; checked once per process."""
+    with _lock:
+        if _state["wordnet"] is None:
+            _state["wordnet"] = _find_wordnet()
+            if not _state["wordnet"]:
+                print("nltk wordnet data not found, METEOR scores will be empty. "
+                      "Install it with: python -m nltk.downloader wordnet omw-1.4")
+        return _state["wordnet"]
+
+
+def _find_wordnet():
+    try:
+        nltk.data.find("corpora/wordnet")
+        return True
+    except LookupError:
+        try:
+            nltk.data.find("corpora/wordnet.zip")
+            return True
+        except LookupError:
+            return False
+
+
+def get_rouge_scorer():
+    """Return the shared RougeScorer (it holds no per-call state, so threads can share it)."""
+    with _lock:
+        if _state["scorer"] is None:
+            _state["scorer"] = rouge_scorer.RougeScorer(ROUGE_TYPES, tokenizer=TOKENIZER)
+        return _state["scorer"]
+
+
+def compute_rouge(reference, candidate):
+    return get_rouge_scorer().score(reference, candidate)
+
+
+def compute_meteor(reference, candidate):
+    """METEOR over whitespace tokens, or None without the wordnet corpus."""
+    if not wordnet_available():
+        return None
+    from nltk.translate.meteor_score import meteor_score
+    return meteor_score([reference.split()], candidate.split(), stemmer=STEMMER)
+
+
+def _fmeasure(overlap, reference_count, candidate_count):
+    precision = overlap / max(candidate_count, 1)
+    recall = overlap / max(reference_count, 1)
+    return 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+
+
+def _ngram_overlap(reference_ids, candidate_ids, n, vocabulary_size):
+    """Clipped n-gram matches between two token id arrays, plus both n-gram counts."""
+    if len(reference_ids) < n or len(candidate_ids) < n:
+        return 0, max(len(reference_ids) - n + 1, 0), max(len(candidate_ids) - n + 1, 0)
+
+    def encode(ids):
+        codes = ids[:len(ids) - n + 1].astype("int64")
+        for offset in range(1, n):
+            codes = codes * vocabulary_size + ids[offset:len(ids) - n + 1 + offset]
+        return np.unique(codes, return_counts=True)
+
+    reference_codes, reference_counts = encode(reference_ids)
+    candidate_codes, candidate_counts = encode(candidate_ids)
+    _, reference_at, candidate_at = np.intersect1d(reference_codes, candidate_codes, return_indices=True)
+    overlap = np.minimum(reference_counts[reference_at], candidate_counts[candidate_at]).sum()
+    return int(overlap), len(reference_ids) - n + 1, len(candidate_ids) - n + 1
+
+
+def _lcs_length(a, b):
+    """LCS length with one numpy pass per token of the shorter sequence.
+
+    Row update: cur[j] = max(prev[j], prev[j-1] + 1 if a_i == b_j) followed by a running max,
+    which equals the textbook recurrence because each row can grow by at most one per step.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a):
+        return 0
+    previous = np.zeros(len(b) + 1, dtype="int32")
+    for token in a:
+        current = previous.copy()
+        matches = np.flatnonzero(b == token) + 1
+        current[matches] = previous[matches - 1] + 1
+        previous = np.maximum.accumulate(np.maximum(current, previous))
+    return int(previous[-1])
+
+
+def score_batch(references, candidates, meteor=True):
+    """Score each (reference, candidate) pair; returns a DataFrame with rouge1, rouge2, rougeL and meteor."""
+    vocabulary = {}
+
+    def ids(text):
+        return np.asarray([vocabulary.setdefault(token, len(vocabulary)) for token in TOKENIZER.tokenize(text)],
+                          dtype="int64")
+
+    # Each distinct reference is tokenized once, however many candidates it is paired with
+    reference_ids = {reference: ids(reference) for reference in dict.fromkeys(references)}
+    candidate_ids = [ids(candidate) for candidate in candidates]
+    vocabulary_size = max(len(vocabulary), 1)
+
+    rows = []
+    for reference, candidate, cand in zip(references, candidates, candidate_ids):
+        ref = reference_ids[reference]
+        row = {}
+        for n, name in ((1, "rouge1"), (2, "rouge2")):
+            row[name] = _fmeasure(*_ngram_overlap(ref, cand, n, vocabulary_size))
+        row["rougeL"] = _fmeasure(_lcs_length(ref, cand), len(ref), len(cand)) if len(ref) and len(cand) else 0.0
+        row["meteor"] = compute_meteor(reference, candidate) if meteor else None
+        rows.append(row)
+    return pd.DataFrame(rows, columns=ROUGE_TYPES + ["meteor"])
+
+
+def pooled_cosine(review_vectors, candidate_vectors):
+    """Cosine between the mean of each set of review vectors and the matching candidate vector.
+
+    review_vectors is one (k, d) array per pair (or a single array shared by all pairs);
+    candidate_vectors is (n, d).
+    """
+    candidates = np.asarray(candidate_vectors, dtype="float32").reshape(-1, np.shape(candidate_vectors)[-1])
+    if isinstance(review_vectors, np.ndarray):
+        review_vectors = [review_vectors] * len(candidates)
+    pooled = np.vstack([np.asarray(vectors, dtype="float32").mean(axis=0) for vectors in review_vectors])
+    pooled /= np.linalg.norm(pooled, axis=1, keepdims=True)
+    candidates = candidates / np.linalg.norm(candidates, axis=1, keepdims=True)
+    return (pooled * candidates).sum(axis=1)
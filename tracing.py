@@ -0,0 +1,263 @@
+"""Lightweight tracing for the request path: retrieval, sentiment, summary and evaluation.
+
+Each stage is wrapped in a span that records wall time plus attributes such as OpenAI token
+usage, cache hits and rows retrieved. Finished spans are aggregated in memory for a Prometheus
+text endpoint and handed to a background thread that appends them to traces.jsonl, so callers
+(including the client pool's event loop) never wait on disk. The file is rotated to
+traces.jsonl.1, .2, ... once it reaches TRACE_MAX_MB; TRACE_PATH="" turns it off.
+
+Usage:
+    python tracing.py report traces.jsonl
+"""
+import argparse
+import atexit
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+TRACE_PATH = os.getenv("TRACE_PATH", "traces.jsonl")
+TRACE_MAX_BYTES = int(float(os.getenv("TRACE_MAX_MB", "50")) * 1024 * 1024)
+TRACE_BACKUPS = 3
+
+# Upper bounds (ms) of the Prometheus latency histogram buckets
+BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_lock = threading.Lock()
+_histograms = defaultdict(lambda: {"buckets": [0] * len(BUCKETS_MS), "count": 0, "sum": 0.0})
+_counters = defaultdict(float)
+
+# Spans waiting to be written; when the writer falls behind, new spans are dropped (and counted)
+_pending = queue.Queue(maxsize=10000)
+_writer = None
+_writer_pid = None
+_STOP = object()
+
+
+class Span:
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = dict(attrs)
+        self.start = time.time()
+        self.duration_ms = None
+        self.error = None
+
+    def set(self, key, value):
+        self.attrs[key] = value
+
+    def record_usage(self, response):
+        """Add the token usage of an OpenAI response (chat or embeddings) to this span."""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            value = getattr(usage, key, None)
+            if value is not None:
+                self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+def _export(span):
+    """Add a finished span to the in-memory metrics and queue it for the JSONL file."""
+    with _lock:
+        histogram = _histograms[span.name]
+        for i, bound in enumerate(BUCKETS_MS):
+            if span.duration_ms <= bound:
+                histogram["buckets"][i] += 1
+        histogram["count"] += 1
+        histogram["sum"] += span.duration_ms
+
+        for key in ("prompt_tokens", "completion_tokens"):
+            if key in span.attrs:
+                _counters[(span.name, key)] += span.attrs[key]
+        if span.error:
+            _counters[(span.name, "errors")] += 1
+
+    if TRACE_PATH:
+        _start_writer()
+        try:
+            _pending.put_nowait(span.to_dict())
+        except queue.Full:
+            with _lock:
+                _counters[("tracing", "dropped")] += 1
+
+
+def _rotate(path):
+    for i in range(TRACE_BACKUPS - 1, 0, -1):
+        if os.path.exists(f"{path}.{i}"):
+            os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+    os.replace(path, f"{path}.1")
+
+
+def _write_spans(path):
+    """Append queued spans to path until _STOP, rotating the file when it gets too large."""
+    f = open(path, "a")
+    try:
+        while True:
+            item = _pending.get()
+            batch = [item]
+            # Drain whatever else is queued so a burst costs one write
+            while item is not _STOP and not _pending.empty():
+                item = _pending.get_nowait()
+                batch.append(item)
+            f.write("".join(json.dumps(entry, default=str) + "\n" for entry in batch if entry is not _STOP))
+            f.flush()
+            if batch[-1] is _STOP:
+                return
+            try:
+                # Another process may have rotated the file under us
+                replaced = os.stat(path).st_ino != os.fstat(f.fileno()).st_ino
+            except FileNotFoundError:
+                replaced = True
+            if replaced or f.tell() >= TRACE_MAX_BYTES:
+                f.close()
+                if not replaced:
+                    _rotate(path)
+                f = open(path, "a")
+    finally:
+        f.close()
+
+
+def _start_writer():
+    """Start the writer thread once per process (a forked worker needs its own)."""
+    global _writer, _writer_pid
+    if _writer_pid == os.getpid():
+        return
+    with _lock:
+        if _writer_pid != os.getpid():
+            _writer = threading.Thread(target=_write_spans, args=(TRACE_PATH,), daemon=True, name="trace-writer")
+            _writer.start()
+            _writer_pid = os.getpid()
+
+
+def flush(timeout=5.0):
+    """Write out the queued spans and stop the writer; runs at exit."""
+    global _writer_pid
+    if _writer is not None and _writer_pid == os.getpid() and _writer.is_alive():
+        _pending.put(_STOP)
+        _writer.join(timeout)
+        _writer_pid = None
+
+
+atexit.register(flush)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a block as a span nested under the current one; yields the Span for attributes."""
+    current = Span(name, parent=_current_span.get(), **attrs)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.error = repr(e)
+        raise
+    finally:
+        current.duration_ms = (time.perf_counter() - start) * 1000
+        _current_span.reset(token)
+        _export(current)
+
+
+def record(name, duration_ms, **attrs):
+    """Export an already-measured span, e.g. one that covers the life of a generator."""
+    finished = Span(name, parent=_current_span.get(), **attrs)
+    finished.duration_ms = duration_ms
+    _export(finished)
+
+
+def prometheus_text():
+    """Render the aggregated spans in the Prometheus text exposition format."""
+    lines = [
+        "# HELP stage_duration_ms Wall time of traced stages in milliseconds.",
+        "# TYPE stage_duration_ms histogram",
+    ]
+    with _lock:
+        for name, histogram in sorted(_histograms.items()):
+            for bound, count in zip(BUCKETS_MS, histogram["buckets"]):
+                lines.append(f'stage_duration_ms_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'stage_duration_ms_bucket{{stage="{name}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'stage_duration_ms_sum{{stage="{name}"}} {histogram["sum"]:.3f}')
+            lines.append(f'stage_duration_ms_count{{stage="{name}"}} {histogram["count"]}')
+
+        lines.append("# TYPE stage_events_total counter")
+        for (name, key), value in sorted(_counters.items()):
+            lines.append(f'stage_events_total{{stage="{name}",kind="{key}"}} {value:g}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port=9464):
+    """Serve /metrics from a daemon thread; returns None if the port is already taken."""
+    try:
+        server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+    except OSError:
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def report(path=TRACE_PATH):
+    """Print count and p50/p95/p99 wall time per stage from a JSONL trace file."""
+    durations = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            durations[entry["name"]].append(entry["duration_ms"])
+
+    print(f"{'stage':<28}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, values in sorted(durations.items()):
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        print(f"{name:<28}{len(values):>8}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency report from traced spans.")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("path", nargs="?", default=TRACE_PATH)
+    args = parser.parse_args()
+    report(args.path)
+
+
+if __name__ == "__main__":
+    main()